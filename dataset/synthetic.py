@@ -0,0 +1,448 @@
+"""
+Seeded, production-scale synthetic dataset.
+
+generate_dataset() writes a directory of columnar .npy arrays plus a small
+meta.json; SyntheticDataset opens it lazily with memory-mapped reads, so a
+100k-courier / multi-million-order dataset costs nothing at import time and
+only the pages actually touched are read from disk.
+
+Records are handed out in the same shape as MOCK_DATABASE / ORDER_ITEMS_DATA.
+Ids are positional: courier_0000042 is row 42 of the courier columns.
+"""
+import json
+import os
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+# ---- Fixed vocabularies (codes are the array values) ----
+CITIES: Dict[str, tuple] = {
+    "New York": (40.7128, -74.0060),
+    "Los Angeles": (34.0522, -118.2437),
+    "Chicago": (41.8781, -87.6298),
+    "Houston": (29.7604, -95.3698),
+    "Phoenix": (33.4484, -112.0740),
+    "Philadelphia": (39.9526, -75.1652),
+    "San Antonio": (29.4241, -98.4936),
+    "San Diego": (32.7157, -117.1611),
+    "Dallas": (32.7767, -96.7970),
+    "Singapore": (1.3521, 103.8198),
+    "Jakarta": (-6.2088, 106.8456),
+    "Bangkok": (13.7563, 100.5018),
+}
+# name, vol_cap_l, weight_cap_kg, P(insulated_container)
+VEHICLES = (
+    ("bike", 30.0, 15.0, 0.30),
+    ("scooter", 60.0, 30.0, 0.40),
+    ("car", 250.0, 100.0, 0.60),
+    ("van", 500.0, 200.0, 0.50),
+)
+VEHICLE_MIX = (0.25, 0.40, 0.25, 0.10)
+COURIER_STATUSES = ("available", "busy", "stuck", "offline")
+COURIER_STATUS_MIX = (0.70, 0.25, 0.02, 0.03)
+MERCHANT_HEALTH = ("HEALTHY", "SOFT_BLACKOUT", "OFFLINE")
+MERCHANT_HEALTH_MIX = (0.92, 0.05, 0.03)
+ITEM_TYPES = ("standard", "perishable", "fragile", "bulky")
+TX_STATUSES = ("confirmed", "authorized", "refunded")
+WEATHER_ALERTS = (
+    ("none", False),
+    ("light_rain", False),
+    ("severe_rain_warning", True),
+    ("snowstorm_warning", True),
+    ("heat_advisory", False),
+)
+WEATHER_MIX = (0.55, 0.20, 0.12, 0.05, 0.08)
+
+CITY_SPREAD_DEG = 0.15  # ~15 km around each city centre
+
+FORMAT_VERSION = 1
+
+
+def _save(out_dir: str, name: str, arr: np.ndarray) -> None:
+    np.save(os.path.join(out_dir, f"{name}.npy"), arr, allow_pickle=False)
+
+
+def _csr_offsets(counts: np.ndarray) -> np.ndarray:
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return offsets
+
+
+def generate_dataset(out_dir: str,
+                     n_couriers: int = 100_000,
+                     n_merchants: int = 50_000,
+                     n_orders: int = 1_000_000,
+                     n_skus: int = 5_000,
+                     n_customers: Optional[int] = None,
+                     max_items_per_order: int = 12,
+                     double_charge_rate: float = 0.02,
+                     seed: int = 0,
+                     chunk_orders: int = 100_000) -> Dict[str, Any]:
+    """
+    Generate a seeded dataset into out_dir and return its metadata.
+    Orders are drawn and written chunk_orders at a time into preallocated
+    memmapped columns, so memory stays O(chunk_orders) plus a few bytes per
+    order for the CSR offsets.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    city_names = list(CITIES)
+    centres = np.array([CITIES[c] for c in city_names], dtype=np.float64)
+    n_customers = n_customers or max(1, n_orders // 4)
+
+    # ---- SKU catalog ----
+    sku_type = rng.choice(len(ITEM_TYPES), size=n_skus, p=(0.70, 0.15, 0.10, 0.05)).astype(np.uint8)
+    sku_vol = np.where(sku_type == 3, rng.uniform(10, 40, n_skus), rng.uniform(0.2, 4.0, n_skus)).astype(np.float32)
+    sku_weight = (sku_vol * rng.uniform(0.2, 1.1, n_skus)).astype(np.float32)
+    sku_price = np.round(rng.uniform(1.0, 60.0, n_skus), 2).astype(np.float32)
+    _save(out_dir, "sku_type", sku_type)
+    _save(out_dir, "sku_vol_l", sku_vol)
+    _save(out_dir, "sku_weight_kg", sku_weight)
+    _save(out_dir, "sku_price", sku_price)
+
+    # ---- Couriers ----
+    c_city = rng.integers(0, len(city_names), n_couriers, dtype=np.uint16)
+    c_loc = centres[c_city] + rng.normal(0, CITY_SPREAD_DEG / 2, (n_couriers, 2))
+    c_vehicle = rng.choice(len(VEHICLES), size=n_couriers, p=VEHICLE_MIX).astype(np.uint8)
+    insulated_p = np.array([v[3] for v in VEHICLES])[c_vehicle]
+    _save(out_dir, "courier_city", c_city)
+    _save(out_dir, "courier_lat", c_loc[:, 0].astype(np.float32))
+    _save(out_dir, "courier_lng", c_loc[:, 1].astype(np.float32))
+    _save(out_dir, "courier_vehicle", c_vehicle)
+    _save(out_dir, "courier_insulated", rng.random(n_couriers) < insulated_p)
+    _save(out_dir, "courier_reputation", np.clip(rng.beta(8, 2, n_couriers), 0, 1).astype(np.float32))
+    _save(out_dir, "courier_status", rng.choice(len(COURIER_STATUSES), size=n_couriers, p=COURIER_STATUS_MIX).astype(np.uint8))
+
+    # ---- Merchants ----
+    m_city = rng.integers(0, len(city_names), n_merchants, dtype=np.uint16)
+    m_loc = centres[m_city] + rng.normal(0, CITY_SPREAD_DEG / 2, (n_merchants, 2))
+    m_health = rng.choice(len(MERCHANT_HEALTH), size=n_merchants, p=MERCHANT_HEALTH_MIX).astype(np.uint8)
+    m_prep = np.where(m_health == 2, 0, rng.integers(5, 45, n_merchants)).astype(np.uint16)
+    oos_counts = np.where(rng.random(n_merchants) < 0.10, rng.integers(1, 4, n_merchants), 0)
+    _save(out_dir, "merchant_city", m_city)
+    _save(out_dir, "merchant_lat", m_loc[:, 0].astype(np.float32))
+    _save(out_dir, "merchant_lng", m_loc[:, 1].astype(np.float32))
+    _save(out_dir, "merchant_health", m_health)
+    _save(out_dir, "merchant_prep_eta_min", m_prep)
+    _save(out_dir, "merchant_oos_offsets", _csr_offsets(oos_counts))
+    _save(out_dir, "merchant_oos_sku", rng.integers(0, n_skus, int(oos_counts.sum()), dtype=np.int32))
+
+    # ---- Orders, items and payment transactions (CSR layout, chunked) ----
+    # Item and transaction counts are drawn for every order up front (a few
+    # bytes per order), which sizes each column; the columns are then
+    # preallocated as .npy memmaps and filled chunk_orders at a time, so
+    # only one chunk's draws are ever held in memory. Each chunk covers its
+    # own slice of the 30 days, keeping order_created_ts sorted.
+    base_ts, span_s = 1_750_000_000, 86_400 * 30
+    item_counts = rng.integers(1, max_items_per_order + 1, n_orders)
+    n_tx = 1 + (rng.random(n_orders) < double_charge_rate).astype(np.int64)
+    item_offsets, tx_offsets = _csr_offsets(item_counts), _csr_offsets(n_tx)
+    _save(out_dir, "order_item_offsets", item_offsets)
+    _save(out_dir, "order_tx_offsets", tx_offsets)
+    cols = {
+        name: open_memmap(os.path.join(out_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(size,))
+        for name, dtype, size in (
+            ("order_merchant", np.int32, n_orders), ("order_customer", np.int32, n_orders),
+            ("order_drop_lat", np.float32, n_orders), ("order_drop_lng", np.float32, n_orders),
+            ("order_created_ts", np.int64, n_orders),
+            ("item_sku", np.int32, int(item_offsets[-1])), ("item_qty", np.uint8, int(item_offsets[-1])),
+            ("tx_amount", np.float32, int(tx_offsets[-1])), ("tx_status", np.uint8, int(tx_offsets[-1])),
+            ("tx_ts", np.int64, int(tx_offsets[-1])),
+        )
+    }
+    for start in range(0, n_orders, chunk_orders):
+        end = min(n_orders, start + chunk_orders)
+        n = end - start
+        i0, i1 = int(item_offsets[start]), int(item_offsets[end])
+        t0, t1 = int(tx_offsets[start]), int(tx_offsets[end])
+        merchant = rng.integers(0, n_merchants, n, dtype=np.int32)
+        drop = centres[m_city[merchant]] + rng.normal(0, CITY_SPREAD_DEG / 2, (n, 2))
+        lo_s, hi_s = span_s * start // n_orders, span_s * end // n_orders
+        ts = base_ts + lo_s + np.sort(rng.integers(0, max(1, hi_s - lo_s), n)).astype(np.int64)
+        skus = rng.integers(0, n_skus, i1 - i0, dtype=np.int32)
+        qty = rng.choice((1, 1, 1, 2, 3), size=len(skus)).astype(np.uint8)
+
+        # order total = sum(price * qty) per order
+        line_total = sku_price[skus] * qty
+        totals = np.add.reduceat(line_total, item_offsets[start:end] - i0).astype(np.float32)
+        chunk_tx = n_tx[start:end]
+
+        cols["order_merchant"][start:end] = merchant
+        cols["order_customer"][start:end] = rng.integers(0, n_customers, n, dtype=np.int32)
+        cols["order_drop_lat"][start:end] = drop[:, 0]
+        cols["order_drop_lng"][start:end] = drop[:, 1]
+        cols["order_created_ts"][start:end] = ts
+        cols["item_sku"][i0:i1] = skus
+        cols["item_qty"][i0:i1] = qty
+        cols["tx_amount"][t0:t1] = np.repeat(totals, chunk_tx)
+        cols["tx_status"][t0:t1] = _tx_statuses(chunk_tx)
+        cols["tx_ts"][t0:t1] = np.repeat(ts, chunk_tx) + _tx_delays(rng, chunk_tx)
+    for col in cols.values():
+        col.flush()
+    del cols
+
+    # ---- Weather per city (tiny, JSON) ----
+    alert_idx = rng.choice(len(WEATHER_ALERTS), size=len(city_names), p=WEATHER_MIX)
+    weather = {
+        city: {"alert": WEATHER_ALERTS[a][0], "reroute_required": WEATHER_ALERTS[a][1]}
+        for city, a in zip(city_names, alert_idx)
+    }
+
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "seed": seed,
+        "n_couriers": n_couriers,
+        "n_merchants": n_merchants,
+        "n_orders": n_orders,
+        "n_skus": n_skus,
+        "n_customers": n_customers,
+        "cities": city_names,
+        "weather": weather,
+    }
+    with open(os.path.join(out_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+def _tx_statuses(n_tx: np.ndarray) -> np.ndarray:
+    # first transaction of an order is confirmed, any duplicate is a second authorization
+    first = _csr_offsets(n_tx)[:-1]
+    statuses = np.ones(int(n_tx.sum()), dtype=np.uint8)
+    statuses[first] = 0
+    return statuses
+
+
+def _tx_delays(rng: np.random.Generator, n_tx: np.ndarray) -> np.ndarray:
+    # duplicates land a few seconds after the original charge
+    delays = rng.integers(1, 90, int(n_tx.sum())).astype(np.int64)
+    delays[_csr_offsets(n_tx)[:-1]] = 0
+    return delays
+
+
+def _index(prefix: str, key: Optional[str], n: int) -> Optional[int]:
+    if not key or not key.startswith(prefix):
+        return None
+    try:
+        i = int(key[len(prefix):])
+    except ValueError:
+        return None
+    return i if 0 <= i < n else None
+
+
+class SyntheticDataset:
+    """
+    Lazily memory-mapped view over a generate_dataset() directory.
+    Columns are opened on first access and never fully loaded.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        if self.meta.get("format_version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported synthetic dataset format: {self.meta.get('format_version')}")
+        self.cities: List[str] = self.meta["cities"]
+        self.n_couriers: int = self.meta["n_couriers"]
+        self.n_merchants: int = self.meta["n_merchants"]
+        self.n_orders: int = self.meta["n_orders"]
+        self._cols: Dict[str, np.ndarray] = {}
+
+    def col(self, name: str) -> np.ndarray:
+        arr = self._cols.get(name)
+        if arr is None:
+            arr = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            self._cols[name] = arr
+        return arr
+
+    # ---- ids ----
+    @staticmethod
+    def courier_id(i: int) -> str:
+        return f"courier_{i:07d}"
+
+    @staticmethod
+    def merchant_id(i: int) -> str:
+        return f"M{i:06d}"
+
+    @staticmethod
+    def order_id(i: int) -> str:
+        return f"order_{i:08d}"
+
+    @staticmethod
+    def sku_id(i: int) -> str:
+        return f"SKU-{i:05d}"
+
+    def courier_index(self, courier_id: Optional[str]) -> Optional[int]:
+        return _index("courier_", courier_id, self.n_couriers)
+
+    def merchant_index(self, merchant_id: Optional[str]) -> Optional[int]:
+        return _index("M", merchant_id, self.n_merchants)
+
+    def order_index(self, order_id: Optional[str]) -> Optional[int]:
+        return _index("order_", order_id, self.n_orders)
+
+    # ---- records (MOCK_DATABASE shapes) ----
+    def courier(self, courier_id: Optional[str]) -> Dict[str, Any]:
+        i = self.courier_index(courier_id)
+        if i is None:
+            return {}
+        vtype, vol, weight, _ = VEHICLES[int(self.col("courier_vehicle")[i])]
+        return {
+            "reputation_score": round(float(self.col("courier_reputation")[i]), 4),
+            "vehicle_capacity": {"type": vtype, "vol_cap_l": vol, "weight_cap_kg": weight},
+            "special_equipment": {"insulated_container": bool(self.col("courier_insulated")[i])},
+            "status": COURIER_STATUSES[int(self.col("courier_status")[i])],
+            "location": (float(self.col("courier_lat")[i]), float(self.col("courier_lng")[i])),
+            "city": self.cities[int(self.col("courier_city")[i])],
+        }
+
+    def iter_couriers(self):
+        """(courier_id, record) for the whole fleet, decoded column-wise."""
+        vehicle = self.col("courier_vehicle").tolist()
+        insulated = self.col("courier_insulated").tolist()
+        reputation = self.col("courier_reputation").tolist()
+        status = self.col("courier_status").tolist()
+        lat, lng = self.col("courier_lat").tolist(), self.col("courier_lng").tolist()
+        city = self.col("courier_city").tolist()
+        for i in range(self.n_couriers):
+            vtype, vol, weight, _ = VEHICLES[vehicle[i]]
+            yield self.courier_id(i), {
+                "reputation_score": round(reputation[i], 4),
+                "vehicle_capacity": {"type": vtype, "vol_cap_l": vol, "weight_cap_kg": weight},
+                "special_equipment": {"insulated_container": insulated[i]},
+                "status": COURIER_STATUSES[status[i]],
+                "location": (lat[i], lng[i]),
+                "city": self.cities[city[i]],
+            }
+
+    def iter_transactions(self, chunk: int = 100_000):
+        """
+        Settlement rows for every payment transaction, in timestamp order.
+        The order comes from one argsort over tx_ts, so an int64 index per
+        transaction is held in memory for the whole iteration; the rows
+        themselves are decoded `chunk` at a time.
+        """
+        offsets = self.col("order_tx_offsets")
+        tx_order = np.repeat(np.arange(self.n_orders, dtype=np.int64), np.diff(offsets))
+        order = np.argsort(self.col("tx_ts"), kind="stable")
+        for lo in range(0, order.size, chunk):
+            idx = order[lo:lo + chunk]
+            orders = tx_order[idx]
+            rows = zip(idx.tolist(), orders.tolist(),
+                       self.col("order_customer")[orders].tolist(), self.col("order_merchant")[orders].tolist(),
+                       self.col("tx_amount")[idx].tolist(), self.col("tx_ts")[idx].tolist(),
+                       self.col("tx_status")[idx].tolist())
+            for tx, o, customer, merchant, amount, ts, status in rows:
+                yield {
+                    "tx_id": f"tx_{tx}",
+                    "order_id": self.order_id(o),
+                    "customer_id": f"cust_{customer}",
+                    "merchant_id": self.merchant_id(merchant),
+                    "amount": round(amount, 2),
+                    "ts": ts,
+                    "status": TX_STATUSES[status],
+                }
+
+    def merchant(self, merchant_id: Optional[str]) -> Dict[str, Any]:
+        i = self.merchant_index(merchant_id)
+        if i is None:
+            return {}
+        lo, hi = self.col("merchant_oos_offsets")[i:i + 2]
+        return {
+            "health": MERCHANT_HEALTH[int(self.col("merchant_health")[i])],
+            "prep_eta_min": int(self.col("merchant_prep_eta_min")[i]),
+            "oos_items": [self.sku_id(int(s)) for s in self.col("merchant_oos_sku")[lo:hi]],
+            "location": (float(self.col("merchant_lat")[i]), float(self.col("merchant_lng")[i])),
+            "city": self.cities[int(self.col("merchant_city")[i])],
+        }
+
+    def weather(self, city: Optional[str]) -> Dict[str, Any]:
+        return dict(self.meta["weather"].get(city, {}))
+
+    def order_items(self, order_id: Optional[str]) -> List[Dict[str, Any]]:
+        i = self.order_index(order_id)
+        if i is None:
+            return []
+        lo, hi = self.col("order_item_offsets")[i:i + 2]
+        skus = self.col("item_sku")[lo:hi]
+        qtys = self.col("item_qty")[lo:hi]
+        sku_type, sku_vol, sku_weight = self.col("sku_type"), self.col("sku_vol_l"), self.col("sku_weight_kg")
+        items = []
+        for s, q in zip(skus.tolist(), qtys.tolist()):
+            item_type = ITEM_TYPES[int(sku_type[s])]
+            item = {
+                "sku": self.sku_id(s),
+                "qty": q,
+                "vol_l": round(float(sku_vol[s]), 3),
+                "weight_kg": round(float(sku_weight[s]), 3),
+                "is_bulky": item_type == "bulky",
+            }
+            if item_type != "standard":
+                item["item_type"] = item_type
+            items.append(item)
+        return items
+
+    def payment(self, order_id: Optional[str]) -> Dict[str, Any]:
+        i = self.order_index(order_id)
+        if i is None:
+            return {}
+        lo, hi = self.col("order_tx_offsets")[i:i + 2]
+        amounts = self.col("tx_amount")[lo:hi]
+        return {
+            "customer_id": f"cust_{int(self.col('order_customer')[i])}",
+            "merchant_id": self.merchant_id(int(self.col("order_merchant")[i])),
+            "amount": round(float(amounts[0]), 2) if len(amounts) else 0.0,
+            "transactions": [
+                {
+                    "id": f"tx_{int(lo) + k}",
+                    "amount": round(float(amounts[k]), 2),
+                    "status": TX_STATUSES[int(self.col("tx_status")[lo + k])],
+                    "ts": int(self.col("tx_ts")[lo + k]),
+                }
+                for k in range(int(hi - lo))
+            ],
+        }
+
+    def order_details(self, order_id: str) -> Dict[str, Any]:
+        """An AgentState.order_details dict for one generated order."""
+        i = self.order_index(order_id)
+        if i is None:
+            raise KeyError(order_id)
+        m = int(self.col("order_merchant")[i])
+        merchant = self.merchant(self.merchant_id(m))
+        payment = self.payment(order_id)
+        city = merchant["city"]
+        return {
+            "order_id": order_id,
+            "merchant_id": self.merchant_id(m),
+            "items": self.order_items(order_id),
+            "payment": payment,
+            "order_total": payment["amount"],
+            "user_prefs": {"payment_priority": "wallet"},
+            "pickup_location": {"lat": merchant["location"][0], "lng": merchant["location"][1], "city": city},
+            "drop_location": {"lat": float(self.col("order_drop_lat")[i]), "lng": float(self.col("order_drop_lng")[i]), "city": city},
+            "readiness_eta_min": merchant["prep_eta_min"],
+            "priority_flag": False,
+            "sla_eta_min": 30,
+        }
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Generate a seeded synthetic dataset.")
+    parser.add_argument("out_dir")
+    parser.add_argument("--couriers", type=int, default=100_000)
+    parser.add_argument("--merchants", type=int, default=50_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--skus", type=int, default=5_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    meta = generate_dataset(args.out_dir, n_couriers=args.couriers, n_merchants=args.merchants,
+                            n_orders=args.orders, n_skus=args.skus, seed=args.seed)
+    size = sum(os.path.getsize(os.path.join(args.out_dir, f)) for f in os.listdir(args.out_dir))
+    print(f"wrote {meta['n_couriers']} couriers, {meta['n_merchants']} merchants, {meta['n_orders']} orders "
+          f"to {args.out_dir} ({size / 1e6:.1f} MB) in {time.perf_counter() - t:.1f}s")
@@ -0,0 +1,129 @@
+from __future__ import annotations
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+from pydantic import BaseModel
+
+from scripts import tools, async_tools
+from scripts.metrics import get_metrics
+from scripts.profiling import current_trace
+
+
+# =========================================================
+# 1) Direct-call agent registry
+#    The @tool objects stay the interface for LLM tool calling. The graph
+#    calls agents through here instead: the kwargs are validated once
+#    into the tool's args_schema and handed to the tool's undecorated
+#    body, skipping LangChain's input parsing, callbacks and the second
+#    XInput(**kwargs) inside the tool.
+#    - SYNAPSE_STRICT_AGENTS=1 -> route every call through tool.invoke /
+#      tool.ainvoke (the full LangChain path), e.g. to check a change
+#      against the public tool interface
+#    Every call is timed into synapse_agent_latency_seconds{agent=...};
+#    exceptions count into synapse_agent_errors_total.
+# =========================================================
+
+STRICT_AGENT_CALLS = os.getenv("SYNAPSE_STRICT_AGENTS", "").lower() in ("1", "true", "yes")
+
+
+class AgentEntry:
+    """One agent: its @tool objects plus the bodies they wrap."""
+    __slots__ = ("name", "tool", "input_model", "run", "atool", "arun", "labels")
+
+    def __init__(self, tool, run: Callable[[BaseModel], Dict[str, Any]],
+                 atool=None, arun: Optional[Callable[[BaseModel], Awaitable[Dict[str, Any]]]] = None):
+        self.name: str = tool.name
+        self.tool = tool
+        self.input_model: Type[BaseModel] = tool.args_schema
+        self.run = run
+        self.atool = atool
+        self.arun = arun
+        self.labels = (("agent", self.name),)
+
+    def call(self, kwargs: Dict[str, Any], strict: Optional[bool] = None) -> Dict[str, Any]:
+        t0 = time.perf_counter_ns()
+        t1 = 0
+        try:
+            if STRICT_AGENT_CALLS if strict is None else strict:
+                return self.tool.invoke(kwargs)
+            inputs = self.input_model.model_validate(kwargs)
+            t1 = time.perf_counter_ns()
+            return self.run(inputs)
+        except Exception:
+            get_metrics().inc("synapse_agent_errors_total", self.labels)
+            raise
+        finally:
+            self._record(t0, t1)
+
+    async def acall(self, kwargs: Dict[str, Any], strict: Optional[bool] = None) -> Dict[str, Any]:
+        """Async variant; agents without an async body run their sync one inline."""
+        t0 = time.perf_counter_ns()
+        t1 = 0
+        try:
+            if STRICT_AGENT_CALLS if strict is None else strict:
+                return await (self.atool or self.tool).ainvoke(kwargs)
+            inputs = self.input_model.model_validate(kwargs)
+            t1 = time.perf_counter_ns()
+            if self.arun is None:
+                return self.run(inputs)
+            return await self.arun(inputs)
+        except Exception:
+            get_metrics().inc("synapse_agent_errors_total", self.labels)
+            raise
+        finally:
+            self._record(t0, t1)
+
+    def _record(self, t0: int, t1: int) -> None:
+        """t1 = end of input validation, 0 when the call went through tool.invoke."""
+        t2 = time.perf_counter_ns()
+        get_metrics().observe("synapse_agent_latency_seconds", t2 - t0, self.labels)
+        trace = current_trace()
+        if trace is not None:
+            trace.agent(self.name, t0, t1, t2)
+
+
+AGENTS: Dict[str, AgentEntry] = {
+    entry.name: entry for entry in (
+        AgentEntry(tools.payment_agent, tools._payment_agent,
+                   async_tools.apayment_agent, async_tools._apayment_agent),
+        AgentEntry(tools.merchant_status_agent, tools._merchant_status_agent,
+                   async_tools.amerchant_status_agent, async_tools._amerchant_status_agent),
+        AgentEntry(tools.delivery_dispatch_agent, tools._delivery_dispatch_agent,
+                   async_tools.adelivery_dispatch_agent, async_tools._adelivery_dispatch_agent),
+        AgentEntry(tools.batch_dispatch_agent, tools._batch_dispatch_agent),
+        AgentEntry(tools.reputation_agent, tools._reputation_agent,
+                   async_tools.areputation_agent, async_tools._areputation_agent),
+        AgentEntry(tools.capacity_agent, tools._capacity_agent,
+                   async_tools.acapacity_agent, async_tools._acapacity_agent),
+        AgentEntry(tools.split_delivery_agent, tools._split_delivery_agent,
+                   async_tools.asplit_delivery_agent, async_tools._asplit_delivery_agent),
+        AgentEntry(tools.weather_agent, tools._weather_agent,
+                   async_tools.aweather_agent, async_tools._aweather_agent),
+        AgentEntry(tools.courier_breakdown_agent, tools._courier_breakdown_agent,
+                   async_tools.acourier_breakdown_agent, async_tools._acourier_breakdown_agent),
+        AgentEntry(tools.reroute_agent, tools._reroute_agent,
+                   async_tools.areroute_agent, async_tools._areroute_agent),
+        AgentEntry(tools.customer_change_agent, tools._customer_change_agent,
+                   async_tools.acustomer_change_agent, async_tools._acustomer_change_agent),
+        AgentEntry(tools.policy_guard, tools._policy_guard,
+                   async_tools.apolicy_guard, async_tools._apolicy_guard),
+        AgentEntry(tools.notify_agent, tools._notify_agent,
+                   async_tools.anotify_agent, async_tools._anotify_agent),
+        AgentEntry(tools.audit_agent, tools._audit_agent,
+                   async_tools.aaudit_agent, async_tools._aaudit_agent),
+    )
+}
+
+
+def get_agent(name: str) -> AgentEntry:
+    try:
+        return AGENTS[name]
+    except KeyError:
+        raise KeyError(f"Unknown agent: {name}") from None
+
+def call_agent(name: str, kwargs: Dict[str, Any], strict: Optional[bool] = None) -> Dict[str, Any]:
+    return get_agent(name).call(kwargs, strict)
+
+async def acall_agent(name: str, kwargs: Dict[str, Any], strict: Optional[bool] = None) -> Dict[str, Any]:
+    return await get_agent(name).acall(kwargs, strict)
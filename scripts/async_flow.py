@@ -0,0 +1,154 @@
+from __future__ import annotations
+import asyncio
+import time
+from typing import Dict, Any, Callable, Iterable, List, Optional, Union
+
+from scripts.checkpoints import Checkpointer, get_checkpointer
+from scripts.core_datastructures import AgentState
+from scripts.langgraph_flow import (
+    build_graph, demo_order_state, _merge_envelope,
+    _payment_kwargs, _merchant_kwargs, _dispatch_kwargs, _reputation_kwargs,
+    _capacity_kwargs, _split_kwargs, _weather_kwargs, _breakdown_kwargs,
+    _reroute_kwargs, _customer_change_kwargs, _policy_kwargs, _notify_kwargs, _audit_kwargs
+)
+from scripts.agent_registry import acall_agent
+from scripts.batch_runner import BatchReport, OrderResult, _as_input, _order_id
+from scripts.metrics import get_metrics
+
+
+# =========================================================
+# 1) Async nodes
+#    Same kwargs builders and merge as the sync nodes; only the tool
+#    call is awaited, so a slow backend yields the event loop.
+# =========================================================
+
+def _async_node(agent: str, build_kwargs: Callable[[AgentState], Dict[str, Any]], thought: str):
+    async def node(state: AgentState) -> AgentState:
+        env = await acall_agent(agent, build_kwargs(state))
+        return _merge_envelope(state, env, thought=thought, agent=agent)
+    return node
+
+async def anode_checks(state: AgentState) -> AgentState:
+    envs = await asyncio.gather(
+        acall_agent("capacity_agent", _capacity_kwargs(state)),
+        acall_agent("weather_agent", _weather_kwargs(state)),
+        acall_agent("courier_breakdown_agent", _breakdown_kwargs(state)),
+    )
+    # gather keeps submission order, so the merge stays deterministic
+    for env, thought, agent in zip(envs, ("Capacity check", "Weather check", "Breakdown/idle detection"),
+                                   ("capacity_agent", "weather_agent", "courier_breakdown_agent")):
+        state = _merge_envelope(state, env, thought=thought, agent=agent)
+    return state
+
+ASYNC_NODES: Dict[str, Callable[[AgentState], Any]] = {
+    "payment": _async_node("payment_agent", _payment_kwargs, "Payment check"),
+    "merchant": _async_node("merchant_status_agent", _merchant_kwargs, "Merchant status & stock"),
+    "dispatch": _async_node("delivery_dispatch_agent", _dispatch_kwargs, "Courier dispatch"),
+    "reputation": _async_node("reputation_agent", _reputation_kwargs, "Courier reputation gate"),
+    "capacity": _async_node("capacity_agent", _capacity_kwargs, "Capacity check"),
+    "split": _async_node("split_delivery_agent", _split_kwargs, "Split delivery negotiation"),
+    "weather": _async_node("weather_agent", _weather_kwargs, "Weather check"),
+    "breakdown": _async_node("courier_breakdown_agent", _breakdown_kwargs, "Breakdown/idle detection"),
+    "checks": anode_checks,
+    "reroute": _async_node("reroute_agent", _reroute_kwargs, "Reroute / reassignment"),
+    "customer_change": _async_node("customer_change_agent", _customer_change_kwargs, "Customer-initiated change"),
+    "policy": _async_node("policy_guard", _policy_kwargs, "Policy / SLA validation"),
+    "notify": _async_node("notify_agent", _notify_kwargs, "Notify stakeholders"),
+    "audit": _async_node("audit_agent", _audit_kwargs, "Persist audit trace"),
+}
+
+def build_async_graph(strict_state: Optional[bool] = None, parallel_checks: bool = False,
+                      checkpointer: Optional[Checkpointer] = None):
+    """Same topology as build_graph(), wired to the async agents; run it with ainvoke."""
+    return build_graph(strict_state=strict_state, parallel_checks=parallel_checks, nodes=ASYNC_NODES,
+                       checkpointer=checkpointer)
+
+
+# =========================================================
+# 2) Async runner
+#    Thousands of orders in flight on one event loop; the semaphore
+#    bounds how many are inside the graph at once.
+# =========================================================
+
+_ASYNC_APP = None
+
+def _shared_async_app():
+    global _ASYNC_APP
+    if _ASYNC_APP is None:
+        _ASYNC_APP = build_async_graph(checkpointer=get_checkpointer())
+    return _ASYNC_APP
+
+async def arun_orders(states: Iterable[Union[AgentState, Dict[str, Any]]],
+                      concurrency: int = 1000,
+                      app=None) -> BatchReport:
+    """
+    Async counterpart of scripts.batch_runner.run_orders.
+    - concurrency -> max orders awaiting inside the graph at once
+    - a failing order is reported in its OrderResult, it never aborts the batch
+    """
+    app = app or _shared_async_app()
+    inputs = [_as_input(s) for s in states]
+    limit = asyncio.Semaphore(max(1, concurrency))
+
+    async def _one(inp: Dict[str, Any]) -> OrderResult:
+        async with limit:
+            try:
+                out = await app.ainvoke(inp)
+            except Exception as e:
+                return OrderResult(order_id=_order_id(inp), ok=False, error=f"{type(e).__name__}: {e}")
+        return OrderResult(order_id=_order_id(inp), ok=True, order_details=out.get("order_details", {}))
+
+    start = time.perf_counter()
+    results: List[OrderResult] = await asyncio.gather(*(_one(inp) for inp in inputs))
+    elapsed = time.perf_counter() - start
+
+    succeeded = sum(1 for r in results if r.ok)
+    metrics = get_metrics()
+    metrics.inc("synapse_orders_total", (("outcome", "ok"),), succeeded)
+    metrics.inc("synapse_orders_total", (("outcome", "failed"),), len(results) - succeeded)
+    return BatchReport(
+        results=results,
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        elapsed_s=elapsed,
+        orders_per_sec=(len(results) / elapsed) if elapsed > 0 else 0.0,
+    )
+
+
+# =========================================================
+# 3) Minimal Demo: sync vs async against a fake slow backend
+# =========================================================
+if __name__ == "__main__":
+    import argparse
+    import copy
+    from scripts.batch_runner import run_orders
+    from scripts.data_sources import FakeLatencyDataSource, set_data_source
+
+    parser = argparse.ArgumentParser(description="Compare sync and async graph throughput against a fake backend.")
+    parser.add_argument("-n", "--orders", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--sync-concurrency", type=int, default=8)
+    parser.add_argument("--async-concurrency", type=int, default=1000)
+    args = parser.parse_args()
+
+    set_data_source(FakeLatencyDataSource(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, seed=7))
+
+    base = demo_order_state().model_dump()
+    def _states():
+        out = []
+        for i in range(args.orders):
+            st = copy.deepcopy(base)
+            st["order_details"]["order_id"] = f"order_{i:06d}"
+            out.append(st)
+        return out
+
+    sync_report = run_orders(_states(), concurrency=args.sync_concurrency)
+    async_report = asyncio.run(arun_orders(_states(), concurrency=args.async_concurrency))
+
+    for label, report in (("sync ", sync_report), ("async", async_report)):
+        print(f"{label} orders={report.total} ok={report.succeeded} failed={report.failed} "
+              f"elapsed={report.elapsed_s:.3f}s throughput={report.orders_per_sec:.1f} orders/s")
+    if sync_report.orders_per_sec:
+        print(f"speedup x{async_report.orders_per_sec / sync_report.orders_per_sec:.1f}")
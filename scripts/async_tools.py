@@ -0,0 +1,177 @@
+from langchain_core.tools import tool
+import asyncio
+import time
+
+from scripts.core_datastructures import (
+    AgentReturnEnvelope, ContainerAgentInput, PaymentAgentInput, PromotionGuardInput, ReputationAgentInput,
+    CourierBreakdownInput, CapacityAgentInput, SplitDeliveryInput,
+    WeatherAgentInput, MerchantStatusInput, DeliveryDispatchInput,
+    RerouteInput, CustomerChangeInput, PolicyGuardInput, NotifyAgentInput,
+    AuditAgentInput
+)
+from scripts.audit_store import get_audit_store
+from scripts.data_sources import get_data_source
+from scripts import tools as sync_tools
+from scripts.ttl_cache import acached_weather
+from scripts.merchant_store import get_merchant_store
+
+# Async variants of every agent in scripts.tools.
+# Agents that read backend data await the active DataSource and then run
+# the same decision helper as the sync tool; pure agents reuse the sync
+# body directly since they never block.
+
+async def _empty() -> dict:
+    return {}
+
+# 1) PaymentAgent
+@tool(args_schema=PaymentAgentInput)
+async def apayment_agent(**kwargs) -> dict:
+    """Detects double charges, resolves holds, switches payment method, computes refunds/credits."""
+    return await _apayment_agent(PaymentAgentInput(**kwargs))
+
+async def _apayment_agent(inputs: PaymentAgentInput) -> dict:
+    return sync_tools._payment_agent(inputs)
+
+# 2) ReputationAgent
+@tool(args_schema=ReputationAgentInput)
+async def areputation_agent(**kwargs) -> dict:
+    """Scores courier risk and decides if reassignment is safer."""
+    return await _areputation_agent(ReputationAgentInput(**kwargs))
+
+async def _areputation_agent(inputs: ReputationAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    courier = await get_data_source().aget_courier(inputs.courier_candidate_id)
+    return sync_tools._reputation_decide(inputs, courier, start_time)
+
+# 3) CourierBreakdownAgent
+@tool(args_schema=CourierBreakdownInput)
+async def acourier_breakdown_agent(**kwargs) -> dict:
+    """Detects breakdowns/immobility (driver SOS, long idle)."""
+    return await _acourier_breakdown_agent(CourierBreakdownInput(**kwargs))
+
+async def _acourier_breakdown_agent(inputs: CourierBreakdownInput) -> dict:
+    return sync_tools._courier_breakdown_agent(inputs)
+
+# 4) CapacityAgent
+@tool(args_schema=CapacityAgentInput)
+async def acapacity_agent(**kwargs) -> dict:
+    """Checks if a courier’s vehicle can carry the full order; computes overflow."""
+    return await _acapacity_agent(CapacityAgentInput(**kwargs))
+
+async def _acapacity_agent(inputs: CapacityAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    source = get_data_source()
+    order_items, courier = await asyncio.gather(
+        source.aget_order_items(inputs.order_id),
+        source.aget_courier(inputs.courier_id),
+    )
+    return sync_tools._capacity_decide(inputs, order_items, courier, start_time)
+
+# 5) SplitDeliveryAgent
+@tool(args_schema=SplitDeliveryInput)
+async def asplit_delivery_agent(**kwargs) -> dict:
+    """Negotiates partial-now / later delivery, computes ETAs & fees/waivers."""
+    return await _asplit_delivery_agent(SplitDeliveryInput(**kwargs))
+
+async def _asplit_delivery_agent(inputs: SplitDeliveryInput) -> dict:
+    start_time = time.perf_counter_ns()
+    source = get_data_source()
+    order_items, courier = await asyncio.gather(
+        source.aget_order_items(inputs.order_id),
+        source.aget_courier(inputs.courier_id) if inputs.courier_id else _empty(),
+    )
+    return sync_tools._split_decide(inputs, order_items, courier, start_time)
+
+# 6) WeatherAgent
+@tool(args_schema=WeatherAgentInput)
+async def aweather_agent(**kwargs) -> dict:
+    """Pulls weather alerts and adjusts route cost/ETA."""
+    return await _aweather_agent(WeatherAgentInput(**kwargs))
+
+async def _aweather_agent(inputs: WeatherAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    weather_info = await acached_weather(inputs.destination_city)
+    return sync_tools._weather_decide(inputs, weather_info, start_time)
+
+# 7) MerchantStatusAgent
+@tool(args_schema=MerchantStatusInput)
+async def amerchant_status_agent(**kwargs) -> dict:
+    """Checks merchant health and item stock."""
+    return await _amerchant_status_agent(MerchantStatusInput(**kwargs))
+
+async def _amerchant_status_agent(inputs: MerchantStatusInput) -> dict:
+    start_time = time.perf_counter_ns()
+    state = await get_merchant_store().aget(inputs.merchant_id)
+    return sync_tools._merchant_decide(inputs, state, start_time)
+
+# 8) DeliveryDispatchAgent
+@tool(args_schema=DeliveryDispatchInput)
+async def adelivery_dispatch_agent(**kwargs) -> dict:
+    """Assigns a courier and initial route/ETA."""
+    return await _adelivery_dispatch_agent(DeliveryDispatchInput(**kwargs))
+
+async def _adelivery_dispatch_agent(inputs: DeliveryDispatchInput) -> dict:
+    start_time = time.perf_counter_ns()
+    pick = sync_tools._dispatch_pick(inputs)  # in-memory index, never blocks
+    courier_data = await get_data_source().aget_courier(pick[0]) if pick else {}
+    return sync_tools._dispatch_decide(inputs, pick, courier_data, start_time)
+
+# 9) RerouteAgent
+@tool(args_schema=RerouteInput)
+async def areroute_agent(**kwargs) -> dict:
+    """Picks a better courier or route when a delay/risk arises."""
+    return await _areroute_agent(RerouteInput(**kwargs))
+
+async def _areroute_agent(inputs: RerouteInput) -> dict:
+    return sync_tools._reroute_agent(inputs)
+
+# 10) CustomerChangeAgent
+@tool(args_schema=CustomerChangeInput)
+async def acustomer_change_agent(**kwargs) -> dict:
+    """Applies user-initiated changes mid-route, like address or payment modes."""
+    return await _acustomer_change_agent(CustomerChangeInput(**kwargs))
+
+async def _acustomer_change_agent(inputs: CustomerChangeInput) -> dict:
+    return sync_tools._customer_change_agent(inputs)
+
+# 11) PolicyGuard
+@tool(args_schema=PolicyGuardInput)
+async def apolicy_guard(**kwargs) -> dict:
+    """Validates final plan against SLA and compliance."""
+    return await _apolicy_guard(PolicyGuardInput(**kwargs))
+
+async def _apolicy_guard(inputs: PolicyGuardInput) -> dict:
+    return sync_tools._policy_guard(inputs)
+
+# 12) NotifyAgent
+@tool(args_schema=NotifyAgentInput)
+async def anotify_agent(**kwargs) -> dict:
+    """Composes and sends notifications to users, merchants, or couriers."""
+    return await _anotify_agent(NotifyAgentInput(**kwargs))
+
+async def _anotify_agent(inputs: NotifyAgentInput) -> dict:
+    return sync_tools._notify_agent(inputs)
+
+# 13) AuditAgent
+@tool(args_schema=AuditAgentInput)
+async def aaudit_agent(**kwargs) -> dict:
+    """Persists all thoughts, decisions, and metrics, and a compact reasoning summary."""
+    return await _aaudit_agent(AuditAgentInput(**kwargs))
+
+async def _aaudit_agent(inputs: AuditAgentInput) -> dict:
+    if get_audit_store() is None:
+        return sync_tools._audit_agent(inputs)
+    # append() may open the store, write its buffer or roll a segment (fsync)
+    return await asyncio.to_thread(sync_tools._audit_agent, inputs)
+
+@tool
+async def acontainer_agent(inputs: ContainerAgentInput) -> AgentReturnEnvelope:
+    """Checks if a courier's vehicle is equipped with specialized containers."""
+    start_time = time.perf_counter_ns()
+    courier_data = await get_data_source().aget_courier(inputs.courier_id)
+    return sync_tools._container_decide(inputs, courier_data, start_time)
+
+@tool
+async def apromotion_guard(inputs: PromotionGuardInput) -> AgentReturnEnvelope:
+    """Validates if a proposed reroute or change violates an active promotion."""
+    return sync_tools.promotion_guard.func(inputs)
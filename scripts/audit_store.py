@@ -0,0 +1,502 @@
+from __future__ import annotations
+import atexit
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+
+# =========================================================
+# 1) Record encoding
+#    One audit record per finished order, stored column by column rather
+#    than as one JSON blob per log entry:
+#      header  -> version, flags, ts, order_id, trace_id (never compressed,
+#                 so the index can be rebuilt without decoding bodies)
+#      body    -> thoughts column, events column, final order state (JSON)
+#    Strings are varint-length-prefixed UTF-8. Bodies above COMPRESS_MIN
+#    bytes are zlib-compressed (level 1; flags bit 0).
+#    On disk each record is framed as <length u32><crc32 u32><payload>.
+# =========================================================
+
+RECORD_VERSION = 1
+FLAG_ZLIB = 0x01
+COMPRESS_MIN = 256
+
+_FRAME = struct.Struct("<II")          # payload length, crc32(payload)
+_HEAD = struct.Struct("<BBd")          # version, flags, ts
+
+
+class AuditRecord(BaseModel):
+    order_id: str
+    trace_id: str
+    ts: float
+    thoughts: List[str] = Field(default_factory=list)
+    events: List[str] = Field(default_factory=list)
+    state: Dict[str, Any] = Field(default_factory=dict)
+    segment: int = 0
+    offset: int = 0
+
+
+def _put_varint(out: bytearray, n: int) -> None:
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _get_varint(buf: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+def _put_str(out: bytearray, s: str) -> None:
+    raw = s.encode()
+    _put_varint(out, len(raw))
+    out += raw
+
+def _get_str(buf: bytes, pos: int) -> Tuple[str, int]:
+    n, pos = _get_varint(buf, pos)
+    return buf[pos:pos + n].decode(), pos + n
+
+def _put_column(out: bytearray, values: List[str]) -> None:
+    _put_varint(out, len(values))
+    for v in values:
+        _put_str(out, v)
+
+def _get_column(buf: bytes, pos: int) -> Tuple[List[str], int]:
+    n, pos = _get_varint(buf, pos)
+    values = []
+    for _ in range(n):
+        v, pos = _get_str(buf, pos)
+        values.append(v)
+    return values, pos
+
+
+def encode_record(order_id: str, trace_id: str, ts: float, thoughts: List[str],
+                  events: List[str], state: Dict[str, Any]) -> bytes:
+    body = bytearray()
+    _put_column(body, thoughts)
+    _put_column(body, events)
+    body += json.dumps(state, separators=(",", ":"), default=str).encode()
+    flags = 0
+    if len(body) >= COMPRESS_MIN:
+        body = zlib.compress(bytes(body), 1)
+        flags |= FLAG_ZLIB
+    out = bytearray(_HEAD.pack(RECORD_VERSION, flags, ts))
+    _put_str(out, order_id)
+    _put_str(out, trace_id)
+    out += body
+    return bytes(out)
+
+def decode_ids(payload: bytes) -> Tuple[str, str, int]:
+    """(order_id, trace_id, body offset) without touching the body."""
+    order_id, pos = _get_str(payload, _HEAD.size)
+    trace_id, pos = _get_str(payload, pos)
+    return order_id, trace_id, pos
+
+def decode_record(payload: bytes) -> AuditRecord:
+    version, flags, ts = _HEAD.unpack_from(payload)
+    if version != RECORD_VERSION:
+        raise ValueError(f"Unsupported audit record version: {version}")
+    order_id, trace_id, pos = decode_ids(payload)
+    body = payload[pos:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    thoughts, pos = _get_column(body, 0)
+    events, pos = _get_column(body, pos)
+    return AuditRecord(order_id=order_id, trace_id=trace_id, ts=ts, thoughts=thoughts,
+                       events=events, state=json.loads(body[pos:]) if pos < len(body) else {})
+
+
+# =========================================================
+# 2) Segmented append-only store
+#    - records go to seg-<n>.log; a segment is sealed once it passes
+#      segment_bytes and gets a seg-<n>.idx (order_id, trace_id, offset)
+#    - appends land in a memory buffer, written out every flush_bytes;
+#      a background thread fsyncs every sync_interval_s, or sooner once
+#      sync_every records are waiting (group commit: a crash loses at
+#      most the last interval, never a half-written record)
+#    - order_id / trace_id -> (segment, offset) is kept in memory and
+#      rebuilt on open from the .idx files plus a scan of the open
+#      segment; a torn tail left by a crash is truncated there
+#    - an order audited twice resolves to its latest record
+#    Nothing is opened until the first append or lookup. readonly=True
+#    opens without truncating or appending, e.g. next to a live writer.
+# =========================================================
+
+SEGMENT_MAGIC = b"SYNAUD1\n"
+INDEX_MAGIC = b"SYNIDX1\n"
+_INDEX_ROW = struct.Struct("<Q")
+
+Location = Tuple[int, int]             # segment number, byte offset
+
+
+class AuditStore:
+    def __init__(self, path: str, segment_bytes: int = 64 << 20, flush_bytes: int = 64 << 10,
+                 sync_interval_s: float = 0.2, sync_every: int = 1000, readonly: bool = False):
+        self.path = path
+        self.readonly = readonly
+        self.segment_bytes = segment_bytes
+        self.flush_bytes = flush_bytes
+        self.sync_interval_s = sync_interval_s
+        self.sync_every = sync_every
+        self.by_order: Dict[str, Location] = {}
+        self.by_trace: Dict[str, Location] = {}
+        self._lock = threading.Lock()
+        self._opened = False
+        self._closed = False
+        self._file = None
+        self._segment = 0
+        self._rows: List[Tuple[int, str, str]] = []   # (offset, order_id, trace_id) of the open segment
+        self._written = 0              # bytes of the open segment already handed to the OS
+        self._buffer = bytearray()
+        self._unsynced = 0
+        self._wake = threading.Event()
+        self._syncer: Optional[threading.Thread] = None
+
+    # ---- paths ----
+    def _log_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"seg-{segment:08d}.log")
+
+    def _idx_path(self, segment: int) -> str:
+        return os.path.join(self.path, f"seg-{segment:08d}.idx")
+
+    def segments(self) -> List[int]:
+        if not os.path.isdir(self.path):
+            return []
+        return sorted(int(name[4:12]) for name in os.listdir(self.path)
+                      if name.startswith("seg-") and name.endswith(".log"))
+
+    # ---- open / recovery ----
+    def _ensure_open(self) -> None:
+        if self._opened:
+            return
+        with self._lock:
+            if self._opened:
+                return
+            if self._closed:
+                raise RuntimeError(f"Audit store {self.path} is closed")
+            segments = self.segments()
+            for seg in segments[:-1]:
+                if not self._load_index(seg):
+                    self._scan(seg)
+            if self.readonly:
+                if segments:
+                    self._segment = segments[-1]
+                    self._written = self._scan(self._segment, last=True)
+                self._opened = True
+                return
+            os.makedirs(self.path, exist_ok=True)
+            if segments:
+                self._segment = segments[-1]
+                self._written = self._scan(self._segment, last=True, truncate=True)
+                self._file = open(self._log_path(self._segment), "ab")
+            else:
+                self._segment = 1
+                self._new_segment()
+            self._start_syncer()
+            self._opened = True
+
+    def _start_syncer(self) -> None:
+        self._syncer = threading.Thread(target=self._sync_loop, name="synapse-audit-sync", daemon=True)
+        self._syncer.start()
+
+    def _new_segment(self) -> None:
+        self._rows = []
+        self._file = open(self._log_path(self._segment), "ab")
+        self._file.write(SEGMENT_MAGIC)
+        self._written = len(SEGMENT_MAGIC)
+
+    def _scan(self, segment: int, last: bool = False, truncate: bool = False) -> int:
+        """
+        Index one segment's records; returns the end of its last good record.
+        - last=True -> a torn tail is expected (crash mid-write) and skipped
+        - truncate=True -> and cut off, so appends resume on a clean boundary
+        """
+        path = self._log_path(segment)
+        with open(path, "rb") as f:
+            data = f.read()
+        if not data.startswith(SEGMENT_MAGIC):
+            if truncate and not data.strip(b"\0"):
+                with open(path, "wb") as f:
+                    f.write(SEGMENT_MAGIC)
+                return len(SEGMENT_MAGIC)
+            raise ValueError(f"Not an audit segment: {path}")
+        rows = []
+        pos = len(SEGMENT_MAGIC)
+        while pos + _FRAME.size <= len(data):
+            length, crc = _FRAME.unpack_from(data, pos)
+            payload = data[pos + _FRAME.size:pos + _FRAME.size + length]
+            if len(payload) < length or zlib.crc32(payload) != crc:
+                break
+            order_id, trace_id, _ = decode_ids(payload)
+            self.by_order[order_id] = self.by_trace[trace_id] = (segment, pos)
+            rows.append((pos, order_id, trace_id))
+            pos += _FRAME.size + length
+        if pos < len(data):
+            if not last:
+                raise ValueError(f"Corrupt audit record in sealed segment {path} at offset {pos}")
+            if truncate:
+                with open(path, "r+b") as f:
+                    f.truncate(pos)
+        if last:
+            self._rows = rows
+        return pos
+
+    def _load_index(self, segment: int) -> bool:
+        try:
+            with open(self._idx_path(segment), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return False
+        if not data.startswith(INDEX_MAGIC):
+            return False
+        pos = len(INDEX_MAGIC)
+        while pos < len(data):
+            (offset,) = _INDEX_ROW.unpack_from(data, pos)
+            order_id, pos = _get_str(data, pos + _INDEX_ROW.size)
+            trace_id, pos = _get_str(data, pos)
+            self.by_order[order_id] = self.by_trace[trace_id] = (segment, offset)
+        return True
+
+    def _write_index(self, segment: int) -> None:
+        out = bytearray(INDEX_MAGIC)
+        for offset, order_id, trace_id in self._rows:
+            out += _INDEX_ROW.pack(offset)
+            _put_str(out, order_id)
+            _put_str(out, trace_id)
+        tmp = self._idx_path(segment) + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(out)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._idx_path(segment))
+
+    # ---- writing ----
+    def append(self, order_id: str, trace_id: str, thoughts: List[str], events: List[str],
+               state: Dict[str, Any], ts: Optional[float] = None) -> Location:
+        """Queue one record; durable after the next group fsync (or flush(sync=True))."""
+        self._ensure_open()
+        payload = encode_record(order_id, trace_id, time.time() if ts is None else ts, thoughts, events, state)
+        frame = _FRAME.pack(len(payload), zlib.crc32(payload)) + payload
+        with self._lock:
+            if self._closed or self._file is None:
+                raise RuntimeError(f"Audit store {self.path} is closed or read-only")
+            if self._written + len(self._buffer) >= self.segment_bytes:
+                self._roll()
+            if self._syncer is None:
+                self._start_syncer()     # stopped by pause()
+            loc = (self._segment, self._written + len(self._buffer))
+            self._buffer += frame
+            self.by_order[order_id] = self.by_trace[trace_id] = loc
+            self._rows.append((loc[1], order_id, trace_id))
+            self._unsynced += 1
+            if len(self._buffer) >= self.flush_bytes:
+                self._write_buffer()
+            if self._unsynced >= self.sync_every:
+                self._wake.set()
+        return loc
+
+    def _write_buffer(self) -> None:
+        if self._buffer and self._file is not None:
+            self._file.write(self._buffer)
+            self._file.flush()
+            self._written += len(self._buffer)
+            self._buffer.clear()
+
+    def _roll(self) -> None:
+        self._write_buffer()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        self._unsynced = 0
+        self._write_index(self._segment)
+        self._segment += 1
+        self._new_segment()
+
+    def flush(self, sync: bool = False) -> None:
+        """Hand buffered records to the OS; sync=True also fsyncs them."""
+        if not self._opened:
+            return
+        with self._lock:
+            if self._file is None:
+                return
+            self._write_buffer()
+            if not sync or not self._unsynced:
+                return
+            self._unsynced = 0
+            fd = os.dup(self._file.fileno())   # fsync outside the lock; a roll may close the original
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _sync_loop(self) -> None:
+        me = threading.current_thread()
+        while not self._closed and self._syncer is me:
+            self._wake.wait(self.sync_interval_s)
+            self._wake.clear()
+            if self._closed or self._syncer is not me:
+                return
+            self.flush(sync=True)
+
+    def pause(self) -> None:
+        """
+        Flush, fsync and stop the sync thread, e.g. before fork(); the next
+        append starts it again.
+        """
+        if not self._opened:
+            return
+        self.flush(sync=True)
+        with self._lock:
+            syncer, self._syncer = self._syncer, None
+        if syncer is not None:
+            self._wake.set()
+            syncer.join()
+
+    def close(self) -> None:
+        if not self._opened:
+            self._closed = True
+            return
+        self.flush(sync=True)
+        with self._lock:
+            self._closed = True
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        self._wake.set()
+
+    # ---- reading ----
+    def _read(self, loc: Location) -> AuditRecord:
+        segment, offset = loc
+        with self._lock:
+            if segment == self._segment and offset >= self._written:
+                self._write_buffer()
+        with open(self._log_path(segment), "rb") as f:
+            f.seek(offset)
+            length, crc = _FRAME.unpack(f.read(_FRAME.size))
+            payload = f.read(length)
+        if zlib.crc32(payload) != crc:
+            raise ValueError(f"Corrupt audit record at {self._log_path(segment)}:{offset}")
+        record = decode_record(payload)
+        record.segment, record.offset = segment, offset
+        return record
+
+    def get(self, order_id: str) -> Optional[AuditRecord]:
+        """Latest record for an order."""
+        self._ensure_open()
+        loc = self.by_order.get(order_id)
+        return self._read(loc) if loc is not None else None
+
+    def get_trace(self, trace_id: str) -> Optional[AuditRecord]:
+        self._ensure_open()
+        loc = self.by_trace.get(trace_id)
+        return self._read(loc) if loc is not None else None
+
+    def scan(self) -> Iterator[AuditRecord]:
+        """Every record in write order, superseded ones included."""
+        self._ensure_open()
+        self.flush()
+        for segment in self.segments():
+            with open(self._log_path(segment), "rb") as f:
+                data = f.read()
+            pos = len(SEGMENT_MAGIC)
+            while pos + _FRAME.size <= len(data):
+                length, crc = _FRAME.unpack_from(data, pos)
+                payload = data[pos + _FRAME.size:pos + _FRAME.size + length]
+                if len(payload) < length or zlib.crc32(payload) != crc:
+                    break
+                record = decode_record(payload)
+                record.segment, record.offset = segment, pos
+                yield record
+                pos += _FRAME.size + length
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"segments": len(self.segments()), "segment": self._segment,
+                    "orders": len(self.by_order), "traces": len(self.by_trace),
+                    "buffered_bytes": len(self._buffer), "unsynced": self._unsynced}
+
+
+# =========================================================
+# 3) Process-wide store
+#    Off unless a directory is configured (or a store installed with
+#    set_audit_store()), so scripts and tests run from a checkout don't
+#    write into it.
+#    - SYNAPSE_AUDIT_DIR           -> segment directory; unset -> no store
+#    - SYNAPSE_AUDIT=0             -> no store even when the dir is set
+#    - SYNAPSE_AUDIT_SYNC_MS       -> group-fsync interval (default 200)
+#    - SYNAPSE_AUDIT_SEGMENT_MB    -> seal segments at this size (default 64)
+#    Closed (flushed + fsynced) at interpreter exit.
+# =========================================================
+
+_STORE: Optional[AuditStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_audit_store() -> Optional[AuditStore]:
+    global _STORE
+    if _STORE is None:
+        path = os.getenv("SYNAPSE_AUDIT_DIR")
+        if not path or os.getenv("SYNAPSE_AUDIT", "1").lower() in ("0", "false", "no"):
+            return None
+        with _STORE_LOCK:
+            if _STORE is None:
+                _STORE = AuditStore(
+                    path,
+                    segment_bytes=int(float(os.getenv("SYNAPSE_AUDIT_SEGMENT_MB", "64")) * (1 << 20)),
+                    sync_interval_s=float(os.getenv("SYNAPSE_AUDIT_SYNC_MS", "200")) / 1000,
+                )
+                atexit.register(_STORE.close)
+    return _STORE
+
+def set_audit_store(store: Optional[AuditStore]) -> None:
+    """Install a store (e.g. a temp directory in a benchmark); None reverts to the env default."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is not None and _STORE is not store:
+            _STORE.close()
+        _STORE = store
+
+def _forget_inherited_store() -> None:
+    """
+    In a forked child: the parent's store (its unflushed buffer, open
+    segment and sync thread) stays the parent's. Dropped without close(),
+    so nothing the parent buffered is written twice; the child opens its
+    own store on first use (see scripts.shard_runner for per-shard dirs).
+    """
+    global _STORE, _STORE_LOCK
+    _STORE = None
+    _STORE_LOCK = threading.Lock()
+
+os.register_at_fork(after_in_child=_forget_inherited_store)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect an audit store.")
+    parser.add_argument("--dir", default=os.getenv("SYNAPSE_AUDIT_DIR"), help="default: $SYNAPSE_AUDIT_DIR")
+    query = parser.add_mutually_exclusive_group()
+    query.add_argument("--order", help="print the latest record for an order id")
+    query.add_argument("--trace", help="print the record for a trace id")
+    args = parser.parse_args()
+    if not args.dir:
+        parser.error("no audit directory: pass --dir or set SYNAPSE_AUDIT_DIR")
+
+    store = AuditStore(args.dir, readonly=True)
+    try:
+        if args.order or args.trace:
+            record = store.get(args.order) if args.order else store.get_trace(args.trace)
+            print(record.model_dump_json(indent=2) if record else "not found")
+        else:
+            print(json.dumps(store.stats(), indent=2))
+    finally:
+        store.close()
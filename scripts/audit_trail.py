@@ -0,0 +1,88 @@
+from __future__ import annotations
+import os
+from typing import Any, Dict, Iterable, List, Optional
+
+
+# =========================================================
+# 1) Rolling audit trail
+#    Lives in order_details["_audit"] (next to "_phase") as plain lists
+#    and dicts, so it survives model_dump / JSON like the rest of the
+#    order. Updated once per merged envelope, in O(1):
+#      chain   -> [reason, event, count]; a step that repeats the one
+#                 before it bumps count instead of adding an entry, and
+#                 past CHAIN_MAX the oldest entry after the first
+#                 CHAIN_HEAD is dropped (counted in "dropped")
+#      agents  -> per agent: calls, failed, total_ms, max_ms
+#      hops    -> envelopes merged so far
+#    state.audit_log itself is cut to the last AUDIT_RING entries.
+#    - SYNAPSE_AUDIT_RING  -> recent audit_log entries kept (default 16)
+#    - SYNAPSE_AUDIT_CHAIN -> reason-chain entries kept (default 32)
+# =========================================================
+
+AUDIT_RING = int(os.getenv("SYNAPSE_AUDIT_RING", "16"))
+CHAIN_MAX = max(2, int(os.getenv("SYNAPSE_AUDIT_CHAIN", "32")))
+CHAIN_HEAD = min(8, CHAIN_MAX // 2)
+
+TRAIL_KEY = "_audit"
+
+
+def new_trail() -> Dict[str, Any]:
+    return {"hops": 0, "dropped": 0, "chain": [], "agents": {}}
+
+def event_label(updates_keys: Any) -> str:
+    if isinstance(updates_keys, (list, tuple)):
+        return ",".join(map(str, updates_keys)) if updates_keys else "none"
+    return str(updates_keys) if updates_keys is not None else "none"
+
+
+def record(trail: Dict[str, Any], agent: str, reason: Optional[str], event: str,
+           ok: bool = True, latency_ms: Optional[float] = None) -> None:
+    trail["hops"] += 1
+    chain = trail["chain"]
+    last = chain[-1] if chain else None
+    if last is not None and last[0] == reason and last[1] == event:
+        last[2] += 1
+    else:
+        chain.append([reason, event, 1])
+        if len(chain) > CHAIN_MAX:
+            del chain[CHAIN_HEAD]
+            trail["dropped"] += 1
+
+    stats = trail["agents"].get(agent)
+    if stats is None:
+        stats = trail["agents"][agent] = {"calls": 0, "failed": 0, "total_ms": 0.0, "max_ms": 0.0}
+    stats["calls"] += 1
+    if not ok:
+        stats["failed"] += 1
+    if latency_ms:
+        stats["total_ms"] += latency_ms
+        if latency_ms > stats["max_ms"]:
+            stats["max_ms"] = latency_ms
+
+
+def replay(trail: Dict[str, Any], entries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Apply audit_log entries to a trail, as _merge_envelope did when it wrote them."""
+    for e in entries:
+        record(trail, e.get("agent") or "unknown", e.get("reason"), event_label(e.get("updates_keys")),
+               e.get("ok", True), (e.get("metrics") or {}).get("latency_ms"))
+    return trail
+
+def from_log(entries: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Rebuild a trail from audit_log entries (states that predate the trail)."""
+    return replay(new_trail(), entries)
+
+
+def _omitted(trail: Dict[str, Any], out: List[str]) -> None:
+    if trail["dropped"] and len(out) >= CHAIN_HEAD:
+        out.insert(CHAIN_HEAD, f"... {trail['dropped']} earlier steps omitted")
+
+def thoughts(trail: Dict[str, Any]) -> List[str]:
+    """The reason chain, at most CHAIN_MAX + 1 lines."""
+    out = [reason if n == 1 else f"{reason} (x{n})" for reason, _, n in trail["chain"] if reason]
+    _omitted(trail, out)
+    return out
+
+def events(trail: Dict[str, Any]) -> List[str]:
+    out = [event if n == 1 else f"{event} (x{n})" for _, event, n in trail["chain"]]
+    _omitted(trail, out)
+    return out
@@ -0,0 +1,331 @@
+from __future__ import annotations
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from scripts.core_datastructures import DeliveryDispatchInput
+from scripts.data_sources import get_data_source
+from scripts.geo import eta_min_batch, haversine_matrix, speeds_kmh
+from scripts.spatial_index import get_courier_index
+
+
+# =========================================================
+# 1) Cost model
+#    Every entry is "minutes-equivalent" so terms can be summed:
+#    - pickup_at  -> max(travel time, merchant readiness ETA), with
+#                    travel time from scripts.geo per courier vehicle
+#    - travel     -> deadhead minutes, so distance counts even when
+#                    the food isn't ready yet
+#    - reputation -> penalty for low-rated couriers
+#    - slack      -> penalty for sending a big vehicle on a small order
+#    - overflow   -> courier can't carry it all (capacity/split fixes it later)
+#    Missing insulation, exclusions and unavailable couriers are infeasible.
+# =========================================================
+
+PRIORITY_WEIGHT = 2.0
+TRAVEL_WEIGHT = 1.0
+REPUTATION_WEIGHT = 10.0
+SLACK_WEIGHT = 2.0
+OVERFLOW_PENALTY = 1e3
+INFEASIBLE = 1e6
+
+# Hungarian is exact but O(n^2 m); past this many cells per block use the auction
+HUNGARIAN_MAX_CELLS = 4_000_000
+
+
+def build_cost_matrix(orders: Sequence[DeliveryDispatchInput],
+                      couriers: Sequence[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (cost, pickup_km) matrices of shape (len(orders), len(couriers)).
+    couriers are CourierSpatialIndex.describe() dicts plus "id" and "reputation_score".
+    """
+    o_lat = np.fromiter((o.pickup_location.lat for o in orders), float, len(orders))
+    o_lng = np.fromiter((o.pickup_location.lng for o in orders), float, len(orders))
+    o_vol = np.fromiter((o.required_vol_l for o in orders), float, len(orders))[:, None]
+    o_wt = np.fromiter((o.required_weight_kg for o in orders), float, len(orders))[:, None]
+    o_ins = np.fromiter((o.needs_insulated for o in orders), bool, len(orders))[:, None]
+    o_ready = np.fromiter((o.readiness_eta_min for o in orders), float, len(orders))[:, None]
+    o_weight = np.where(np.fromiter((o.priority_flag for o in orders), bool, len(orders)), PRIORITY_WEIGHT, 1.0)[:, None]
+
+    c_lat = np.fromiter((c["lat"] for c in couriers), float, len(couriers))
+    c_lng = np.fromiter((c["lng"] for c in couriers), float, len(couriers))
+    c_vol = np.fromiter((c["vol_cap_l"] for c in couriers), float, len(couriers))[None, :]
+    c_wt = np.fromiter((c["weight_cap_kg"] for c in couriers), float, len(couriers))[None, :]
+    c_ins = np.fromiter((c["insulated"] for c in couriers), bool, len(couriers))[None, :]
+    c_rep = np.fromiter((c.get("reputation_score", 0.5) for c in couriers), float, len(couriers))[None, :]
+    c_avail = np.fromiter((c["status"] == "available" for c in couriers), bool, len(couriers))[None, :]
+    c_speed = speeds_kmh(c["vehicle_type"] for c in couriers)[None, :]
+
+    pickup_km = haversine_matrix(o_lat, o_lng, c_lat, c_lng)
+    travel = eta_min_batch(pickup_km, c_speed)
+    fits = (c_vol >= o_vol) & (c_wt >= o_wt)
+
+    cost = o_weight * np.maximum(travel, o_ready)
+    cost += TRAVEL_WEIGHT * travel
+    cost += REPUTATION_WEIGHT * (1.0 - np.clip(c_rep, 0.0, 1.0))
+    cost += SLACK_WEIGHT * np.where(fits, 1.0 - o_vol / np.maximum(c_vol, 1e-9), 0.0)
+    cost += np.where(fits, 0.0, OVERFLOW_PENALTY)
+    cost[~c_avail.repeat(len(orders), axis=0) | (o_ins & ~c_ins)] = INFEASIBLE
+
+    col = {c["id"]: j for j, c in enumerate(couriers)}
+    for i, o in enumerate(orders):
+        for cid in o.exclude_couriers:
+            j = col.get(cid)
+            if j is not None:
+                cost[i, j] = INFEASIBLE
+    return cost, pickup_km
+
+
+# =========================================================
+# 2) Solvers
+#    Both take a (rows x cols) cost matrix and return row -> col
+#    (-1 = unassigned). Rectangular inputs are handled by
+#    transposing so the shorter side always does the bidding.
+# =========================================================
+
+def _hungarian(cost: np.ndarray) -> np.ndarray:
+    """Exact min-cost assignment (shortest augmenting path), rows <= cols."""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)    # p[j] -> 1-based row matched to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used
+            free[0] = False
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free[1:] & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+            cand = np.where(free, minv, np.inf)
+            j1 = int(np.argmin(cand))
+            delta = cand[j1]
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+    rows = np.full(n, -1, dtype=np.int64)
+    cols = np.flatnonzero(p[1:])
+    rows[p[1:][cols] - 1] = cols
+    return rows
+
+
+def _auction(cost: np.ndarray, eps_final: Optional[float] = None, scale: float = 5.0) -> np.ndarray:
+    """
+    Jacobi auction with epsilon scaling, rows <= cols.
+    - every unassigned row bids at once (vectorized); each column keeps its best bid
+    - result is within rows * eps_final of the optimum
+    """
+    n, m = cost.shape
+    benefit = -cost
+    feasible = cost[cost < INFEASIBLE]
+    spread = float(np.ptp(feasible)) if feasible.size else 1.0
+    eps_final = eps_final if eps_final is not None else 0.01 / max(n, 1)
+    eps = max(spread / 4.0, eps_final)
+    prices = np.zeros(m)
+    all_rows = np.arange(n)
+
+    while True:
+        owner = np.full(m, -1, dtype=np.int64)
+        assigned = np.full(n, -1, dtype=np.int64)
+        while True:
+            bidders = all_rows[assigned < 0]
+            if not bidders.size:
+                break
+            vals = benefit[bidders] - prices
+            r = np.arange(bidders.size)
+            best = np.argmax(vals, axis=1)
+            v1 = vals[r, best]
+            if m > 1:
+                vals[r, best] = -np.inf
+                v2 = vals.max(axis=1)
+            else:
+                v2 = v1 - spread - eps
+            bids = prices[best] + (v1 - v2) + eps
+            # highest bid per column wins it
+            order = np.lexsort((-bids, best))
+            first = np.ones(order.size, dtype=bool)
+            first[1:] = best[order][1:] != best[order][:-1]
+            win = order[first]
+            cols = best[win]
+            prev = owner[cols]
+            assigned[prev[prev >= 0]] = -1
+            owner[cols] = bidders[win]
+            assigned[bidders[win]] = cols
+            prices[cols] = bids[win]
+        if eps <= eps_final:
+            break
+        eps = max(eps / scale, eps_final)
+
+    if n < m:
+        _reverse_cleanup(benefit, prices, owner, assigned, eps)
+    return assigned
+
+
+def _reverse_cleanup(benefit: np.ndarray, prices: np.ndarray, owner: np.ndarray,
+                     assigned: np.ndarray, eps: float) -> None:
+    """
+    Rectangular problems also need every unassigned column priced no
+    higher than the cheapest assigned one (lam). Earlier scaling phases
+    can leave stale high prices behind; reverse-auction those columns
+    down so the forward result is eps-optimal, not just eps-stable.
+    """
+    lam = prices[assigned].min()
+    profit = benefit[np.arange(assigned.size), assigned] - prices[assigned]
+    queue = list(np.flatnonzero((owner < 0) & (prices > lam)))
+    while queue:
+        j = queue.pop()
+        vals = benefit[:, j] - profit
+        i = int(np.argmax(vals))
+        b1 = vals[i]
+        if lam >= b1 - eps:
+            prices[j] = lam
+            continue
+        if vals.size > 1:
+            vals[i] = -np.inf
+            b2 = vals.max()
+        else:
+            b2 = -np.inf
+        prices[j] = max(lam, b2 - eps)
+        old = assigned[i]
+        owner[old] = -1
+        owner[j] = i
+        assigned[i] = j
+        profit[i] = benefit[i, j] - prices[j]
+        if prices[old] > lam:
+            queue.append(old)
+
+
+def solve_assignment(cost: np.ndarray, method: str = "auto") -> np.ndarray:
+    """
+    Row -> column assignment minimising total cost; -1 where a row gets
+    nothing or only an infeasible column.
+    - method: "hungarian" (exact), "auction" (near-exact, scales better) or "auto"
+    """
+    n, m = cost.shape
+    if n == 0 or m == 0:
+        return np.full(n, -1, dtype=np.int64)
+    if method == "auto":
+        method = "hungarian" if n * m <= HUNGARIAN_MAX_CELLS else "auction"
+    solver = {"hungarian": _hungarian, "auction": _auction}.get(method)
+    if solver is None:
+        raise ValueError(f"Unknown assignment method: {method}")
+
+    if n <= m:
+        rows = solver(cost)
+    else:
+        cols = solver(np.ascontiguousarray(cost.T))
+        rows = np.full(n, -1, dtype=np.int64)
+        hit = np.flatnonzero(cols >= 0)
+        rows[cols[hit]] = hit
+    hit = np.flatnonzero(rows >= 0)
+    rows[hit[cost[hit, rows[hit]] >= INFEASIBLE]] = -1
+    return rows
+
+
+# =========================================================
+# 3) Window dispatch
+#    Each order only competes for its k nearest couriers. Orders
+#    that share no candidates can't affect each other, so the window
+#    is split into connected blocks (in practice: one per city/area)
+#    and each block is solved densely. Orders a block can't serve
+#    fall back to the nearest courier nobody else took.
+# =========================================================
+
+def _blocks(candidates: List[List[str]]) -> List[List[int]]:
+    """Group order indices that (transitively) share a candidate courier."""
+    parent = list(range(len(candidates)))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    first_seen: Dict[str, int] = {}
+    for i, cids in enumerate(candidates):
+        for cid in cids:
+            j = first_seen.setdefault(cid, i)
+            if j != i:
+                parent[find(i)] = find(j)
+    groups: Dict[int, List[int]] = {}
+    for i in range(len(candidates)):
+        groups.setdefault(find(i), []).append(i)
+    return list(groups.values())
+
+
+def _solve_block(orders: Sequence[DeliveryDispatchInput], courier_ids: Sequence[str],
+                 method: str) -> List[Optional[Tuple[str, float]]]:
+    index = get_courier_index()
+    couriers = []
+    for cid in courier_ids:
+        info = index.describe(cid)
+        if info is not None:
+            info["id"] = cid
+            couriers.append(info)
+    if not couriers:
+        return [None] * len(orders)
+
+    records = get_data_source().bulk_get_couriers([c["id"] for c in couriers])
+    for c in couriers:
+        c["reputation_score"] = records.get(c["id"], {}).get("reputation_score", 0.5)
+
+    cost, pickup_km = build_cost_matrix(orders, couriers)
+    rows = solve_assignment(cost, method)
+    return [
+        (couriers[j]["id"], float(pickup_km[i, j])) if j >= 0 else None
+        for i, j in enumerate(rows.tolist())
+    ]
+
+
+def assign_window(orders: Sequence[DeliveryDispatchInput],
+                  courier_pool: Optional[Sequence[str]] = None,
+                  k_nearest: int = 4,
+                  method: str = "auto") -> List[Optional[Tuple[str, float]]]:
+    """
+    Assign a window of pending orders to distinct couriers in one pass.
+    Returns one (courier_id, pickup_km) per order, or None when no
+    feasible courier is left for it.
+    - courier_pool -> solve against exactly these couriers (one dense block)
+    - otherwise each order's k_nearest couriers from the spatial index
+    """
+    if not orders:
+        return []
+    if courier_pool is not None:
+        return _solve_block(orders, list(courier_pool), method)
+
+    index = get_courier_index()
+    candidates = [
+        [cid for cid, _ in index.nearest(o.pickup_location.lat, o.pickup_location.lng, k=k_nearest,
+                                         require_insulated=o.needs_insulated, exclude=o.exclude_couriers)]
+        for o in orders
+    ]
+    picks: List[Optional[Tuple[str, float]]] = [None] * len(orders)
+    for block in _blocks(candidates):
+        pool = list(dict.fromkeys(cid for i in block for cid in candidates[i]))
+        for i, pick in zip(block, _solve_block([orders[i] for i in block], pool, method)):
+            picks[i] = pick
+
+    taken = {p[0] for p in picks if p}
+    for i, o in enumerate(orders):
+        if picks[i] is None:
+            hits = index.nearest(o.pickup_location.lat, o.pickup_location.lng, k=1,
+                                 require_insulated=o.needs_insulated,
+                                 exclude=taken.union(o.exclude_couriers))
+            if hits:
+                picks[i] = hits[0]
+                taken.add(hits[0][0])
+    return picks
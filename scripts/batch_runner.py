@@ -0,0 +1,150 @@
+from __future__ import annotations
+import time
+from typing import Dict, Any, Iterable, List, Optional, Union
+
+from pydantic import BaseModel, Field
+
+from scripts.checkpoints import Checkpointer, set_checkpointer
+from scripts.core_datastructures import AgentState, DeliveryDispatchInput
+from scripts.langgraph_flow import get_app, demo_order_state, _dispatch_order_kwargs
+from scripts.metrics import get_metrics
+from scripts.profiling import MODES, get_profiler
+
+
+# =========================================================
+# 1) Result models
+# =========================================================
+
+class OrderResult(BaseModel):
+    """Outcome of a single order pushed through the graph."""
+    order_id: Optional[str] = None
+    ok: bool
+    order_details: Dict[str, Any] = Field(default_factory=dict)
+    error: Optional[str] = None
+
+class BatchReport(BaseModel):
+    """Per-order results plus aggregate throughput for one batch run."""
+    results: List[OrderResult] = Field(default_factory=list)
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_s: float = 0.0
+    orders_per_sec: float = 0.0
+
+
+# =========================================================
+# 2) Batch runner
+#    One compiled graph is shared by every order in the batch,
+#    so tool schemas and mock/DB lookups are built exactly once.
+# =========================================================
+
+def _as_input(state: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+    if isinstance(state, AgentState):
+        return state.model_dump()
+    return state
+
+def _order_id(state: Dict[str, Any]) -> Optional[str]:
+    return (state.get("order_details") or {}).get("order_id")
+
+def preassign_couriers(inputs: List[Dict[str, Any]], window: int, method: str = "auto") -> None:
+    """
+    Solve courier assignment for consecutive windows of orders up front and
+    stash the result as order_details["assigned_courier_id"], which the
+    dispatch node then honours instead of its own nearest-courier search.
+    """
+    from scripts.batch_dispatch import assign_window
+
+    for lo in range(0, len(inputs), window):
+        chunk = [inp.get("order_details") or {} for inp in inputs[lo:lo + window]]
+        orders = [DeliveryDispatchInput(**_dispatch_order_kwargs(order)) for order in chunk]
+        for order, pick in zip(chunk, assign_window(orders, method=method)):
+            if pick is not None:
+                order["assigned_courier_id"] = pick[0]
+
+def run_orders(states: Iterable[Union[AgentState, Dict[str, Any]]],
+               concurrency: int = 8,
+               app=None,
+               dispatch_window: int = 0) -> BatchReport:
+    """
+    Push N order states through the same compiled graph.
+    - concurrency -> max orders in flight (langgraph max_concurrency)
+    - dispatch_window -> if > 0, assign couriers per window of orders in one
+      global pass before the graph runs (see scripts.batch_dispatch)
+    - a failing order is reported in its OrderResult, it never aborts the batch
+    """
+    app = app or get_app()
+    inputs = [_as_input(s) for s in states]
+    if dispatch_window > 0:
+        preassign_couriers(inputs, dispatch_window)
+
+    start = time.perf_counter()
+    outputs = app.batch(
+        inputs,
+        config={"max_concurrency": max(1, concurrency)},
+        return_exceptions=True,
+    )
+    elapsed = time.perf_counter() - start
+
+    results: List[OrderResult] = []
+    for inp, out in zip(inputs, outputs):
+        if isinstance(out, Exception):
+            results.append(OrderResult(order_id=_order_id(inp), ok=False, error=f"{type(out).__name__}: {out}"))
+        else:
+            results.append(OrderResult(order_id=_order_id(inp), ok=True, order_details=out.get("order_details", {})))
+
+    succeeded = sum(1 for r in results if r.ok)
+    metrics = get_metrics()
+    metrics.inc("synapse_orders_total", (("outcome", "ok"),), succeeded)
+    metrics.inc("synapse_orders_total", (("outcome", "failed"),), len(results) - succeeded)
+    return BatchReport(
+        results=results,
+        total=len(results),
+        succeeded=succeeded,
+        failed=len(results) - succeeded,
+        elapsed_s=elapsed,
+        orders_per_sec=(len(results) / elapsed) if elapsed > 0 else 0.0,
+    )
+
+
+# =========================================================
+# 3) Minimal Demo
+# =========================================================
+if __name__ == "__main__":
+    import argparse
+    import copy
+
+    parser = argparse.ArgumentParser(description="Run the demo order N times through the graph.")
+    parser.add_argument("-n", "--orders", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("-w", "--dispatch-window", type=int, default=0,
+                        help="batch-assign couriers per window of N orders (0 = per-order dispatch)")
+    parser.add_argument("--metrics-out", help="write Prometheus text metrics here when done")
+    parser.add_argument("--profile", choices=MODES, help="sample orders with this profiling mode")
+    parser.add_argument("--profile-every", type=int, default=100, help="profile 1 order in N")
+    parser.add_argument("--profile-dir", default="profiles")
+    parser.add_argument("--checkpoint-db", help="checkpoint every hop into this SQLite file")
+    parser.add_argument("--shards", type=int, default=0,
+                        help="run across N worker processes sharded by order_id (0 = this process)")
+    args = parser.parse_args()
+    if args.profile:
+        get_profiler().configure(mode=args.profile, every=args.profile_every, out_dir=args.profile_dir)
+    if args.checkpoint_db:
+        set_checkpointer(Checkpointer(args.checkpoint_db))
+
+    base = demo_order_state().model_dump()
+    states = []
+    for i in range(args.orders):
+        st = copy.deepcopy(base)
+        st["order_details"]["order_id"] = f"order_{i:06d}"
+        states.append(st)
+
+    if args.shards:
+        from scripts.shard_runner import run_sharded
+        report = run_sharded(states, workers=args.shards, concurrency=args.concurrency,
+                             dispatch_window=args.dispatch_window, keep_orders=False)
+    else:
+        report = run_orders(states, concurrency=args.concurrency, dispatch_window=args.dispatch_window)
+    print(f"orders={report.total} ok={report.succeeded} failed={report.failed} "
+          f"elapsed={report.elapsed_s:.3f}s throughput={report.orders_per_sec:.1f} orders/s")
+    if args.metrics_out:
+        get_metrics().write_prometheus(args.metrics_out)
@@ -0,0 +1,391 @@
+from __future__ import annotations
+import copy
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
+
+from scripts.core_datastructures import AgentState, ContainerAgentInput, PromotionGuardInput
+from scripts import langgraph_flow as flow
+from scripts import agent_registry, tools
+from scripts.audit_store import AuditStore, get_audit_store, set_audit_store
+from scripts.ttl_cache import get_weather_cache
+from scripts.merchant_store import get_merchant_store
+from scripts.metrics import get_metrics
+
+
+# =========================================================
+# 1) Timing helpers
+# =========================================================
+
+def _percentiles(samples_ns: List[int]) -> Dict[str, float]:
+    """Summary in microseconds: mean and p50/p90/p99/max."""
+    if not samples_ns:
+        return {}
+    xs = sorted(samples_ns)
+    def pct(p: float) -> float:
+        return xs[min(len(xs) - 1, int(round(p / 100 * (len(xs) - 1))))] / 1000
+    return {
+        "n": len(xs),
+        "mean_us": sum(xs) / len(xs) / 1000,
+        "p50_us": pct(50),
+        "p90_us": pct(90),
+        "p99_us": pct(99),
+        "max_us": xs[-1] / 1000,
+    }
+
+def _time_calls(fn: Callable[[], Any], iterations: int, warmup: int = 5) -> List[int]:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - t)
+    return samples
+
+
+# =========================================================
+# 2) Scenarios
+#    Overrides applied on top of demo_order_state() to exercise the
+#    different routes through the graph.
+# =========================================================
+
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "demo": {},
+    "merchant_offline": {"merchant_id": "M456"},
+    "clear_weather": {"drop_location": {"lat": 34.05, "lng": -118.24, "city": "Los Angeles"}},
+    "breakdown": {"telemetry": {"sos_flag": True, "speed": 0}},
+    "split_declined": {"order_id": "order_10000", "customer_response": "disagree"},
+    "address_change": {
+        "customer_change_request": {"type": "address_change", "new_address": {"lat": 40.75, "lng": -73.98}},
+        "courier_position": {"lat": 40.74, "lng": -73.99},
+    },
+    "double_charge": {"payment": {"transactions": [{"id": "tx_abc", "amount": 249.0}, {"id": "tx_def", "amount": 249.0}]}},
+}
+
+DEFAULT_MIX: Dict[str, float] = {
+    "demo": 0.40,
+    "clear_weather": 0.20,
+    "double_charge": 0.10,
+    "split_declined": 0.10,
+    "address_change": 0.10,
+    "breakdown": 0.05,
+    "merchant_offline": 0.05,
+}
+
+def scenario_state(name: str) -> Dict[str, Any]:
+    st = flow.demo_order_state().model_dump()
+    st["order_details"].update(copy.deepcopy(SCENARIOS[name]))
+    return st
+
+def scenario_mix(n: int, mix: Optional[Dict[str, float]] = None, seed: int = 0) -> List[Tuple[str, Dict[str, Any]]]:
+    mix = mix or DEFAULT_MIX
+    rng = random.Random(seed)
+    names = rng.choices(list(mix), weights=list(mix.values()), k=n)
+    return [(name, scenario_state(name)) for name in names]
+
+
+# =========================================================
+# 3) Benchmarks
+# =========================================================
+
+def _tool_cases(state: AgentState) -> Dict[str, Tuple[Any, Dict[str, Any]]]:
+    """tool name -> (tool, kwargs) built from a state that has run the full flow."""
+    builders = {
+        "payment_agent": (tools.payment_agent, flow._payment_kwargs),
+        "merchant_status_agent": (tools.merchant_status_agent, flow._merchant_kwargs),
+        "delivery_dispatch_agent": (tools.delivery_dispatch_agent, flow._dispatch_kwargs),
+        "reputation_agent": (tools.reputation_agent, flow._reputation_kwargs),
+        "capacity_agent": (tools.capacity_agent, flow._capacity_kwargs),
+        "split_delivery_agent": (tools.split_delivery_agent, flow._split_kwargs),
+        "weather_agent": (tools.weather_agent, flow._weather_kwargs),
+        "courier_breakdown_agent": (tools.courier_breakdown_agent, flow._breakdown_kwargs),
+        "reroute_agent": (tools.reroute_agent, flow._reroute_kwargs),
+        "customer_change_agent": (tools.customer_change_agent, flow._customer_change_kwargs),
+        "policy_guard": (tools.policy_guard, flow._policy_kwargs),
+        "notify_agent": (tools.notify_agent, flow._notify_kwargs),
+        "audit_agent": (tools.audit_agent, flow._audit_kwargs),
+    }
+    cases = {name: (t, build(state)) for name, (t, build) in builders.items()}
+    courier_id = (state.order_details.get("courier") or {}).get("id") or "courier_B"
+    cases["container_agent"] = (tools.container_agent, {"inputs": {"courier_id": courier_id, "item_type": "perishable"}})
+    cases["promotion_guard"] = (tools.promotion_guard, {"inputs": {"promotion_code": "PERISHABLE_PROMO", "proposed_action": "reroute"}})
+    return cases
+
+def _bare_call(tool_obj, kwargs: Dict[str, Any]) -> Callable[[], Any]:
+    if tool_obj is tools.container_agent:
+        model = ContainerAgentInput(**kwargs["inputs"])
+        return lambda: tool_obj.func(model)
+    if tool_obj is tools.promotion_guard:
+        model = PromotionGuardInput(**kwargs["inputs"])
+        return lambda: tool_obj.func(model)
+    return lambda: tool_obj.func(**kwargs)
+
+def _releasing(name: str, call: Callable[[], Any]) -> Callable[[], Any]:
+    """Dispatch and reroute claim a courier per call; hand it back so every call sees the same fleet."""
+    if name not in ("delivery_dispatch_agent", "reroute_agent"):
+        return call
+
+    def run():
+        updates = call()["updates"]
+        tools._release_courier((updates.get("courier") or {}).get("id")
+                               or (updates.get("reroute") or {}).get("new_courier_id"))
+    return run
+
+def bench_tools(iterations: int = 2000) -> Dict[str, Any]:
+    """
+    Per-tool latency:
+    - invoke -> LangChain's tool.invoke (the SYNAPSE_STRICT_AGENTS path)
+    - direct -> agent_registry.call_agent (what the graph does by default)
+    - bare   -> the tool's func with kwargs, no LangChain layer
+    """
+    final = flow.build_graph().invoke(flow.demo_order_state().model_dump())
+    state = AgentState.model_validate(final)
+    out: Dict[str, Any] = {}
+    for name, (tool_obj, kwargs) in _tool_cases(state).items():
+        invoke = _percentiles(_time_calls(_releasing(name, lambda: tool_obj.invoke(kwargs)), iterations))
+        bare = _percentiles(_time_calls(_releasing(name, _bare_call(tool_obj, kwargs)), iterations))
+        out[name] = {
+            "invoke": invoke,
+            "bare": bare,
+            "invoke_overhead_us": invoke["p50_us"] - bare["p50_us"],
+        }
+        if name in agent_registry.AGENTS:
+            direct = _percentiles(_time_calls(
+                _releasing(name, lambda: agent_registry.call_agent(name, kwargs, strict=False)), iterations))
+            out[name]["direct"] = direct
+            out[name]["direct_saving_us"] = invoke["p50_us"] - direct["p50_us"]
+    return out
+
+def bench_compile(iterations: int = 20, **build_kwargs) -> Dict[str, Any]:
+    return _percentiles(_time_calls(lambda: flow.build_graph(**build_kwargs), iterations, warmup=1))
+
+def bench_invoke(iterations: int = 300, mix: Optional[Dict[str, float]] = None,
+                 seed: int = 0, **build_kwargs) -> Dict[str, Any]:
+    """End-to-end invoke latency for the demo order and for a weighted scenario mix."""
+    app = flow.build_graph(**build_kwargs)
+    demo = scenario_state("demo")
+    demos = iter([copy.deepcopy(demo) for _ in range(iterations + 5)])   # + _time_calls' warmup
+    results: Dict[str, Any] = {
+        "demo": _percentiles(_time_calls(lambda: app.invoke(next(demos)), iterations)),
+    }
+
+    by_scenario: Dict[str, List[int]] = {}
+    all_samples: List[int] = []
+    for name, st in scenario_mix(iterations, mix, seed):
+        t = time.perf_counter_ns()
+        app.invoke(st)
+        dt = time.perf_counter_ns() - t
+        by_scenario.setdefault(name, []).append(dt)
+        all_samples.append(dt)
+    results["mix"] = _percentiles(all_samples)
+    results["mix_by_scenario"] = {name: _percentiles(xs) for name, xs in sorted(by_scenario.items())}
+    return results
+
+def bench_dataset(path: str, iterations: int = 300, seed: int = 0, **build_kwargs) -> Dict[str, Any]:
+    """End-to-end invoke latency over random orders of a dataset.synthetic directory."""
+    from scripts.data_sources import SyntheticDataSource, set_data_source
+
+    source = SyntheticDataSource(path)
+    previous = set_data_source(source)
+    try:
+        app = flow.build_graph(**build_kwargs)
+        rng = random.Random(seed)
+        ds = source.dataset
+        states = [{"order_details": ds.order_details(ds.order_id(rng.randrange(ds.n_orders)))} for _ in range(iterations)]
+        samples = []
+        for st in states:
+            t = time.perf_counter_ns()
+            app.invoke(st)
+            samples.append(time.perf_counter_ns() - t)
+        return _percentiles(samples)
+    finally:
+        set_data_source(previous)
+
+
+# Runs in a fresh interpreter: everything is measured cold.
+_STARTUP_PROBE = """
+import json, time
+t0 = time.perf_counter_ns()
+from scripts import langgraph_flow as flow
+t1 = time.perf_counter_ns()
+app = flow.get_app(**json.loads(%r))
+t2 = time.perf_counter_ns()
+app.invoke(flow.demo_order_state().model_dump())
+t3 = time.perf_counter_ns()
+app.invoke(flow.demo_order_state().model_dump())
+t4 = time.perf_counter_ns()
+print(json.dumps({"import": t1 - t0, "compile": t2 - t1, "first_invoke": t3 - t2, "warm_invoke": t4 - t3}))
+"""
+
+def bench_startup(runs: int = 5, **build_kwargs) -> Dict[str, Any]:
+    """
+    Cold-start cost per phase, each run in a new process.
+    - import       -> import scripts.langgraph_flow
+    - compile      -> first get_app() (includes importing langgraph)
+    - first_invoke -> first order (includes importing the agents)
+    - process      -> wall time of the whole process, interpreter start included
+    With auditing on, records of the probe orders go to a temporary directory.
+    """
+    code = _STARTUP_PROBE % json.dumps(build_kwargs)
+    samples: Dict[str, List[int]] = {}
+    with tempfile.TemporaryDirectory(prefix="synapse-bench-audit-") as tmp:
+        env = dict(os.environ)
+        if env.get("SYNAPSE_AUDIT_DIR"):
+            env["SYNAPSE_AUDIT_DIR"] = tmp
+        for _ in range(runs):
+            t = time.perf_counter_ns()
+            out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                                 cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env)
+            samples.setdefault("process", []).append(time.perf_counter_ns() - t)
+            for phase, ns in json.loads(out.stdout.strip().splitlines()[-1]).items():
+                samples.setdefault(phase, []).append(ns)
+    return {phase: _percentiles(xs) for phase, xs in samples.items()}
+
+
+# =========================================================
+# 4) Recording & comparison
+# =========================================================
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+@contextmanager
+def scratch_audit_store() -> Iterator[Optional[AuditStore]]:
+    """
+    Send audit records to a temporary store for the duration, so benchmark
+    orders don't land in the real one; nothing is installed when auditing
+    is off (no SYNAPSE_AUDIT_DIR, or SYNAPSE_AUDIT=0). The env default
+    store is used again after.
+    """
+    if get_audit_store() is None:
+        yield None
+        return
+    with tempfile.TemporaryDirectory(prefix="synapse-bench-audit-") as tmp:
+        store = AuditStore(tmp)
+        set_audit_store(store)
+        try:
+            yield store
+        finally:
+            set_audit_store(None)
+
+def run_suite(tool_iterations: int = 2000, invoke_iterations: int = 300,
+              dataset: Optional[str] = None, startup_runs: int = 5, **build_kwargs) -> Dict[str, Any]:
+    with scratch_audit_store():
+        return _run_suite(tool_iterations, invoke_iterations, dataset, startup_runs, **build_kwargs)
+
+def _run_suite(tool_iterations: int, invoke_iterations: int, dataset: Optional[str], startup_runs: int,
+               **build_kwargs) -> Dict[str, Any]:
+    report: Dict[str, Any] = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "build_kwargs": build_kwargs,
+        },
+        "startup": bench_startup(startup_runs, **build_kwargs),
+        "tools": bench_tools(tool_iterations),
+        "compile": bench_compile(**build_kwargs),
+        "invoke": bench_invoke(invoke_iterations, **build_kwargs),
+    }
+    if dataset:
+        report["dataset"] = bench_dataset(dataset, invoke_iterations, **build_kwargs)
+    report["weather_cache"] = get_weather_cache().stats()
+    report["merchant_store"] = get_merchant_store().stats()
+    report["metrics"] = get_metrics().snapshot()
+    return report
+
+def _flatten(report: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    out: Dict[str, float] = {}
+    for k, v in report.items():
+        if k == "meta":
+            continue
+        key = f"{prefix}.{k}" if prefix else k
+        if isinstance(v, dict):
+            out.update(_flatten(v, key))
+        elif isinstance(v, (int, float)) and key.endswith("p50_us"):
+            out[key] = float(v)
+    return out
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.10) -> List[Tuple[str, float, float, float]]:
+    """(metric, old_us, new_us, ratio) for every p50 that moved by more than threshold."""
+    old, new = _flatten(baseline), _flatten(current)
+    changes = []
+    for key in sorted(old.keys() & new.keys()):
+        if old[key] <= 0:
+            continue
+        ratio = new[key] / old[key]
+        if abs(ratio - 1) > threshold:
+            changes.append((key, old[key], new[key], ratio))
+    return changes
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Per-agent and end-to-end graph benchmarks.")
+    parser.add_argument("--out", default="bench_results.json", help="where to write the JSON report")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative p50 change to report")
+    parser.add_argument("--tool-iterations", type=int, default=2000)
+    parser.add_argument("--invoke-iterations", type=int, default=300)
+    parser.add_argument("--dataset", help="dataset.synthetic directory for the large-scale run")
+    parser.add_argument("--startup-runs", type=int, default=5, help="cold processes for the startup benchmark")
+    parser.add_argument("--startup-only", action="store_true", help="only measure cold-start cost and print it")
+    parser.add_argument("--parallel-checks", action="store_true")
+    parser.add_argument("--strict-state", action="store_true")
+    args = parser.parse_args()
+
+    build_kwargs: Dict[str, Any] = {}
+    if args.parallel_checks:
+        build_kwargs["parallel_checks"] = True
+    if args.strict_state:
+        build_kwargs["strict_state"] = True
+
+    if args.startup_only:
+        for phase, r in bench_startup(args.startup_runs, **build_kwargs).items():
+            print(f"{phase:<14} p50 {r['p50_us'] / 1000:8.1f} ms  max {r['max_us'] / 1000:8.1f} ms")
+        raise SystemExit(0)
+
+    report = run_suite(args.tool_iterations, args.invoke_iterations, args.dataset,
+                       args.startup_runs, **build_kwargs)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"{'tool':<26}{'invoke p50':>12}{'direct p50':>12}{'bare p50':>12}{'overhead':>12}  (us)")
+    for name, r in report["tools"].items():
+        direct = f"{r['direct']['p50_us']:>12.1f}" if "direct" in r else f"{'-':>12}"
+        print(f"{name:<26}{r['invoke']['p50_us']:>12.1f}{direct}{r['bare']['p50_us']:>12.1f}{r['invoke_overhead_us']:>12.1f}")
+    print(f"cold start p50: {report['startup']['process']['p50_us'] / 1000:.0f} ms "
+          f"(import {report['startup']['import']['p50_us'] / 1000:.0f} ms, "
+          f"compile {report['startup']['compile']['p50_us'] / 1000:.0f} ms)")
+    print(f"compile p50: {report['compile']['p50_us'] / 1000:.2f} ms")
+    for label in ("demo", "mix"):
+        r = report["invoke"][label]
+        print(f"invoke {label:<5} p50 {r['p50_us'] / 1000:.2f} ms  p90 {r['p90_us'] / 1000:.2f} ms  p99 {r['p99_us'] / 1000:.2f} ms")
+    if "dataset" in report:
+        r = report["dataset"]
+        print(f"invoke dataset p50 {r['p50_us'] / 1000:.2f} ms  p99 {r['p99_us'] / 1000:.2f} ms")
+    print(f"wrote {os.path.abspath(args.out)}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        changes = compare(baseline, report, args.threshold)
+        if not changes:
+            print(f"no p50 moved by more than {args.threshold:.0%} vs {args.compare}")
+        for key, old_us, new_us, ratio in changes:
+            tag = "REGRESSION" if ratio > 1 else "improvement"
+            print(f"{tag:<12}{key}: {old_us:.1f}us -> {new_us:.1f}us (x{ratio:.2f})")
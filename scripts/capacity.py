@@ -0,0 +1,286 @@
+from __future__ import annotations
+import math
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+from pydantic import BaseModel, Field
+
+
+# =========================================================
+# Capacity engine shared by CapacityAgent and SplitDeliveryAgent.
+#   - every item is expanded to qty units of (vol_l, weight_kg)
+#   - a vehicle is a 3-D bin: volume, weight and (optional) unit count
+#   - first-fit-decreasing (vectorized over open bins) always runs;
+#     orders with few units are then solved exactly by branch & bound
+#     under a node budget, so a batch of huge carts stays bounded
+# =========================================================
+
+EXACT_MAX_UNITS = 14
+NODE_BUDGET = 50_000
+
+Limits = Tuple[float, float, float]  # vol_cap_l, weight_cap_kg, max_units
+
+
+class PackingPlan(BaseModel):
+    """How an order's units load into vehicles of one capacity."""
+    loads: List[Dict[str, int]] = Field(default_factory=list)   # sku -> qty per vehicle
+    unpackable: Dict[str, int] = Field(default_factory=dict)    # units bigger than an empty vehicle
+    vehicles_needed: int = 0
+    lower_bound: int = 0
+    exact: bool = False                                           # vehicles_needed is proven minimal
+
+
+def vehicle_limits(vehicle_capacity: Optional[Dict[str, Any]]) -> Optional[Limits]:
+    """(vol, weight, units) caps, or None when the vehicle is unknown/unusable."""
+    vehicle_capacity = vehicle_capacity or {}
+    vol = float(vehicle_capacity.get("vol_cap_l") or 0)
+    weight = float(vehicle_capacity.get("weight_cap_kg") or 0)
+    if vol <= 0 or weight <= 0:
+        return None
+    return vol, weight, float(vehicle_capacity.get("max_units") or math.inf)
+
+
+def expand_units(items: Sequence[Dict[str, Any]]) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """(sku per unit, vol per unit, weight per unit) with qty expanded."""
+    qty = np.fromiter((max(0, int(i.get("qty", 1))) for i in items), dtype=np.int64, count=len(items))
+    vol = np.repeat(np.fromiter((float(i.get("vol_l", 0)) for i in items), float, len(items)), qty)
+    weight = np.repeat(np.fromiter((float(i.get("weight_kg", 0)) for i in items), float, len(items)), qty)
+    skus = [i.get("sku") for i, n in zip(items, qty.tolist()) for _ in range(n)]
+    return skus, vol, weight
+
+
+def totals(items: Sequence[Dict[str, Any]]) -> Tuple[float, float, int]:
+    vol = weight = 0.0
+    units = 0
+    for i in items:
+        q = max(0, int(i.get("qty", 1)))
+        vol += float(i.get("vol_l", 0)) * q
+        weight += float(i.get("weight_kg", 0)) * q
+        units += q
+    return vol, weight, units
+
+
+def utilisation(items: Sequence[Dict[str, Any]], limits: Limits) -> float:
+    """Fraction of the tightest dimension used (> 1.0 means it doesn't fit)."""
+    vol, weight, units = totals(items)
+    return max(vol / limits[0], weight / limits[1], units / limits[2])
+
+
+def _counts(skus: Sequence[str], idx: Sequence[int]) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for u in idx:
+        out[skus[u]] = out.get(skus[u], 0) + 1
+    return out
+
+
+def _size(vol: np.ndarray, weight: np.ndarray, limits: Limits) -> np.ndarray:
+    return np.maximum(vol / limits[0], weight / limits[1])
+
+
+# ---- heuristics ----
+def _fit(room: np.ndarray, x: float) -> np.ndarray:
+    """How many units of size x fit into each remaining room."""
+    if x <= 0:
+        return np.full(room.shape, np.inf)
+    return np.floor(room / x + 1e-9)
+
+
+def _ffd(vol: np.ndarray, weight: np.ndarray, limits: Limits, order: np.ndarray,
+         max_bins: Optional[int] = None) -> np.ndarray:
+    """
+    First-fit-decreasing; returns bin per unit (-1 = not placed).
+    Runs of identical units (one item's qty) are placed in one vectorized
+    step, which is exactly what unit-by-unit first fit would do.
+    """
+    cap = max_bins if max_bins is not None else len(order)
+    rem_v = np.full(cap, limits[0])
+    rem_w = np.full(cap, limits[1])
+    rem_n = np.full(cap, limits[2])
+    per_bin_limit = np.array([limits[0]]), np.array([limits[1]])
+    opened = 0
+    assign = np.full(vol.size, -1, dtype=np.int64)
+    ordl = order.tolist()
+    i = 0
+    while i < len(ordl):
+        u = ordl[i]
+        v, w = vol[u], weight[u]
+        j = i + 1
+        while j < len(ordl) and ordl[j] == ordl[j - 1] + 1 and vol[ordl[j]] == v and weight[ordl[j]] == w:
+            j += 1
+        run = ordl[i:j]
+        i = j
+
+        left = len(run)
+        bins: List[int] = []
+        takes: List[int] = []
+        if opened:
+            room = np.minimum(np.minimum(_fit(rem_v[:opened], v), _fit(rem_w[:opened], w)), rem_n[:opened])
+            np.minimum(room, left, out=room)    # a zero-size unit fits inf times: keep cumsum finite
+            before = np.cumsum(room) - room
+            take = np.clip(left - before, 0, room)
+            hit = np.flatnonzero(take > 0)
+            if hit.size:
+                t = take[hit].astype(np.int64)
+                bins.extend(hit.tolist())
+                takes.extend(t.tolist())
+                left -= int(t.sum())
+        if left:
+            fresh = min(_fit(per_bin_limit[0], v)[0], _fit(per_bin_limit[1], w)[0], limits[2])
+            while left and fresh >= 1 and opened < cap:
+                t = int(min(left, fresh))
+                bins.append(opened)
+                takes.append(t)
+                opened += 1
+                left -= t
+        for b, t in zip(bins, takes):
+            rem_v[b] -= v * t
+            rem_w[b] -= w * t
+            rem_n[b] -= t
+        placed = np.repeat(np.asarray(bins, dtype=np.int64), takes)
+        assign[run[:placed.size]] = placed
+    return assign
+
+
+# ---- exact ----
+def _exact_bins(vol: np.ndarray, weight: np.ndarray, limits: Limits, order: np.ndarray,
+                best: int, lower: int) -> Tuple[Optional[List[int]], bool]:
+    """
+    Branch & bound for fewer than `best` bins.
+    Returns (better assignment or None, search completed within budget).
+    """
+    v = vol[order].tolist()
+    w = weight[order].tolist()
+    n = len(v)
+    bins_v: List[float] = []
+    bins_w: List[float] = []
+    bins_n: List[float] = []
+    assign = [0] * n
+    found: List[Optional[List[int]]] = [None]
+    budget = [NODE_BUDGET]
+    target = [best]
+
+    def dfs(k: int) -> bool:
+        budget[0] -= 1
+        if budget[0] < 0:
+            return True
+        if len(bins_v) >= target[0]:
+            return False
+        if k == n:
+            target[0] = len(bins_v)
+            found[0] = assign.copy()
+            return target[0] <= lower
+        seen = set()
+        for b in range(len(bins_v)):
+            key = (bins_v[b], bins_w[b], bins_n[b])
+            if key in seen or bins_v[b] < v[k] or bins_w[b] < w[k] or bins_n[b] < 1:
+                continue
+            seen.add(key)
+            bins_v[b] -= v[k]; bins_w[b] -= w[k]; bins_n[b] -= 1
+            assign[k] = b
+            stop = dfs(k + 1)
+            bins_v[b] += v[k]; bins_w[b] += w[k]; bins_n[b] += 1
+            if stop:
+                return True
+        if len(bins_v) + 1 < target[0]:
+            bins_v.append(limits[0] - v[k]); bins_w.append(limits[1] - w[k]); bins_n.append(limits[2] - 1)
+            assign[k] = len(bins_v) - 1
+            stop = dfs(k + 1)
+            bins_v.pop(); bins_w.pop(); bins_n.pop()
+            if stop:
+                return True
+        return False
+
+    dfs(0)
+    complete = budget[0] >= 0
+    if found[0] is None:
+        return None, complete
+    out = [0] * vol.size
+    for k, u in enumerate(order.tolist()):
+        out[u] = found[0][k]
+    return out, complete
+
+
+def _best_single_load(vol: np.ndarray, weight: np.ndarray, limits: Limits, order: np.ndarray) -> List[int]:
+    """Exact max-fill subset for one vehicle (value = normalised size)."""
+    size = _size(vol, weight, limits)[order].tolist()
+    v = vol[order].tolist()
+    w = weight[order].tolist()
+    n = len(v)
+    suffix = [0.0] * (n + 1)
+    for k in range(n - 1, -1, -1):
+        suffix[k] = suffix[k + 1] + size[k]
+    best_val = [-1.0]
+    best_set: List[List[int]] = [[]]
+    chosen: List[int] = []
+    budget = [NODE_BUDGET]
+
+    def dfs(k: int, rv: float, rw: float, rn: float, val: float) -> None:
+        budget[0] -= 1
+        if budget[0] < 0 or val + suffix[k] <= best_val[0]:
+            return
+        if k == n:
+            best_val[0] = val
+            best_set[0] = chosen.copy()
+            return
+        if v[k] <= rv and w[k] <= rw and rn >= 1:
+            chosen.append(k)
+            dfs(k + 1, rv - v[k], rw - w[k], rn - 1, val + size[k])
+            chosen.pop()
+        dfs(k + 1, rv, rw, rn, val)
+
+    dfs(0, limits[0], limits[1], limits[2], 0.0)
+    return [int(order[k]) for k in best_set[0]]
+
+
+# ---- public API ----
+def load_one(items: Sequence[Dict[str, Any]], limits: Limits) -> Tuple[Dict[str, int], Dict[str, int]]:
+    """
+    Fill one vehicle as fully as possible.
+    Returns (loaded sku -> qty, overflow sku -> qty).
+    """
+    skus, vol, weight = expand_units(items)
+    if not skus:
+        return {}, {}
+    if vol.sum() <= limits[0] and weight.sum() <= limits[1] and len(skus) <= limits[2]:
+        return _counts(skus, range(len(skus))), {}
+    order = np.argsort(-_size(vol, weight, limits), kind="stable")
+    if len(skus) <= EXACT_MAX_UNITS:
+        loaded = set(_best_single_load(vol, weight, limits, order))
+    else:
+        loaded = set(np.flatnonzero(_ffd(vol, weight, limits, order, max_bins=1) == 0).tolist())
+    rest = [u for u in range(len(skus)) if u not in loaded]
+    return _counts(skus, sorted(loaded)), _counts(skus, rest)
+
+
+def pack(items: Sequence[Dict[str, Any]], limits: Limits, exact_max_units: int = EXACT_MAX_UNITS) -> PackingPlan:
+    """Fewest vehicles of this capacity that carry the whole order."""
+    skus, vol, weight = expand_units(items)
+    too_big = (vol > limits[0]) | (weight > limits[1])
+    unpackable = _counts(skus, np.flatnonzero(too_big).tolist())
+    keep = np.flatnonzero(~too_big)
+    if not keep.size:
+        return PackingPlan(unpackable=unpackable, exact=True)
+
+    kv, kw = vol[keep], weight[keep]
+    lower = max(1, math.ceil(kv.sum() / limits[0] - 1e-9), math.ceil(kw.sum() / limits[1] - 1e-9),
+                math.ceil(keep.size / limits[2]) if limits[2] != math.inf else 1)
+    order = np.argsort(-_size(kv, kw, limits), kind="stable")
+    assign = _ffd(kv, kw, limits, order)
+    used = int(assign.max()) + 1
+    exact = used == lower
+    if not exact and keep.size <= exact_max_units:
+        better, complete = _exact_bins(kv, kw, limits, order, used, lower)
+        if better is not None:
+            assign = np.asarray(better)
+            used = int(assign.max()) + 1
+        exact = used == lower or complete
+
+    loads: List[Dict[str, int]] = [{} for _ in range(used)]
+    for u, b in zip(keep.tolist(), assign.tolist()):
+        loads[b][skus[u]] = loads[b].get(skus[u], 0) + 1
+    return PackingPlan(loads=loads, unpackable=unpackable, vehicles_needed=used, lower_bound=lower, exact=exact)
+
+
+def pack_many(carts: Sequence[Sequence[Dict[str, Any]]], limits: Limits) -> List[PackingPlan]:
+    """pack() over a batch; each cart is capped by EXACT_MAX_UNITS/NODE_BUDGET."""
+    return [pack(items, limits) for items in carts]
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+from scripts.audit_trail import AUDIT_RING, TRAIL_KEY, new_trail, replay
+
+
+# =========================================================
+# 1) Order checkpoints (SQLite)
+#    One row per in-flight order plus the deltas written since its last
+#    full snapshot:
+#      checkpoints(order_id, phase, seq, base_seq, status, updated, base)
+#      deltas(order_id, seq, phase, updated, delta)
+#    save() runs at every node exit. The first save of a run, and every
+#    COMPACT_EVERY-th after it, writes a full snapshot (zlib'd JSON of
+#    order_details + audit_log). The others write only the audit_log
+#    entries the node appended and the top-level order keys named in
+#    their updates_keys (plus _phase). signals and the _audit trail are
+#    not stored: load() replays the entries into them, as
+#    _merge_envelope did.
+#    Where the chain stands is kept in order_details["_ckpt"], so saving
+#    needs no read and any worker can pick up an order it loads. A delta
+#    is a single INSERT; the checkpoints row only changes on snapshots.
+#    One order is expected to run in one worker at a time.
+#    Messages are not checkpointed; resumed states start with none.
+# =========================================================
+
+COMPACT_EVERY = 16
+CKPT_KEY = "_ckpt"
+_ALWAYS_TOUCHED = frozenset({"_phase"})
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    order_id TEXT PRIMARY KEY,
+    phase TEXT,
+    seq INTEGER NOT NULL,
+    base_seq INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    updated REAL NOT NULL,
+    base BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deltas (
+    order_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    phase TEXT,
+    updated REAL NOT NULL,
+    delta BLOB NOT NULL,
+    PRIMARY KEY (order_id, seq)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS checkpoints_status ON checkpoints (status);
+"""
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+@contextmanager
+def _transaction(conn: sqlite3.Connection) -> Iterator[sqlite3.Connection]:
+    conn.execute("BEGIN")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+class Checkpointer:
+    def __init__(self, path: str, compact_every: int = COMPACT_EVERY, keep_done: bool = False):
+        """
+        - path -> SQLite file shared by every worker on the host
+        - keep_done=False -> a finished order's rows are deleted (the audit
+          store has the final record); True keeps them as status "done"
+        """
+        self.path = path
+        self.compact_every = max(1, compact_every)
+        self.keep_done = keep_done
+        self._local = threading.local()
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")   # WAL + NORMAL: durable across crashes, one fsync per WAL checkpoint
+            self._local.conn = conn
+        return conn
+
+    # ---- writing ----
+    def save(self, order: Dict[str, Any], audit_log: List[Dict[str, Any]], done: bool = False) -> None:
+        """Checkpoint an order at a node boundary (called from the node wrapper)."""
+        order_id = order.get("order_id")
+        if not order_id:
+            return
+        order_id = str(order_id)
+        conn = self._conn()
+        if done and not self.keep_done:
+            with _transaction(conn):
+                conn.execute("DELETE FROM deltas WHERE order_id = ?", (order_id,))
+                conn.execute("DELETE FROM checkpoints WHERE order_id = ?", (order_id,))
+            order.pop(CKPT_KEY, None)
+            return
+
+        trail = order.get(TRAIL_KEY)
+        hops = trail["hops"] if trail else 0
+        status = "done" if done else "active"
+        phase = order.get("_phase")
+        now = time.time()
+        ck = order.get(CKPT_KEY)
+        touched = self._touched(ck, hops, audit_log) if ck is not None else None
+        if touched is None or ck["seq"] + 1 - ck["base"] >= self.compact_every:
+            seq = ck["seq"] + 1 if ck is not None else 1
+            order[CKPT_KEY] = {"seq": seq, "base": seq, "hops": hops}
+            base = zlib.compress(_dumps({"order_details": order, "audit_log": audit_log}), 1)
+            with _transaction(conn):
+                conn.execute("DELETE FROM deltas WHERE order_id = ?", (order_id,))
+                conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?, ?)",
+                             (order_id, phase, seq, seq, status, now, base))
+            return
+
+        keys, entries = touched
+        seq = ck["seq"] + 1
+        delta = {
+            "set": {k: order[k] for k in keys if k in order},
+            "del": [k for k in keys if k not in order],
+            "log": entries,
+        }
+        order[CKPT_KEY] = {"seq": seq, "base": ck["base"], "hops": hops}
+        row = (order_id, seq, phase, now, _dumps(delta))
+        if not done:
+            conn.execute("INSERT OR REPLACE INTO deltas VALUES (?, ?, ?, ?, ?)", row)
+            return
+        with _transaction(conn):
+            conn.execute("INSERT OR REPLACE INTO deltas VALUES (?, ?, ?, ?, ?)", row)
+            conn.execute("UPDATE checkpoints SET status = 'done' WHERE order_id = ?", (order_id,))
+
+    @staticmethod
+    def _touched(ck: Dict[str, Any], hops: int, audit_log: List[Dict[str, Any]]):
+        """(top-level keys, new audit_log entries) since the last save; None -> snapshot."""
+        new = hops - ck["hops"]
+        if new < 0 or new > len(audit_log):
+            return None
+        entries = audit_log[len(audit_log) - new:] if new else []
+        keys: Set[str] = set(_ALWAYS_TOUCHED)
+        for entry in entries:
+            keys.update(entry.get("updates_keys") or ())
+        return keys, entries
+
+    def delete(self, order_id: str) -> None:
+        with _transaction(self._conn()) as conn:
+            conn.execute("DELETE FROM deltas WHERE order_id = ?", (order_id,))
+            conn.execute("DELETE FROM checkpoints WHERE order_id = ?", (order_id,))
+
+    # ---- reading ----
+    def load(self, order_id: str) -> Optional[Dict[str, Any]]:
+        """The order's latest state ({"order_details", "audit_log", "messages"}), or None."""
+        conn = self._conn()
+        with _transaction(conn):      # one read transaction: base and deltas from the same commit
+            row = conn.execute("SELECT base_seq, base FROM checkpoints WHERE order_id = ?", (order_id,)).fetchone()
+            if row is None:
+                return None
+            base_seq, base = row
+            deltas = conn.execute("SELECT delta FROM deltas WHERE order_id = ? AND seq > ? ORDER BY seq",
+                                  (order_id, base_seq)).fetchall()
+        state = json.loads(zlib.decompress(base))
+        order, log = state["order_details"], state["audit_log"]
+        for (raw,) in deltas:
+            delta = json.loads(raw)
+            order.update(delta["set"])
+            for k in delta["del"]:
+                order.pop(k, None)
+            signals = order.get("signals")
+            if not isinstance(signals, dict):
+                signals = order["signals"] = {}
+            for entry in delta["log"]:
+                signals.update(entry.get("signals") or {})
+            replay(order.setdefault(TRAIL_KEY, new_trail()), delta["log"])
+            log.extend(delta["log"])
+        if len(log) > AUDIT_RING:
+            del log[:len(log) - AUDIT_RING]
+        state["messages"] = []
+        return state
+
+    def pending(self, older_than_s: float = 0.0) -> List[Dict[str, Any]]:
+        """Orders checkpointed but not finished: parked, or left behind by a dead worker."""
+        rows = self._conn().execute(
+            "SELECT c.order_id, COALESCE(d.phase, c.phase), COALESCE(d.seq, c.seq), COALESCE(d.updated, c.updated) "
+            "FROM checkpoints c LEFT JOIN deltas d ON d.order_id = c.order_id "
+            "AND d.seq = (SELECT MAX(seq) FROM deltas WHERE order_id = c.order_id) "
+            "WHERE c.status = 'active'").fetchall()
+        horizon = time.time() - older_than_s
+        return [{"order_id": o, "phase": p, "seq": s, "updated": u}
+                for o, p, s, u in sorted(rows, key=lambda r: r[3]) if u <= horizon]
+
+    def stats(self) -> Dict[str, int]:
+        conn = self._conn()
+        out = {status: n for status, n in conn.execute("SELECT status, COUNT(*) FROM checkpoints GROUP BY status")}
+        out["deltas"] = conn.execute("SELECT COUNT(*) FROM deltas").fetchone()[0]
+        return out
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# =========================================================
+# 2) Process-wide checkpointer
+#    - SYNAPSE_CHECKPOINT_DB -> SQLite path; unset -> no checkpointing
+# =========================================================
+
+_CHECKPOINTER: Optional[Checkpointer] = None
+_CHECKPOINTER_LOCK = threading.Lock()
+
+def get_checkpointer() -> Optional[Checkpointer]:
+    global _CHECKPOINTER
+    if _CHECKPOINTER is None:
+        path = os.getenv("SYNAPSE_CHECKPOINT_DB")
+        if not path:
+            return None
+        with _CHECKPOINTER_LOCK:
+            if _CHECKPOINTER is None:
+                _CHECKPOINTER = Checkpointer(path)
+    return _CHECKPOINTER
+
+def set_checkpointer(checkpointer: Optional[Checkpointer]) -> None:
+    global _CHECKPOINTER
+    with _CHECKPOINTER_LOCK:
+        _CHECKPOINTER = checkpointer
+
+_INHERITED: List[threading.local] = []
+
+def _reconnect_after_fork() -> None:
+    """
+    In a forked child: SQLite connections must not cross fork(), so the
+    process-wide checkpointer (which compiled graphs may hold) drops the
+    parent's and opens its own on next use. The parent's are kept
+    referenced, never used or closed, in _INHERITED.
+    """
+    global _CHECKPOINTER_LOCK
+    _CHECKPOINTER_LOCK = threading.Lock()
+    if _CHECKPOINTER is not None:
+        _INHERITED.append(_CHECKPOINTER._local)
+        _CHECKPOINTER._local = threading.local()
+
+os.register_at_fork(after_in_child=_reconnect_after_fork)
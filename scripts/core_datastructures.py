@@ -1,8 +1,7 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, TypedDict
 from pydantic import BaseModel, ConfigDict, Field, conlist
 from enum import Enum
 from langchain_core.messages import BaseMessage
-from langgraph.graph.message import add_messages
 
 # --- Common Models ---
 class AgentReturnEnvelope(BaseModel):
@@ -71,6 +70,7 @@ class SplitDeliveryInput(BaseModel):
     courier_pool: List[Dict[str, Any]]
     policy_split_rules: Dict[str, Any]
     user_prefs: Dict[str, Any]
+    courier_id: Optional[str] = None  # vehicle the "now" leg is packed into
 
 class WeatherAgentInput(BaseModel): 
         courier_location: str 
@@ -93,18 +93,32 @@ class DeliveryDispatchInput(BaseModel):
     drop_location: Location
     readiness_eta_min: int
     priority_flag: bool
+    # Order requirements used to filter the courier search (all optional)
+    required_vol_l: float = 0.0
+    required_weight_kg: float = 0.0
+    needs_insulated: bool = False
+    exclude_couriers: List[str] = Field(default_factory=list)
+    assigned_courier_id: Optional[str] = None  # pre-solved by a batch window
+
+class DispatchWindowInput(BaseModel):
+    orders: List[DeliveryDispatchInput]
+    courier_pool: Optional[List[str]] = None  # None -> k nearest per order from the index
+    method: str = "auto"  # "hungarian" | "auction" | "auto"
 
 class RerouteInput(BaseModel): 
     reason: str 
     current_courier: Optional[str] = None 
     candidate_pool: Optional[List[Dict[str, Any]]] = None 
     weather_advice: Optional[str] = None 
+    courier_position: Optional[Dict[str, float]] = None  # falls back to the courier index
+    drop_location: Optional[Dict[str, Any]] = None
 
 class CustomerChangeInput(BaseModel):
     request: Dict[str, Any]
     courier_position: Dict[str, float]
     policy_change_rules: Dict[str, Any]
     eta_min: int # Added to help with reroute calculation
+    vehicle_type: Optional[str] = None  # speed profile for the detour ETA
 
 class PolicyGuardInput(BaseModel):
     eta_min: int
@@ -118,6 +132,7 @@ class NotifyAgentInput(BaseModel):
     event: NotificationEvent
     payload: Dict[str, Any]
     target: List[str]
+    courier_id: Optional[str] = None  # released back to dispatch once notified
 
 class AuditAgentInput(BaseModel):
     thoughts: List[str]
@@ -138,4 +153,10 @@ class AgentState(BaseModel):
     messages: List[BaseMessage] = Field(default_factory=list)
     order_details: Dict[str, Any] = Field(default_factory=dict)
     audit_log: List[Dict[str, Any]] = Field(default_factory=list)
-    model_config = ConfigDict(arbitrary_types_allowed=True, extra="allow")
\ No newline at end of file
+    model_config = ConfigDict(arbitrary_types_allowed=True, extra="allow")
+
+class AgentStateDict(TypedDict, total=False):
+    """Unvalidated mirror of AgentState carried between nodes on the fast path."""
+    messages: List[BaseMessage]
+    order_details: Dict[str, Any]
+    audit_log: List[Dict[str, Any]]
@@ -0,0 +1,479 @@
+from __future__ import annotations
+import asyncio
+import json
+import random
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+from dataset.mock_data import MOCK_DATABASE, ORDER_ITEMS_DATA
+
+
+# =========================================================
+# 1) Data-source interface
+#    Agents read couriers, merchants, weather, payments, order items
+#    and promotions through this interface instead of the raw dicts.
+#    Sync lookups are required; the async ones default to the sync
+#    call and are overridden by backends that do real I/O. Bulk gets
+#    let a batch of orders fetch all its records in one call.
+# =========================================================
+
+class DataSource(ABC):
+    """Backend the agents read from. Missing records come back as {} / []."""
+
+    @abstractmethod
+    def get_courier(self, courier_id: Optional[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_merchant(self, merchant_id: Optional[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_weather(self, city: Optional[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_payment(self, order_id: Optional[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_order_items(self, order_id: Optional[str]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_promotion(self, code: Optional[str]) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_couriers(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        """Every (courier_id, record); used to build the courier spatial index."""
+        raise NotImplementedError
+
+    # ---- bulk gets (one call per batch; backends override with one query) ----
+    def bulk_get_couriers(self, courier_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {cid: self.get_courier(cid) for cid in courier_ids}
+
+    def bulk_get_merchants(self, merchant_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {mid: self.get_merchant(mid) for mid in merchant_ids}
+
+    def bulk_get_payments(self, order_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return {oid: self.get_payment(oid) for oid in order_ids}
+
+    def bulk_get_order_items(self, order_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        return {oid: self.get_order_items(oid) for oid in order_ids}
+
+    # ---- async ----
+    async def aget_courier(self, courier_id: Optional[str]) -> Dict[str, Any]:
+        return self.get_courier(courier_id)
+
+    async def aget_merchant(self, merchant_id: Optional[str]) -> Dict[str, Any]:
+        return self.get_merchant(merchant_id)
+
+    async def aget_weather(self, city: Optional[str]) -> Dict[str, Any]:
+        return self.get_weather(city)
+
+    async def aget_payment(self, order_id: Optional[str]) -> Dict[str, Any]:
+        return self.get_payment(order_id)
+
+    async def aget_order_items(self, order_id: Optional[str]) -> List[Dict[str, Any]]:
+        return self.get_order_items(order_id)
+
+    async def aget_promotion(self, code: Optional[str]) -> Dict[str, Any]:
+        return self.get_promotion(code)
+
+    async def abulk_get_couriers(self, courier_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return self.bulk_get_couriers(courier_ids)
+
+    async def abulk_get_merchants(self, merchant_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return self.bulk_get_merchants(merchant_ids)
+
+    async def abulk_get_payments(self, order_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        return self.bulk_get_payments(order_ids)
+
+    async def abulk_get_order_items(self, order_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+        return self.bulk_get_order_items(order_ids)
+
+
+# =========================================================
+# 2) Implementations
+# =========================================================
+
+class InMemoryDataSource(DataSource):
+    """
+    Flat, hash-indexed in-memory store: one dict per entity keyed by id,
+    plus a courier-status index, so every lookup is O(1) regardless of
+    fleet size. Records are stored by reference, not copied.
+    """
+
+    def __init__(self,
+                 couriers: Optional[Dict[str, Dict[str, Any]]] = None,
+                 merchants: Optional[Dict[str, Dict[str, Any]]] = None,
+                 weather: Optional[Dict[str, Dict[str, Any]]] = None,
+                 payments: Optional[Dict[str, Dict[str, Any]]] = None,
+                 order_items: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+                 promotions: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.couriers: Dict[str, Dict[str, Any]] = {}
+        self.merchants: Dict[str, Dict[str, Any]] = dict(merchants or {})
+        self.weather: Dict[str, Dict[str, Any]] = dict(weather or {})
+        self.payments: Dict[str, Dict[str, Any]] = dict(payments or {})
+        self.order_items: Dict[str, List[Dict[str, Any]]] = dict(order_items or {})
+        self.promotions: Dict[str, Dict[str, Any]] = dict(promotions or {})
+        self._couriers_by_status: Dict[str, Set[str]] = defaultdict(set)
+        for cid, rec in (couriers or {}).items():
+            self.upsert_courier(cid, rec)
+
+    @classmethod
+    def from_mock(cls, db: Optional[Dict[str, Any]] = None,
+                  order_items: Optional[Dict[str, Any]] = None) -> "InMemoryDataSource":
+        """Index the in-repo MOCK_DATABASE / ORDER_ITEMS_DATA (or dicts shaped like them)."""
+        db = MOCK_DATABASE if db is None else db
+        order_items = ORDER_ITEMS_DATA if order_items is None else order_items
+        return cls(
+            couriers=db.get("couriers", {}),
+            merchants=db.get("merchants", {}),
+            weather=db.get("weather_service", {}),
+            payments=db.get("payment_gateway", {}),
+            order_items={oid: rec.get("items", []) for oid, rec in order_items.items()},
+            promotions=db.get("promotions", {}),
+        )
+
+    def upsert_courier(self, courier_id: str, record: Dict[str, Any]) -> None:
+        old = self.couriers.get(courier_id)
+        if old is not None:
+            self._couriers_by_status[old.get("status")].discard(courier_id)
+        self.couriers[courier_id] = record
+        self._couriers_by_status[record.get("status")].add(courier_id)
+
+    def courier_ids_with_status(self, status: str) -> Set[str]:
+        return set(self._couriers_by_status.get(status, ()))
+
+    def iter_couriers(self):
+        return iter(list(self.couriers.items()))
+
+    def get_courier(self, courier_id):
+        return self.couriers.get(courier_id, {})
+
+    def get_merchant(self, merchant_id):
+        return self.merchants.get(merchant_id, {})
+
+    def get_weather(self, city):
+        return self.weather.get(city, {})
+
+    def get_payment(self, order_id):
+        return self.payments.get(order_id, {})
+
+    def get_order_items(self, order_id):
+        return self.order_items.get(order_id, [])
+
+    def get_promotion(self, code):
+        return self.promotions.get(code, {})
+
+
+class SqliteDataSource(DataSource):
+    """
+    SQLite-backed store: one (key PRIMARY KEY, data JSON) table per entity,
+    so a lookup is a single indexed query and a bulk get is one IN (...)
+    query per chunk. Lookups borrow a connection from a pool of at most
+    pool_size, shared by every thread (short-lived executor threads don't
+    each leave one open); close() closes them all.
+    """
+
+    _TABLES = ("couriers", "merchants", "weather", "payments", "order_items", "promotions")
+    _CHUNK = 900  # stay under SQLite's default host-parameter limit
+
+    def __init__(self, path: str = ":memory:", pool_size: int = 8):
+        if path == ":memory:":
+            # a named shared-cache DB so every thread's connection sees the same data
+            path = f"file:synapse_{id(self)}?mode=memory&cache=shared"
+        self.path = path
+        self.pool_size = max(1, pool_size)
+        self._idle: List[sqlite3.Connection] = []
+        self._opened = 0
+        self._closed = False
+        self._pool_lock = threading.Condition()
+        self._keepalive = self._connect()  # shared in-memory DBs vanish with their last connection
+        with self._keepalive:
+            for table in self._TABLES:
+                self._keepalive.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, data TEXT NOT NULL)")
+            self._keepalive.execute("CREATE TABLE IF NOT EXISTS courier_status (key TEXT PRIMARY KEY, status TEXT)")
+            self._keepalive.execute("CREATE INDEX IF NOT EXISTS courier_status_idx ON courier_status (status)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, uri=self.path.startswith("file:"), check_same_thread=False)
+
+    @contextmanager
+    def _conn(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a pooled connection; waits while pool_size are in use."""
+        with self._pool_lock:
+            while True:
+                if self._closed:
+                    raise RuntimeError(f"SQLite data source {self.path} is closed")
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._opened < self.pool_size:
+                    self._opened += 1
+                    conn = None
+                    break
+                self._pool_lock.wait()
+        if conn is None:
+            try:
+                conn = self._connect()
+            except BaseException:
+                with self._pool_lock:
+                    self._opened -= 1
+                    self._pool_lock.notify()
+                raise
+        try:
+            yield conn
+        finally:
+            with self._pool_lock:
+                if self._closed:
+                    conn.close()
+                else:
+                    self._idle.append(conn)
+                self._pool_lock.notify()
+
+    def close(self) -> None:
+        """Close every idle connection now and the borrowed ones as they come back."""
+        with self._pool_lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._pool_lock.notify_all()
+        for conn in idle:
+            conn.close()
+        self._keepalive.close()
+
+    # ---- loading ----
+    def load(self, table: str, records: Iterable[Tuple[str, Any]]) -> None:
+        """Upsert (key, record) pairs into one entity table in a single transaction."""
+        if table not in self._TABLES:
+            raise ValueError(f"Unknown table {table!r}")
+        with self._conn() as conn, conn:
+            rows = [(key, json.dumps(rec)) for key, rec in records]
+            conn.executemany(f"INSERT OR REPLACE INTO {table} (key, data) VALUES (?, ?)", rows)
+            if table == "couriers":
+                conn.executemany(
+                    "INSERT OR REPLACE INTO courier_status (key, status) VALUES (?, ?)",
+                    [(key, json.loads(data).get("status")) for key, data in rows],
+                )
+
+    @classmethod
+    def from_source(cls, source: InMemoryDataSource, path: str = ":memory:", pool_size: int = 8) -> "SqliteDataSource":
+        db = cls(path, pool_size=pool_size)
+        db.load("couriers", source.couriers.items())
+        db.load("merchants", source.merchants.items())
+        db.load("weather", source.weather.items())
+        db.load("payments", source.payments.items())
+        db.load("order_items", source.order_items.items())
+        db.load("promotions", source.promotions.items())
+        return db
+
+    # ---- lookups ----
+    def _get(self, table: str, key: Optional[str], default):
+        if key is None:
+            return default
+        with self._conn() as conn:
+            row = conn.execute(f"SELECT data FROM {table} WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def _bulk(self, table: str, keys: Iterable[str], default) -> Dict[str, Any]:
+        keys = list(dict.fromkeys(k for k in keys if k is not None))
+        found: Dict[str, Any] = {}
+        with self._conn() as conn:
+            for i in range(0, len(keys), self._CHUNK):
+                chunk = keys[i:i + self._CHUNK]
+                marks = ",".join("?" * len(chunk))
+                for key, data in conn.execute(f"SELECT key, data FROM {table} WHERE key IN ({marks})", chunk):
+                    found[key] = json.loads(data)
+        return {k: found.get(k, default() if callable(default) else default) for k in keys}
+
+    def courier_ids_with_status(self, status: str) -> Set[str]:
+        with self._conn() as conn:
+            rows = conn.execute("SELECT key FROM courier_status WHERE status = ?", (status,))
+            return {key for (key,) in rows}
+
+    def iter_couriers(self):
+        with self._conn() as conn:    # held until the iteration ends (or the generator is closed)
+            for key, data in conn.execute("SELECT key, data FROM couriers"):
+                yield key, json.loads(data)
+
+    def get_courier(self, courier_id):
+        return self._get("couriers", courier_id, {})
+
+    def get_merchant(self, merchant_id):
+        return self._get("merchants", merchant_id, {})
+
+    def get_weather(self, city):
+        return self._get("weather", city, {})
+
+    def get_payment(self, order_id):
+        return self._get("payments", order_id, {})
+
+    def get_order_items(self, order_id):
+        return self._get("order_items", order_id, [])
+
+    def get_promotion(self, code):
+        return self._get("promotions", code, {})
+
+    def bulk_get_couriers(self, courier_ids):
+        return self._bulk("couriers", courier_ids, dict)
+
+    def bulk_get_merchants(self, merchant_ids):
+        return self._bulk("merchants", merchant_ids, dict)
+
+    def bulk_get_payments(self, order_ids):
+        return self._bulk("payments", order_ids, dict)
+
+    def bulk_get_order_items(self, order_ids):
+        return self._bulk("order_items", order_ids, list)
+
+
+class SyntheticDataSource(DataSource):
+    """
+    Serves a dataset.synthetic directory (memory-mapped columns) through the
+    DataSource interface; records are materialised per lookup.
+    """
+
+    def __init__(self, dataset):
+        from dataset.synthetic import SyntheticDataset  # numpy is only needed for this backend
+        self.dataset = dataset if isinstance(dataset, SyntheticDataset) else SyntheticDataset(dataset)
+
+    def get_courier(self, courier_id):
+        return self.dataset.courier(courier_id)
+
+    def get_merchant(self, merchant_id):
+        return self.dataset.merchant(merchant_id)
+
+    def get_weather(self, city):
+        return self.dataset.weather(city)
+
+    def get_payment(self, order_id):
+        return self.dataset.payment(order_id)
+
+    def get_order_items(self, order_id):
+        return self.dataset.order_items(order_id)
+
+    def get_promotion(self, code):
+        return {}
+
+    def iter_couriers(self):
+        return self.dataset.iter_couriers()
+
+
+class FakeLatencyDataSource(DataSource):
+    """
+    Local fake backend: delegates to `inner` after a simulated round-trip of
+    latency_ms (+/- jitter_ms). Sync lookups block with time.sleep, async
+    lookups yield with asyncio.sleep, so both paths can be benchmarked.
+    """
+
+    def __init__(self, inner: Optional[DataSource] = None, latency_ms: float = 20.0,
+                 jitter_ms: float = 0.0, seed: Optional[int] = None):
+        self.inner = inner or InMemoryDataSource.from_mock()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self._rng = random.Random(seed)
+
+    def _delay_s(self) -> float:
+        jitter = self._rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def _call(self, name: str, key):
+        time.sleep(self._delay_s())
+        return getattr(self.inner, name)(key)
+
+    async def _acall(self, name: str, key):
+        await asyncio.sleep(self._delay_s())
+        return getattr(self.inner, name)(key)
+
+    def get_courier(self, courier_id):
+        return self._call("get_courier", courier_id)
+
+    def get_merchant(self, merchant_id):
+        return self._call("get_merchant", merchant_id)
+
+    def get_weather(self, city):
+        return self._call("get_weather", city)
+
+    def get_payment(self, order_id):
+        return self._call("get_payment", order_id)
+
+    def get_order_items(self, order_id):
+        return self._call("get_order_items", order_id)
+
+    def get_promotion(self, code):
+        return self._call("get_promotion", code)
+
+    async def aget_courier(self, courier_id):
+        return await self._acall("get_courier", courier_id)
+
+    def iter_couriers(self):
+        time.sleep(self._delay_s())
+        return self.inner.iter_couriers()
+
+    async def aget_merchant(self, merchant_id):
+        return await self._acall("get_merchant", merchant_id)
+
+    async def aget_weather(self, city):
+        return await self._acall("get_weather", city)
+
+    async def aget_payment(self, order_id):
+        return await self._acall("get_payment", order_id)
+
+    async def aget_order_items(self, order_id):
+        return await self._acall("get_order_items", order_id)
+
+    async def aget_promotion(self, code):
+        return await self._acall("get_promotion", code)
+
+    # one simulated round-trip per bulk call, not per record
+    def bulk_get_couriers(self, courier_ids):
+        return self._call("bulk_get_couriers", courier_ids)
+
+    def bulk_get_merchants(self, merchant_ids):
+        return self._call("bulk_get_merchants", merchant_ids)
+
+    def bulk_get_payments(self, order_ids):
+        return self._call("bulk_get_payments", order_ids)
+
+    def bulk_get_order_items(self, order_ids):
+        return self._call("bulk_get_order_items", order_ids)
+
+    async def abulk_get_couriers(self, courier_ids):
+        return await self._acall("bulk_get_couriers", courier_ids)
+
+    async def abulk_get_merchants(self, merchant_ids):
+        return await self._acall("bulk_get_merchants", merchant_ids)
+
+    async def abulk_get_payments(self, order_ids):
+        return await self._acall("bulk_get_payments", order_ids)
+
+    async def abulk_get_order_items(self, order_ids):
+        return await self._acall("bulk_get_order_items", order_ids)
+
+
+# =========================================================
+# 3) Process-wide active source
+# =========================================================
+
+_SOURCE: DataSource = InMemoryDataSource.from_mock()
+_MOCK_SOURCE = _SOURCE
+
+def get_data_source() -> DataSource:
+    return _SOURCE
+
+def is_default_source() -> bool:
+    """True while set_data_source() hasn't replaced the built-in mock source."""
+    return _SOURCE is _MOCK_SOURCE
+
+def set_data_source(source: DataSource) -> DataSource:
+    """Swap the backend every agent reads from; returns the previous one."""
+    global _SOURCE
+    previous, _SOURCE = _SOURCE, source
+    return previous
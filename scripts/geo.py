@@ -0,0 +1,97 @@
+from __future__ import annotations
+import math
+from typing import Any, Dict, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+from scripts.core_datastructures import VehicleType
+
+
+# =========================================================
+# Shared distance / ETA engine.
+#   - great-circle (haversine) distance, scalar and NumPy batch
+#   - ETA = road km / vehicle speed, with a detour factor for the
+#     street grid and an optional slowdown (e.g. bad weather)
+#   Every agent that reasons about distance or ETA goes through here.
+# =========================================================
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEG_LAT = math.pi * EARTH_RADIUS_KM / 180
+
+# Typical urban door-to-door speeds (km/h) per vehicle type
+SPEED_KMH: Dict[str, float] = {
+    VehicleType.bike.value: 14.0,
+    VehicleType.scooter.value: 24.0,
+    VehicleType.car.value: 28.0,
+    VehicleType.van.value: 24.0,
+}
+DEFAULT_SPEED_KMH = 22.0
+DETOUR_FACTOR = 1.3      # road km per great-circle km
+WEATHER_SLOWDOWN = 1.25  # ETA multiplier under an active weather alert
+
+Point = Union[Dict[str, Any], Tuple[float, float], Any]
+
+
+def latlng(point: Point) -> Tuple[float, float]:
+    """(lat, lng) from a Location, a {"lat", "lng"} dict or a (lat, lng) pair."""
+    if isinstance(point, dict):
+        return float(point.get("lat", 0.0)), float(point.get("lng", point.get("lon", 0.0)))
+    if isinstance(point, (tuple, list)):
+        return float(point[0]), float(point[1])
+    return float(point.lat), float(point.lng)
+
+
+def speed_kmh(vehicle_type: Optional[Union[str, VehicleType]]) -> float:
+    if isinstance(vehicle_type, VehicleType):
+        vehicle_type = vehicle_type.value
+    return SPEED_KMH.get(vehicle_type, DEFAULT_SPEED_KMH)
+
+
+# ---- scalar ----
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    dp, dl = p2 - p1, math.radians(lng2 - lng1)
+    a = math.sin(dp / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def distance_km(a: Point, b: Point) -> float:
+    return haversine_km(*latlng(a), *latlng(b))
+
+
+def eta_min(km: float, vehicle_type: Optional[Union[str, VehicleType]] = None, slowdown: float = 1.0) -> float:
+    """Minutes to cover km of great-circle distance by road."""
+    return km * DETOUR_FACTOR / speed_kmh(vehicle_type) * 60.0 * slowdown
+
+
+# ---- batch ----
+def haversine_one_to_many(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Distances (km) from one origin to every destination, shape (n,)."""
+    p1 = math.radians(lat)
+    p2 = np.radians(np.asarray(lats, dtype=float))
+    dl = np.radians(np.asarray(lngs, dtype=float)) - math.radians(lng)
+    a = np.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def haversine_matrix(lats1: np.ndarray, lngs1: np.ndarray, lats2: np.ndarray, lngs2: np.ndarray) -> np.ndarray:
+    """Pairwise distances (km), shape (len(lats1), len(lats2))."""
+    p1 = np.radians(np.asarray(lats1, dtype=float))[:, None]
+    p2 = np.radians(np.asarray(lats2, dtype=float))[None, :]
+    dl = np.radians(np.asarray(lngs2, dtype=float))[None, :] - np.radians(np.asarray(lngs1, dtype=float))[:, None]
+    a = np.sin((p2 - p1) / 2) ** 2 + np.cos(p1) * np.cos(p2) * np.sin(dl / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.minimum(1.0, np.sqrt(a)))
+
+
+def speeds_kmh(vehicle_types: Iterable[Optional[str]]) -> np.ndarray:
+    return np.fromiter((speed_kmh(v) for v in vehicle_types), dtype=float)
+
+
+def eta_min_batch(km: np.ndarray, speeds: Union[float, np.ndarray] = DEFAULT_SPEED_KMH,
+                  slowdown: Union[float, np.ndarray] = 1.0) -> np.ndarray:
+    """
+    Array form of eta_min. speeds broadcasts against km, e.g.
+    - (n,) distances with one speed per destination courier
+    - (n, m) matrix with speeds_kmh(...)[None, :] for per-column vehicles
+    """
+    return np.asarray(km, dtype=float) * (DETOUR_FACTOR * 60.0) / speeds * slowdown
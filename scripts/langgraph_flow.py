@@ -1,76 +1,119 @@
 from __future__ import annotations
-from typing import Dict, Any, Optional, List
-from langgraph.graph import StateGraph, END
-from pydantic import ConfigDict
-from langchain_core.tools import Tool
+import asyncio
+import contextvars
+import inspect
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Any, Optional, List, Tuple, Union
+import threading
+import time
+import weakref
+# langgraph.constants is tiny; StateGraph (and with it most of langgraph and
+# langchain_core) is imported inside build_graph().
+from langgraph.constants import END
 
 # ---- Bring your models & tools ----
+from scripts import audit_trail
+from scripts.checkpoints import Checkpointer, get_checkpointer
+from scripts.metrics import get_metrics
+from scripts.profiling import current_trace, get_profiler
 from scripts.core_datastructures import (
-    AgentState, AgentReturnEnvelope,
+    AgentState, AgentStateDict, AgentReturnEnvelope,
     PaymentAgentInput, ReputationAgentInput, CourierBreakdownInput,
     CapacityAgentInput, SplitDeliveryInput, WeatherAgentInput,
     MerchantStatusInput, DeliveryDispatchInput, RerouteInput,
     CustomerChangeInput, PolicyGuardInput, NotifyAgentInput, AuditAgentInput,
     PolicyStatus, NotificationEvent
 )
-from scripts.tools import (
-    payment_agent, reputation_agent, courier_breakdown_agent, capacity_agent,
-    split_delivery_agent, weather_agent, merchant_status_agent, delivery_dispatch_agent,
-    reroute_agent, customer_change_agent, policy_guard, notify_agent, audit_agent
-)
 
 
 # =========================================================
 # 1) Helpers
 # =========================================================
 
-def _merge_envelope(state: AgentState, env: Dict[str, Any], thought: Optional[str] = None) -> AgentState:
+# Debug switch: re-validate the full AgentState on every hop (the old,
+# copy-heavy behaviour). Off by default; the fast path validates once at
+# graph entry and then mutates order_details / audit_log in place.
+STRICT_STATE_VALIDATION = os.getenv("SYNAPSE_STRICT_STATE", "").lower() in ("1", "true", "yes")
+
+def _agents():
+    """
+    scripts.agent_registry, imported on first node call rather than at module
+    import: it pulls in langchain_core's tool machinery, numpy and the data
+    sources. Nodes call agents by name through it, bypassing tool.invoke.
+    """
+    import scripts.agent_registry
+    return scripts.agent_registry
+
+def _order_of(state: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+    if isinstance(state, AgentState):
+        return state.order_details
+    return state.get("order_details") or {}
+
+def _merge_envelope(state: AgentState, env: Dict[str, Any], thought: Optional[str] = None,
+                    agent: Optional[str] = None) -> AgentState:
     """
     Merge a tool's envelope (dict) into the AgentState.
     - updates -> state.order_details (deep merge, shallow per key)
     - signals -> state.order_details["signals"]
     - metrics -> append into audit_log entry
     - reason -> appended to audit_log / thoughts
+    - the rolling trail in order_details["_audit"] is updated and
+      audit_log is cut to the last AUDIT_RING entries (scripts.audit_trail)
     """
-    # Validate/normalize state on entry (safe, optional)
-    state = AgentState.model_validate(state)
-
     updates: Dict[str, Any] = env.get("updates", {}) or {}
     signals: Dict[str, Any] = env.get("signals", {}) or {}
     metrics: Dict[str, Any] = env.get("metrics", {}) or {}
     reason: Optional[str] = env.get("reason")
+    trace = current_trace()
+    t0 = time.perf_counter_ns() if trace is not None else 0
+    order = state.order_details
 
     # Merge updates (shallow per top key)
     for k, v in updates.items():
         # keep existing dicts merged shallowly
-        if isinstance(v, dict) and isinstance(state.order_details.get(k), dict):
-            state.order_details[k].update(v)
+        if isinstance(v, dict) and isinstance(order.get(k), dict):
+            order[k].update(v)
         else:
-            state.order_details[k] = v
+            order[k] = v
 
     # Store/merge signals in a dedicated place for router
-    sd = state.order_details.get("signals", {})
+    sd = order.get("signals", {})
     if not isinstance(sd, dict):
         sd = {}
     sd.update(signals)
-    state.order_details["signals"] = sd
+    order["signals"] = sd
 
-    # Append to audit_log
+    # Append to audit_log (bounded) and the running trail
+    agent = agent or order.get("_phase") or "unknown"
+    updates_keys = list(updates)
+    ok = env.get("ok", True)
     log_entry = {
+        "agent": agent,
+        "ok": ok,
         "reason": reason,
         "signals": signals,
         "metrics": metrics,
-        "updates_keys": list(updates.keys())
+        "updates_keys": updates_keys
     }
     if thought:
         log_entry["thought"] = thought
-    state.audit_log.append(log_entry)
-
+    log = state.audit_log
+    trail = order.get(audit_trail.TRAIL_KEY)
+    if trail is None:
+        trail = order[audit_trail.TRAIL_KEY] = audit_trail.from_log(log)
+    log.append(log_entry)
+    if len(log) > audit_trail.AUDIT_RING:
+        del log[:len(log) - audit_trail.AUDIT_RING]
+    audit_trail.record(trail, agent, reason, audit_trail.event_label(updates_keys), ok, metrics.get("latency_ms"))
+
+    if trace is not None:
+        trace.inner("merge", time.perf_counter_ns() - t0)
     return state
 
 
 def _get_signal(state: AgentState, key: str, default: Any = False) -> Any:
-    sigs = state.order_details.get("signals", {}) or {}
+    sigs = _order_of(state).get("signals", {}) or {}
     return sigs.get(key, default)
 
 
@@ -82,109 +125,185 @@ def _get_signal(state: AgentState, key: str, default: Any = False) -> Any:
 #      - merges the envelope into state
 # =========================================================
 
-def node_payment(state: AgentState) -> AgentState:
+def _payment_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
     # Build tool inputs (Your PaymentAgentInput expects: payment, order_total, user_prefs)
-    kwargs = {
+    return {
         "payment": order.get("payment", {}),
         "order_total": order.get("order_total", 0.0),
         "user_prefs": order.get("user_prefs", {})
     }
-    env = payment_agent.invoke(kwargs)  # returns dict
-    return _merge_envelope(state, env, thought="Payment check")
 
-def node_merchant(state: AgentState) -> AgentState:
+def node_payment(state: AgentState) -> AgentState:
+    env = _agents().call_agent("payment_agent", _payment_kwargs(state))  # returns dict
+    return _merge_envelope(state, env, thought="Payment check", agent="payment_agent")
+
+def _merchant_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "merchant_id": order.get("merchant_id"),
         "items": order.get("items", [])
     }
-    env = merchant_status_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Merchant status & stock")
 
-def node_dispatch(state: AgentState) -> AgentState:
-    order = state.order_details
-    kwargs = {
+def node_merchant(state: AgentState) -> AgentState:
+    env = _agents().call_agent("merchant_status_agent", _merchant_kwargs(state))
+    return _merge_envelope(state, env, thought="Merchant status & stock", agent="merchant_status_agent")
+
+def _dispatch_kwargs(state: AgentState) -> Dict[str, Any]:
+    return _dispatch_order_kwargs(state.order_details)
+
+def _dispatch_order_kwargs(order: Dict[str, Any]) -> Dict[str, Any]:
+    items = order.get("items", []) or []
+    return {
         "pickup_location": order.get("pickup_location", {}),
         "drop_location": order.get("drop_location", {}),
         "readiness_eta_min": order.get("readiness_eta_min", 0),
-        "priority_flag": bool(order.get("priority_flag", False))
+        "priority_flag": bool(order.get("priority_flag", False)),
+        # what the courier search should filter on
+        "required_vol_l": sum(i.get("vol_l", 0) * i.get("qty", 1) for i in items),
+        "required_weight_kg": sum(i.get("weight_kg", 0) * i.get("qty", 1) for i in items),
+        "needs_insulated": any(i.get("item_type") == "perishable" for i in items),
+        "exclude_couriers": order.get("exclude_couriers", []),
+        # set when a batch window already solved this order's assignment
+        "assigned_courier_id": order.get("assigned_courier_id")
     }
-    env = delivery_dispatch_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Courier dispatch")
 
-def node_reputation(state: AgentState) -> AgentState:
+def node_dispatch(state: AgentState) -> AgentState:
+    env = _agents().call_agent("delivery_dispatch_agent", _dispatch_kwargs(state))
+    return _merge_envelope(state, env, thought="Courier dispatch", agent="delivery_dispatch_agent")
+
+def _reputation_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    courier_id = (order.get("courier") or {}).get("id")
-    kwargs = {
-        "courier_candidate_id": courier_id,
+    return {
+        "courier_candidate_id": (order.get("courier") or {}).get("id"),
         "historical_kpis": order.get("historical_kpis", {})
     }
-    env = reputation_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Courier reputation gate")
 
-def node_capacity(state: AgentState) -> AgentState:
+def node_reputation(state: AgentState) -> AgentState:
+    env = _agents().call_agent("reputation_agent", _reputation_kwargs(state))
+    return _merge_envelope(state, env, thought="Courier reputation gate", agent="reputation_agent")
+
+def _capacity_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    courier_id = (order.get("courier") or {}).get("id")
-    kwargs = {
+    return {
         "order_id": order.get("order_id"),
-        "courier_id": courier_id
+        "courier_id": (order.get("courier") or {}).get("id")
     }
-    env = capacity_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Capacity check")
 
-def node_split(state: AgentState) -> AgentState:
+def node_capacity(state: AgentState) -> AgentState:
+    env = _agents().call_agent("capacity_agent", _capacity_kwargs(state))
+    return _merge_envelope(state, env, thought="Capacity check", agent="capacity_agent")
+
+def _split_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "order_id": order.get("order_id"),
         "customer_response": (order.get("customer_response") or "disagree"),
         "overflow_items": (order.get("capacity") or {}).get("overflow_items", []),
         "courier_pool": order.get("courier_pool", []),
         "policy_split_rules": order.get("policy_split_rules", {}),
-        "user_prefs": order.get("user_prefs", {})
+        "user_prefs": order.get("user_prefs", {}),
+        "courier_id": (order.get("courier") or {}).get("id")
     }
-    env = split_delivery_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Split delivery negotiation")
 
-def node_weather(state: AgentState) -> AgentState:
+def node_split(state: AgentState) -> AgentState:
+    env = _agents().call_agent("split_delivery_agent", _split_kwargs(state))
+    return _merge_envelope(state, env, thought="Split delivery negotiation", agent="split_delivery_agent")
+
+def _weather_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "courier_location": order.get("pickup_location", {}).get("city", "Unknown"),
         "destination_city": order.get("drop_location", {}).get("city", "Unknown")
     }
-    env = weather_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Weather check")
 
-def node_breakdown(state: AgentState) -> AgentState:
+def node_weather(state: AgentState) -> AgentState:
+    env = _agents().call_agent("weather_agent", _weather_kwargs(state))
+    return _merge_envelope(state, env, thought="Weather check", agent="weather_agent")
+
+def _breakdown_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "courier_id": (order.get("courier") or {}).get("id"),
         "telemetry": order.get("telemetry", {}),
         "route": order.get("route", {})
     }
-    env = courier_breakdown_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Breakdown/idle detection")
 
-def node_reroute(state: AgentState) -> AgentState:
+def node_breakdown(state: AgentState) -> AgentState:
+    env = _agents().call_agent("courier_breakdown_agent", _breakdown_kwargs(state))
+    return _merge_envelope(state, env, thought="Breakdown/idle detection", agent="courier_breakdown_agent")
+
+# Independent post-dispatch checks: (tool name, kwargs builder, thought).
+# They read disjoint inputs and emit disjoint signals, so they can run
+# concurrently; envelopes are merged in this fixed order.
+_INDEPENDENT_CHECKS = (
+    ("capacity_agent", _capacity_kwargs, "Capacity check"),
+    ("weather_agent", _weather_kwargs, "Weather check"),
+    ("courier_breakdown_agent", _breakdown_kwargs, "Breakdown/idle detection"),
+)
+
+_CHECK_POOL: Optional[ThreadPoolExecutor] = None
+
+def _check_pool() -> ThreadPoolExecutor:
+    global _CHECK_POOL
+    if _CHECK_POOL is None:
+        _CHECK_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("SYNAPSE_CHECK_WORKERS", "32")),
+                                         thread_name_prefix="synapse-checks")
+    return _CHECK_POOL
+
+def shutdown_check_pool() -> None:
+    """Stop the parallel-checks threads (e.g. before fork); the next checks node starts a new pool."""
+    global _CHECK_POOL
+    pool, _CHECK_POOL = _CHECK_POOL, None
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+def _forget_check_pool() -> None:
+    # a forked child has none of the pool's threads: start a fresh one on first use
+    global _CHECK_POOL
+    _CHECK_POOL = None
+
+os.register_at_fork(after_in_child=_forget_check_pool)
+
+def node_checks(state: AgentState) -> AgentState:
+    agents = _agents()
+    # Build every input before fanning out so workers never touch shared state
+    futures = [
+        (_check_pool().submit(contextvars.copy_context().run, agents.call_agent, name, build(state)), thought, name)
+        for name, build, thought in _INDEPENDENT_CHECKS
+    ]
+    for fut, thought, name in futures:
+        state = _merge_envelope(state, fut.result(), thought=thought, agent=name)
+    return state
+
+def _reroute_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "reason": order.get("reroute_reason", "risk"),
         "current_courier": (order.get("courier") or {}).get("id"),
         "candidate_pool": order.get("candidate_pool", []),
-        "weather_advice": (order.get("weather") or {}).get("advice")
+        "weather_advice": (order.get("weather") or {}).get("advice"),
+        "courier_position": order.get("courier_position") or None,
+        "drop_location": order.get("drop_location")
     }
-    env = reroute_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Reroute / reassignment")
 
-def node_customer_change(state: AgentState) -> AgentState:
+def node_reroute(state: AgentState) -> AgentState:
+    env = _agents().call_agent("reroute_agent", _reroute_kwargs(state))
+    return _merge_envelope(state, env, thought="Reroute / reassignment", agent="reroute_agent")
+
+def _customer_change_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
-    kwargs = {
+    return {
         "request": order.get("customer_change_request", {}),
         "courier_position": order.get("courier_position", {}),
-        "policy_change_rules": order.get("policy_change_rules", {})
+        "policy_change_rules": order.get("policy_change_rules", {}),
+        "eta_min": int((order.get("route") or {}).get("eta_min", 0)),
+        "vehicle_type": (((order.get("courier") or {}).get("vehicle")) or {}).get("type")
     }
-    env = customer_change_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Customer-initiated change")
+
+def node_customer_change(state: AgentState) -> AgentState:
+    env = _agents().call_agent("customer_change_agent", _customer_change_kwargs(state))
+    return _merge_envelope(state, env, thought="Customer-initiated change", agent="customer_change_agent")
 
 def _as_float(x, default=0.0) -> float:
     # Accept number, numeric string, or dicts like {"wallet_delta": 249.0, "balance": ...}
@@ -206,11 +325,11 @@ def _as_float(x, default=0.0) -> float:
         return default
     return default
 
-def node_policy(state: AgentState) -> AgentState:
+def _policy_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
     eta_min = (order.get("route") or {}).get("eta_min", 0)
 
-    kwargs = {
+    return {
         "eta_min": int(eta_min),
         "sla_eta_min": int(order.get("sla_eta_min", 30)),
         "price_delta": _as_float(order.get("price_delta", 0.0), 0.0),
@@ -218,8 +337,10 @@ def node_policy(state: AgentState) -> AgentState:
         "split_plan": order.get("split_plan", {}) or {},
         "change_fees": _as_float(order.get("change_fees", 0.0), 0.0),
     }
-    env = policy_guard.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Policy / SLA validation")
+
+def node_policy(state: AgentState) -> AgentState:
+    env = _agents().call_agent("policy_guard", _policy_kwargs(state))
+    return _merge_envelope(state, env, thought="Policy / SLA validation", agent="policy_guard")
 
 # def node_policy(state: AgentState) -> AgentState:
 #     order = state.order_details
@@ -235,204 +356,421 @@ def node_policy(state: AgentState) -> AgentState:
 #     env = policy_guard.invoke(kwargs)
 #     return _merge_envelope(state, env, thought="Policy / SLA validation")
 
-def node_notify(state: AgentState) -> AgentState:
+def _notify_kwargs(state: AgentState) -> Dict[str, Any]:
     order = state.order_details
     # Decide event by context (simple example)
     event = order.get("notify_event") or NotificationEvent.delivered
-    kwargs = {
+    return {
         "event": event,
         "payload": order.get("notify_payload", {}),
-        "target": order.get("notify_targets", ["user", "merchant"])
+        "target": order.get("notify_targets", ["user", "merchant"]),
+        # whoever carries the order now: the reroute's backup, else the dispatched courier
+        "courier_id": (order.get("reroute") or {}).get("new_courier_id") or (order.get("courier") or {}).get("id")
     }
-    env = notify_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Notify stakeholders")
 
-def node_audit(state: AgentState) -> AgentState:
-    order = state.order_details
-
-    # Build human-readable thoughts from reasons
-    thoughts = [e.get("reason") for e in state.audit_log if e.get("reason")]
-
-    # Convert updates_keys (which is a list) into a single string per event
-    def _event_label(entry: dict) -> str:
-        keys = entry.get("updates_keys", [])
-        if isinstance(keys, list):
-            return ",".join(map(str, keys)) if keys else "none"
-        return str(keys) if keys is not None else "none"
-
-    events = [_event_label(e) for e in state.audit_log]
+def node_notify(state: AgentState) -> AgentState:
+    env = _agents().call_agent("notify_agent", _notify_kwargs(state))
+    return _merge_envelope(state, env, thought="Notify stakeholders", agent="notify_agent")
 
-    kwargs = {
-        "thoughts": thoughts,
-        "events": events,            # <-- now List[str]
+def _audit_kwargs(state: AgentState) -> Dict[str, Any]:
+    order = state.order_details
+    # Reason chain and event labels come from the rolling trail, so this
+    # is bounded by SYNAPSE_AUDIT_CHAIN however many hops the order took
+    trail = order.get(audit_trail.TRAIL_KEY) or audit_trail.from_log(state.audit_log)
+    return {
+        "thoughts": audit_trail.thoughts(trail),
+        "events": audit_trail.events(trail),
         "state_diff": order
     }
-    env = audit_agent.invoke(kwargs)
-    return _merge_envelope(state, env, thought="Persist audit trace")
+
+def node_audit(state: AgentState) -> AgentState:
+    env = _agents().call_agent("audit_agent", _audit_kwargs(state))
+    return _merge_envelope(state, env, thought="Persist audit trace", agent="audit_agent")
+
+# phase -> node callable; build_graph() accepts a replacement mapping
+# (e.g. the async nodes in scripts.async_flow) with the same keys.
+NODES: Dict[str, Callable[[AgentState], Any]] = {
+    "payment": node_payment,
+    "merchant": node_merchant,
+    "dispatch": node_dispatch,
+    "reputation": node_reputation,
+    "capacity": node_capacity,
+    "split": node_split,
+    "weather": node_weather,
+    "breakdown": node_breakdown,
+    "checks": node_checks,
+    "reroute": node_reroute,
+    "customer_change": node_customer_change,
+    "policy": node_policy,
+    "notify": node_notify,
+    "audit": node_audit,
+}
 
 
 
 # =========================================================
 # 3) Router
-#    Read signals from state.order_details["signals"] and decide next node
+#    Routing policy is a transition table: phase -> {signal: next phase},
+#    checked in order against order_details["signals"], with DEFAULT as
+#    the fallthrough. compile_routes() validates a table once and turns
+#    it into a dict-dispatch router; build_graph() derives the nodes and
+#    edges from the same table, so a new agent is one NODES entry plus
+#    one row here.
 # =========================================================
 
-def router(state: AgentState) -> str:
-    sig = state.order_details.get("signals", {}) or {}
-
-    # After Payment -> Merchant
-    if not state.order_details.get("_phase"):
-        return "payment"
-
-    phase = state.order_details["_phase"]
-
-    if phase == "payment":
-        return "merchant"
-
-    if phase == "merchant":
-        return "dispatch" if not sig.get("needs_alt_sourcing") else "notify"
-
-    if phase == "dispatch":
-        return "reputation" if sig.get("on_route") else "notify"
-
-    if phase == "reputation":
-        return "reroute" if sig.get("reassign_courier") else "capacity"
-
-    if phase == "capacity":
-        return "split" if sig.get("propose_split_delivery") else "weather"
-
-    if phase == "split":
-        # spawn_second_dispatch or find_new_courier both eventually continue
-        return "weather"
+DEFAULT = "*"
+
+TRANSITIONS: Dict[str, Dict[str, str]] = {
+    "payment": {DEFAULT: "merchant"},
+    "merchant": {"needs_alt_sourcing": "notify", DEFAULT: "dispatch"},
+    "dispatch": {"on_route": "reputation", DEFAULT: "notify"},
+    "reputation": {"reassign_courier": "reroute", DEFAULT: "capacity"},
+    "capacity": {"propose_split_delivery": "split", DEFAULT: "weather"},
+    # spawn_second_dispatch or find_new_courier both eventually continue
+    "split": {DEFAULT: "weather"},
+    "weather": {"require_reroute": "reroute", DEFAULT: "breakdown"},
+    "breakdown": {"need_backup_courier": "reroute", DEFAULT: "customer_change"},
+    "reroute": {"reroute_done": "customer_change", DEFAULT: "notify"},
+    "customer_change": {DEFAULT: "policy"},  # regardless, we proceed to guard
+    "policy": {DEFAULT: "notify"},           # proceed or warn, we notify
+    "notify": {DEFAULT: "audit"},
+    "audit": {DEFAULT: END},
+}
+
+# build_graph(parallel_checks=True): capacity, weather and breakdown run
+# together in the "checks" node, then the usual decisions are applied to
+# their combined signals.
+PARALLEL_TRANSITIONS: Dict[str, Dict[str, str]] = {
+    **{phase: row for phase, row in TRANSITIONS.items() if phase not in ("capacity", "weather", "breakdown")},
+    "reputation": {"reassign_courier": "reroute", DEFAULT: "checks"},
+    "checks": {"propose_split_delivery": "split", "require_reroute": "reroute",
+               "need_backup_courier": "reroute", DEFAULT: "customer_change"},
+    "split": {"require_reroute": "reroute", "need_backup_courier": "reroute", DEFAULT: "customer_change"},
+}
+
+
+class CompiledRouter:
+    """
+    Callable router over a validated transition table.
+    - table[phase] -> ((signal, next phase), ...), default next phase
+    - no _phase yet -> entry; unknown phase -> END
+    """
+    __slots__ = ("table", "entry")
+
+    def __init__(self, table: Dict[str, Tuple[Tuple[Tuple[str, str], ...], str]], entry: str):
+        self.table = table
+        self.entry = entry
+
+    def __call__(self, state: Union[AgentState, Dict[str, Any]]) -> str:
+        order = _order_of(state)
+        phase = order.get("_phase")
+        if not phase:
+            return self.entry
+        route = self.table.get(phase)
+        if route is None:
+            return END
+        rules, default = route
+        if rules:
+            sig = order.get("signals") or {}
+            for signal, target in rules:
+                if sig.get(signal):
+                    return target
+        return default
 
-    if phase == "weather":
-        return "reroute" if sig.get("require_reroute") else "breakdown"
+    def targets(self, phase: str) -> List[str]:
+        """Every phase (or END) reachable in one hop from `phase`."""
+        rules, default = self.table[phase]
+        return list(dict.fromkeys([t for _, t in rules] + [default]))
 
-    if phase == "breakdown":
-        return "reroute" if sig.get("need_backup_courier") else "customer_change"
 
-    if phase == "reroute":
-        return "customer_change" if sig.get("reroute_done") else "notify"
+def compile_routes(transitions: Dict[str, Dict[str, str]], entry: str = "payment") -> CompiledRouter:
+    """
+    Validate a transition table and compile it into a router.
+    Raises ValueError when:
+    - a row has no DEFAULT or routes to a phase that isn't in the table
+    - a phase can't be reached from `entry`
+    - a phase can never reach END
+    """
+    if entry not in transitions:
+        raise ValueError(f"Entry phase '{entry}' has no transitions")
+    table: Dict[str, Tuple[Tuple[Tuple[str, str], ...], str]] = {}
+    for phase, row in transitions.items():
+        if DEFAULT not in row:
+            raise ValueError(f"Phase '{phase}' has no default transition")
+        for target in row.values():
+            if target != END and target not in transitions:
+                raise ValueError(f"Phase '{phase}' routes to unknown phase '{target}'")
+        rules = tuple((signal, target) for signal, target in row.items() if signal != DEFAULT)
+        table[phase] = (rules, row[DEFAULT])
+    compiled = CompiledRouter(table, entry)
+
+    reachable, stack = {entry}, [entry]
+    while stack:
+        for target in compiled.targets(stack.pop()):
+            if target != END and target not in reachable:
+                reachable.add(target)
+                stack.append(target)
+    unreachable = [phase for phase in table if phase not in reachable]
+    if unreachable:
+        raise ValueError(f"Unreachable phases: {unreachable}")
+
+    finishing = {END}
+    changed = True
+    while changed:
+        changed = False
+        for phase in table:
+            if phase not in finishing and any(t in finishing for t in compiled.targets(phase)):
+                finishing.add(phase)
+                changed = True
+    stuck = [phase for phase in table if phase not in finishing]
+    if stuck:
+        raise ValueError(f"Phases that never reach END: {stuck}")
+    return compiled
+
+
+router = compile_routes(TRANSITIONS)
+parallel_router = compile_routes(PARALLEL_TRANSITIONS)
+
+# Phases that wait on the customer: phase -> order key holding the answer.
+# With a checkpointer the run parks (ends, state saved) before the phase
+# while the key is missing; resume_order() continues once it is set.
+AWAITS: Dict[str, str] = {
+    "split": "customer_response",
+}
+
+def _parking_router(routes: CompiledRouter, awaits: Dict[str, str]) -> Callable[[Any], str]:
+    def route(state: Union[AgentState, Dict[str, Any]]) -> str:
+        target = routes(state)
+        key = awaits.get(target)
+        if key is not None and _order_of(state).get(key) is None:
+            profiler = get_profiler()
+            if profiler.enabled:
+                profiler.park(_order_of(state))
+            return END
+        return target
+    return route
 
-    if phase == "customer_change":
-        return "policy"  # regardless, we proceed to guard
 
-    if phase == "policy":
-        return "notify"  # proceed or warn, we notify
+# =========================================================
+# 4) Build Graph
+# =========================================================
 
-    if phase == "notify":
-        return "audit"
+def build_graph(strict_state: Optional[bool] = None, parallel_checks: bool = False,
+                nodes: Optional[Dict[str, Callable[[AgentState], Any]]] = None,
+                transitions: Optional[Dict[str, Dict[str, str]]] = None,
+                checkpointer: Optional[Checkpointer] = None,
+                awaits: Optional[Dict[str, str]] = None):
+    """
+    Compile the order graph.
+    - strict_state=None -> follow STRICT_STATE_VALIDATION (env SYNAPSE_STRICT_STATE)
+    - strict_state=True -> pydantic AgentState channel, full validate/dump every hop
+    - strict_state=False -> plain-dict channel, validated once at the entry node
+    - parallel_checks=True -> capacity/weather/breakdown fan out in one "checks" node
+    - nodes -> phase -> node mapping (defaults to NODES); async nodes are supported
+    - transitions -> custom routing table (defaults to TRANSITIONS / PARALLEL_TRANSITIONS)
+    - checkpointer -> state is saved at every node exit, and a state that
+      already has a _phase enters at the hop after it (see resume_order())
+    - awaits -> with a checkpointer, phase -> order key the phase waits on
+      (defaults to AWAITS); the run parks before such a phase while the
+      key is missing
+    Prefer get_app() unless you need a custom node mapping or table.
+    """
+    from langgraph.graph import StateGraph
+
+    nodes = NODES if nodes is None else nodes
+    strict = STRICT_STATE_VALIDATION if strict_state is None else strict_state
+    if transitions is not None:
+        routes = compile_routes(transitions)
+    else:
+        routes = parallel_router if parallel_checks else router
+    missing = [phase for phase in routes.table if phase not in nodes]
+    if missing:
+        raise ValueError(f"No node registered for phases: {missing}")
+    graph = StateGraph(AgentState if strict else AgentStateDict)
+
+    awaits = (AWAITS if awaits is None else awaits) if checkpointer is not None else {}
+    route = _parking_router(routes, awaits) if awaits else routes
+
+    def _phase_wrapper(phase_name: str, fn):
+        rules, default = routes.table[phase_name]
+        return _wrap_node(phase_name, fn, validate=strict or phase_name == routes.entry, dump=strict,
+                          terminal=not rules and default == END, checkpointer=checkpointer)
+
+    def _path_map(targets: List[str]) -> Dict[str, str]:
+        targets = targets + [END] if any(t in awaits for t in targets) else targets
+        return {t: t for t in dict.fromkeys(targets)}
+
+    # One node per phase in the table; signal-free rows become static edges
+    for phase in routes.table:
+        graph.add_node(phase, _phase_wrapper(phase, nodes[phase]))
+    if checkpointer is not None:
+        # resumed states carry _phase: the router sends them to the hop after it
+        graph.set_conditional_entry_point(route, _path_map(list(routes.table)))
+    else:
+        graph.set_entry_point(routes.entry)
+    for phase, (rules, default) in routes.table.items():
+        if rules or default in awaits:
+            graph.add_conditional_edges(phase, route, _path_map(routes.targets(phase)))
+        else:
+            graph.add_edge(phase, default)
 
-    if phase == "audit":
-        return END
+    app = graph.compile()
+    _GRAPH_ROUTES[app] = routes
+    return app
 
-    # default
-    return END
+# compiled graph -> the CompiledRouter it was built from (see routes_of)
+_GRAPH_ROUTES: "weakref.WeakKeyDictionary[Any, CompiledRouter]" = weakref.WeakKeyDictionary()
 
+def routes_of(app) -> CompiledRouter:
+    """The transition table a compiled graph runs; `router` for graphs built elsewhere."""
+    return _GRAPH_ROUTES.get(app, router)
 
-# =========================================================
-# 4) Build Graph
-# =========================================================
+_APPS: Dict[Tuple[bool, bool, Optional[Checkpointer]], Any] = {}
+_APPS_LOCK = threading.Lock()
 
-def build_graph():
-    graph = StateGraph(AgentState)
-
-    # Register nodes
-    graph.add_node("payment", _phase_wrapper("payment", node_payment))
-    graph.add_node("merchant", _phase_wrapper("merchant", node_merchant))
-    graph.add_node("dispatch", _phase_wrapper("dispatch", node_dispatch))
-    graph.add_node("reputation", _phase_wrapper("reputation", node_reputation))
-    graph.add_node("capacity", _phase_wrapper("capacity", node_capacity))
-    graph.add_node("split", _phase_wrapper("split", node_split))
-    graph.add_node("weather", _phase_wrapper("weather", node_weather))
-    graph.add_node("breakdown", _phase_wrapper("breakdown", node_breakdown))
-    graph.add_node("reroute", _phase_wrapper("reroute", node_reroute))
-    graph.add_node("customer_change", _phase_wrapper("customer_change", node_customer_change))
-    graph.add_node("policy", _phase_wrapper("policy", node_policy))
-    graph.add_node("notify", _phase_wrapper("notify", node_notify))
-    graph.add_node("audit", _phase_wrapper("audit", node_audit))
-
-    # Router edges (single dynamic router)
-    graph.set_entry_point("payment")
-    graph.add_edge("payment", "merchant")
-    graph.add_conditional_edges("merchant", router, {
-        "dispatch": "dispatch",
-        "notify": "notify",
-        END: END
-    })
-    graph.add_conditional_edges("dispatch", router, {
-        "reputation": "reputation",
-        "notify": "notify",
-        END: END
-    })
-    graph.add_conditional_edges("reputation", router, {
-        "reroute": "reroute",
-        "capacity": "capacity",
-        END: END
-    })
-    graph.add_conditional_edges("capacity", router, {
-        "split": "split",
-        "weather": "weather",
-        END: END
-    })
-    graph.add_conditional_edges("split", router, {
-        "weather": "weather",
-        END: END
-    })
-    graph.add_conditional_edges("weather", router, {
-        "reroute": "reroute",
-        "breakdown": "breakdown",
-        END: END
-    })
-    graph.add_conditional_edges("breakdown", router, {
-        "reroute": "reroute",
-        "customer_change": "customer_change",
-        END: END
-    })
-    graph.add_conditional_edges("reroute", router, {
-        "customer_change": "customer_change",
-        "notify": "notify",
-        END: END
-    })
-    graph.add_conditional_edges("customer_change", router, {
-        "policy": "policy",
-        END: END
-    })
-    graph.add_conditional_edges("policy", router, {
-        "notify": "notify",
-        END: END
-    })
-    graph.add_conditional_edges("notify", router, {
-        "audit": "audit",
-        END: END
-    })
-    # audit -> END implicitly via router
-    graph.add_conditional_edges("audit", router, {
-        END: END
-    })
-
-    return graph.compile()
+def get_app(strict_state: Optional[bool] = None, parallel_checks: bool = False,
+            checkpointer: Optional[Checkpointer] = None):
+    """
+    Process-wide compiled graph, built on first use per (strict, parallel,
+    checkpointer) combination. Nodes resolve the data source per call, so
+    the graph stays valid across set_data_source().
+    - checkpointer=None -> get_checkpointer() (env SYNAPSE_CHECKPOINT_DB)
+    """
+    key = (STRICT_STATE_VALIDATION if strict_state is None else strict_state, parallel_checks,
+           checkpointer or get_checkpointer())
+    app = _APPS.get(key)
+    if app is None:
+        with _APPS_LOCK:
+            app = _APPS.get(key)
+            if app is None:
+                app = _APPS[key] = build_graph(strict_state=key[0], parallel_checks=parallel_checks,
+                                               checkpointer=key[2])
+    return app
+
+def resume_state(order_id: str, updates: Optional[Dict[str, Any]] = None,
+                 checkpointer: Optional[Checkpointer] = None) -> Optional[Dict[str, Any]]:
+    """
+    A checkpointed order's state, ready to be invoked again.
+    - updates -> merged into order_details first (e.g. the customer's answer)
+    - None when nothing is stored for order_id
+    """
+    checkpointer = checkpointer or get_checkpointer()
+    if checkpointer is None:
+        raise ValueError("Resuming needs a checkpointer (or SYNAPSE_CHECKPOINT_DB)")
+    state = checkpointer.load(order_id)
+    if state is None:
+        return None
+    order = state["order_details"]
+    order.update(updates or {})
+    order.pop("_ckpt", None)      # the next save is a full snapshot, so the updates are kept
+    return state
 
-def _phase_wrapper(phase_name: str, fn):
+def resume_order(order_id: str, updates: Optional[Dict[str, Any]] = None,
+                 checkpointer: Optional[Checkpointer] = None, app=None) -> Optional[Dict[str, Any]]:
+    """
+    Continue a checkpointed order from its stored _phase, in any worker.
+    Returns the final (or newly parked) state; None when nothing is stored.
+    """
+    checkpointer = checkpointer or get_checkpointer()
+    state = resume_state(order_id, updates, checkpointer)
+    if state is None:
+        return None
+    return (app or get_app(checkpointer=checkpointer)).invoke(state)
+
+def is_parked(state: Union[AgentState, Dict[str, Any]], routes: Optional[CompiledRouter] = None,
+              app=None) -> bool:
+    """
+    True when a run ended before a terminal node, i.e. the order is waiting in the checkpointer.
+    - routes / app -> the table the order ran on (routes_of(app)); with
+      neither, the sequential table, or the parallel one for its own phases
+    """
+    if routes is None:
+        routes = routes_of(app) if app is not None else router
+    phase = _order_of(state).get("_phase")
+    if phase and phase not in routes.table and routes is router:
+        routes = parallel_router
+    if not phase or phase not in routes.table:
+        return False
+    rules, default = routes.table[phase]
+    return bool(rules) or default != END
+
+def _wrap_node(phase_name: str, fn, validate: bool = True, dump: bool = True, terminal: bool = False,
+               checkpointer: Optional[Checkpointer] = None):
     """
     Decorator to mark current phase in the state before executing node.
     Ensures router knows where we are.
+    - validate=False -> wrap the incoming dict without copying (model_construct)
+    - dump=False -> return only the mutated channels, by reference
+    - coroutine nodes get an async wrapper so the graph can be run with ainvoke
+    - every hop is timed into synapse_node_latency_seconds{phase=...} and
+      counted in synapse_route_transitions_total{from=...,to=...}
+    - while scripts.profiling is enabled, sampled orders run through their
+      OrderTrace, which times each segment of the hop; terminal=True marks
+      the node after which the order's trace is written out
+    - checkpointer -> the state is saved on the way out (cleared after the
+      terminal node); async nodes run the save in a worker thread, since a
+      busy SQLite write would otherwise block every order on the loop
     """
-    def wrapped(state: Dict[str, Any]) -> Dict[str, Any]:
-        # Validate/normalize and set phase
-        st = AgentState.model_validate(state)
+    metrics = get_metrics()
+    profiler = get_profiler()
+    labels = (("phase", phase_name),)
+
+    def _enter(state: Union[AgentState, Dict[str, Any]]) -> AgentState:
+        if validate:
+            st = AgentState.model_validate(state.model_dump() if isinstance(state, AgentState) else state)
+        elif isinstance(state, AgentState):
+            st = state
+        else:
+            st = AgentState.model_construct(**state)
+        metrics.inc("synapse_route_transitions_total",
+                    (("from", st.order_details.get("_phase") or "start"), ("to", phase_name)))
         st.order_details["_phase"] = phase_name
-        st = fn(st)
-        return st.model_dump()
+        return st
+
+    def _emit(st: AgentState, t0: int) -> Dict[str, Any]:
+        out = st.model_dump() if dump else {"order_details": st.order_details, "audit_log": st.audit_log}
+        metrics.observe("synapse_node_latency_seconds", time.perf_counter_ns() - t0, labels)
+        return out
+
+    def _exit(st: AgentState, t0: int) -> Dict[str, Any]:
+        if checkpointer is not None:
+            checkpointer.save(st.order_details, st.audit_log, done=terminal)
+        return _emit(st, t0)
+
+    if inspect.iscoroutinefunction(fn):
+        async def _aexit(st: AgentState, t0: int) -> Dict[str, Any]:
+            if checkpointer is not None:
+                await asyncio.to_thread(checkpointer.save, st.order_details, st.audit_log, terminal)
+            return _emit(st, t0)
+
+        async def awrapped(state: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+            t0 = time.perf_counter_ns()
+            trace = profiler.trace_for(_order_of(state)) if profiler.enabled else None
+            if trace is not None:
+                return await trace.arun_node(phase_name, state, _enter, fn, _aexit, t0, terminal)
+            return await _aexit(await fn(_enter(state)), t0)
+        return awrapped
+
+    def wrapped(state: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+        t0 = time.perf_counter_ns()
+        trace = profiler.trace_for(_order_of(state)) if profiler.enabled else None
+        if trace is not None:
+            return trace.run_node(phase_name, state, _enter, fn, _exit, t0, terminal)
+        return _exit(fn(_enter(state)), t0)
     return wrapped
 
 
+def _phase_wrapper(phase_name: str, fn):
+    """Strict wrapper (validate + dump every hop), kept for callers outside build_graph()."""
+    return _wrap_node(phase_name, fn)
+
+
 # =========================================================
 # 5) Minimal Demo
 # =========================================================
-if __name__ == "__main__":
-    app = build_graph()
-    initial_state = AgentState(
+def demo_order_state() -> AgentState:
+    """The demo order used by the CLI entry point and the batch runner."""
+    return AgentState(
         messages=[],
         order_details={
             "order_id": "order_12345",
@@ -463,6 +801,10 @@ if __name__ == "__main__":
         audit_log=[]
     )
 
+
+if __name__ == "__main__":
+    app = get_app()
+    initial_state = demo_order_state()
     final_state = app.invoke(initial_state.model_dump())
     # Pretty-print result
     import json
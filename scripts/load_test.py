@@ -0,0 +1,140 @@
+from __future__ import annotations
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from scripts.langgraph_flow import demo_order_state
+from scripts.metrics import Histogram
+
+
+# =========================================================
+# 1) Keep-alive HTTP client
+#    `connections` clients each hold one HTTP/1.1 connection and post
+#    copies of the demo order (unique order_ids) until `orders` have been
+#    sent. A 429 counts as a rejection and the order is not retried;
+#    the rate of 429s is what the run is meant to show under overload.
+# =========================================================
+
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, method: str, path: str,
+                   body: Optional[bytes] = None) -> Tuple[int, bytes]:
+    head = f"{method} {path} HTTP/1.1\r\nHost: synapse\r\nContent-Length: {len(body or b'')}\r\n"
+    writer.write((head + "Content-Type: application/json\r\n\r\n").encode() + (body or b""))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        k, _, v = line.decode("latin-1").partition(":")
+        if k.strip().lower() == "content-length":
+            length = int(v)
+    return status, await reader.readexactly(length)
+
+
+async def run_load(host: str = "127.0.0.1", port: int = 8080, orders: int = 2000, connections: int = 64,
+                   wait: bool = False) -> Dict[str, Any]:
+    template = demo_order_state().model_dump()["order_details"]
+    codes: Counter = Counter()
+    latency = Histogram()
+    sent = 0
+    run = f"{os.getpid()}-{int(time.time())}"
+
+    async def client() -> None:
+        nonlocal sent
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while sent < orders:
+                n = sent
+                sent += 1
+                body = json.dumps({**template, "order_id": f"LT-{run}-{n}"}).encode()
+                t0 = time.perf_counter_ns()
+                status, _ = await _request(reader, writer, "POST", "/orders?wait=1" if wait else "/orders", body)
+                latency.record(time.perf_counter_ns() - t0)
+                codes[status] += 1
+        finally:
+            writer.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(connections)))
+    elapsed = time.perf_counter() - t0
+
+    # with wait=False the 202s are only admissions; wait for the queue to drain
+    reader, writer = await asyncio.open_connection(host, port)
+    while True:
+        _, raw = await _request(reader, writer, "GET", "/healthz")
+        health = json.loads(raw)
+        if not health["queued"] and not health["in_flight"]:
+            break
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - t0
+    writer.close()
+
+    accepted = codes[200] + codes[202]
+    return {
+        "orders": orders,
+        "connections": connections,
+        "codes": dict(sorted(codes.items())),
+        "elapsed_s": round(elapsed, 3),
+        "drained_s": round(drained, 3),
+        "requests_per_sec": round(orders / elapsed, 1) if elapsed else 0.0,
+        "orders_per_sec": round(accepted / drained, 1) if drained else 0.0,
+        "latency": latency.summary(),
+    }
+
+
+# =========================================================
+# 2) Entry point
+#    --spawn starts scripts.service on the port first (and stops it after),
+#    so a single command measures the service end to end.
+# =========================================================
+
+async def _wait_for_port(host: str, port: int, timeout_s: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            _, writer = await asyncio.open_connection(host, port)
+            writer.close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Load-test a running scripts.service instance.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--orders", type=int, default=2000)
+    parser.add_argument("--connections", type=int, default=64)
+    parser.add_argument("--wait", action="store_true", help="post with ?wait=1 (latency = full order run)")
+    parser.add_argument("--spawn", action="store_true", help="start the service as a subprocess first")
+    parser.add_argument("--workers", type=int, help="with --spawn: service worker count")
+    parser.add_argument("--queue", type=int, help="with --spawn: service queue size")
+    args = parser.parse_args()
+
+    server = None
+    if args.spawn:
+        cmd = [sys.executable, "-m", "scripts.service", "--host", args.host, "--port", str(args.port)]
+        if args.workers:
+            cmd += ["--workers", str(args.workers)]
+        if args.queue:
+            cmd += ["--queue", str(args.queue)]
+        server = subprocess.Popen(cmd)
+    try:
+        if server is not None:
+            asyncio.run(_wait_for_port(args.host, args.port))
+        report = asyncio.run(run_load(args.host, args.port, args.orders, args.connections, args.wait))
+        print(json.dumps(report, indent=2))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
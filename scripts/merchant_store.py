@@ -0,0 +1,144 @@
+from __future__ import annotations
+import os
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from pydantic import BaseModel, Field
+
+from scripts.ttl_cache import TTLCache
+
+
+# =========================================================
+# 1) Cached merchant state
+#    health, prep ETA and the out-of-stock SKU set for one merchant.
+#    oos is a frozenset swapped atomically, so readers never lock.
+# =========================================================
+
+class MerchantState:
+    __slots__ = ("merchant_id", "health", "prep_eta_min", "oos")
+
+    def __init__(self, merchant_id: str, record: Dict[str, Any]):
+        self.merchant_id = merchant_id
+        self.health: Optional[str] = record.get("health")
+        self.prep_eta_min: int = int(record.get("prep_eta_min") or 0)
+        self.oos: FrozenSet[str] = frozenset(record.get("oos_items") or ())
+
+    def out_of_stock(self, skus: Iterable[str]) -> List[str]:
+        """The requested SKUs this merchant can't fill (one set intersection)."""
+        return sorted(self.oos.intersection(skus))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"health": self.health, "prep_eta_min": self.prep_eta_min, "oos_items": sorted(self.oos)}
+
+
+EVENT_TYPES = ("health", "sold_out", "restocked", "invalidate")
+
+class MerchantEvent(BaseModel):
+    """
+    Push update from the merchant side.
+    - type="health"    -> health (+ optional prep_eta_min) changed
+    - type="sold_out"  -> skus just went out of stock
+    - type="restocked" -> skus are back
+    - type="invalidate"-> drop the cached state; next read reloads
+    """
+    type: str
+    merchant_id: str
+    health: Optional[str] = None
+    prep_eta_min: Optional[int] = None
+    skus: List[str] = Field(default_factory=list)
+
+
+# =========================================================
+# 2) Merchant state store
+#    Reads go through a TTLCache (single-flight loads, LRU bound), so
+#    a popular merchant costs one backend read per TTL, not per order.
+#    Events patch the cached state in place. For a merchant that isn't
+#    cached, an event only bumps the generation of a load in flight, so
+#    that load (which may have read the backend before the change) is not
+#    cached; the next read loads again.
+# =========================================================
+
+class MerchantStateStore:
+    def __init__(self, source, ttl_s: float = 30.0, max_entries: int = 50_000):
+        self._source = source
+        self._cache = TTLCache(ttl_s=ttl_s, max_entries=max_entries)
+        self._lock = threading.Lock()
+
+    def get(self, merchant_id: Optional[str]) -> Optional[MerchantState]:
+        if not merchant_id:
+            return None
+        return self._cache.get(merchant_id, lambda: self._load(merchant_id, self._source.get_merchant(merchant_id)))
+
+    async def aget(self, merchant_id: Optional[str]) -> Optional[MerchantState]:
+        if not merchant_id:
+            return None
+
+        async def load():
+            return self._load(merchant_id, await self._source.aget_merchant(merchant_id))
+
+        return await self._cache.aget(merchant_id, load)
+
+    @staticmethod
+    def _load(merchant_id: str, record: Dict[str, Any]) -> Optional[MerchantState]:
+        return MerchantState(merchant_id, record) if record else None
+
+    def prefetch(self, merchant_ids: Iterable[str]) -> None:
+        """Warm many merchants with one bulk backend read."""
+        records = self._source.bulk_get_merchants(list(dict.fromkeys(merchant_ids)))
+        for merchant_id, record in records.items():
+            self._cache.get(merchant_id, lambda r=record, m=merchant_id: self._load(m, r))
+
+    def check(self, merchant_id: Optional[str], skus: Iterable[str]) -> Tuple[Optional[MerchantState], List[str]]:
+        """(state, out-of-stock SKUs among `skus`) for a whole order."""
+        state = self.get(merchant_id)
+        return state, (state.out_of_stock(skus) if state is not None else [])
+
+    # ---- invalidation events ----
+    def apply(self, event: MerchantEvent) -> bool:
+        """Patch the cached state; False when the merchant wasn't cached."""
+        if event.type not in EVENT_TYPES:
+            raise ValueError(f"Unknown merchant event type: {event.type}")
+        if event.type == "invalidate":
+            self._cache.invalidate(event.merchant_id)
+            return True
+        with self._lock:
+            state = self._cache.peek(event.merchant_id)
+            if state is None:
+                self._cache.invalidate(event.merchant_id)
+                return False
+            if event.type == "health":
+                if event.health is not None:
+                    state.health = event.health
+                if event.prep_eta_min is not None:
+                    state.prep_eta_min = event.prep_eta_min
+            elif event.type == "sold_out":
+                state.oos = state.oos.union(event.skus)
+            else:
+                state.oos = state.oos.difference(event.skus)
+            return True
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
+
+
+# =========================================================
+# 3) Process-wide store over the active data source
+#    - SYNAPSE_MERCHANT_TTL_S -> safety-net TTL when no events arrive (default 30)
+# =========================================================
+
+_STORE: Optional[MerchantStateStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_merchant_store() -> MerchantStateStore:
+    from scripts.data_sources import get_data_source
+
+    global _STORE
+    source = get_data_source()
+    if _STORE is None or _STORE._source is not source:
+        with _STORE_LOCK:
+            if _STORE is None or _STORE._source is not source:
+                _STORE = MerchantStateStore(source, ttl_s=float(os.getenv("SYNAPSE_MERCHANT_TTL_S", "30")))
+    return _STORE
+
+def publish_merchant_event(event: MerchantEvent) -> bool:
+    return get_merchant_store().apply(event)
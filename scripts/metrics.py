@@ -0,0 +1,329 @@
+from __future__ import annotations
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+# =========================================================
+# 1) Log-linear latency histogram (HDR-style)
+#    Values are nanoseconds. Each power of two is split into SUB linear
+#    sub-buckets, so any recorded value is off by at most 1/SUB (~6%).
+#    Counts live in one preallocated list; recording is a bit_length,
+#    a shift and an increment.
+# =========================================================
+
+SUB_BITS = 4
+SUB = 1 << SUB_BITS
+MAX_NS = 1 << 40                              # ~18 min; larger values clamp
+_MAX_SHIFT = (MAX_NS - 1).bit_length() - (SUB_BITS + 1)
+N_BUCKETS = _MAX_SHIFT * SUB + 2 * SUB
+
+
+def bucket_of(ns: int) -> int:
+    if ns >= MAX_NS:
+        ns = MAX_NS - 1
+    shift = ns.bit_length() - (SUB_BITS + 1)
+    if shift <= 0:
+        return ns if ns > 0 else 0
+    return shift * SUB + (ns >> shift)
+
+def bucket_floor(idx: int) -> int:
+    """Smallest value (ns) that lands in bucket idx."""
+    if idx < 2 * SUB:
+        return idx
+    shift = idx // SUB - 1
+    return (idx - shift * SUB) << shift
+
+
+class Histogram:
+    """Not locked: each thread records into its own copy (see Metrics)."""
+    __slots__ = ("counts", "count", "total_ns", "max_ns")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * N_BUCKETS
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def record(self, ns: int) -> None:
+        self.counts[bucket_of(ns)] += 1
+        self.count += 1
+        self.total_ns += ns
+        if ns > self.max_ns:
+            self.max_ns = ns
+
+    def merge(self, other: "Histogram") -> None:
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total_ns += other.total_ns
+        self.max_ns = max(self.max_ns, other.max_ns)
+
+    def quantile(self, q: float) -> int:
+        """Lower edge (ns) of the bucket holding the q-quantile."""
+        if not self.count:
+            return 0
+        rank = max(1, int(q * self.count + 0.5))
+        seen = 0
+        for idx, n in enumerate(self.counts):
+            seen += n
+            if seen >= rank:
+                return bucket_floor(idx)
+        return self.max_ns
+
+    def cumulative(self, bounds_ns: List[int]) -> List[int]:
+        """Observations <= each bound (to bucket resolution), for Prometheus buckets."""
+        out, seen, idx = [], 0, 0
+        for bound in bounds_ns:
+            limit = bucket_of(bound)
+            while idx <= limit:
+                seen += self.counts[idx]
+                idx += 1
+            out.append(seen)
+        return out
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_us": self.total_ns / self.count / 1000 if self.count else 0.0,
+            "p50_us": self.quantile(0.50) / 1000,
+            "p90_us": self.quantile(0.90) / 1000,
+            "p99_us": self.quantile(0.99) / 1000,
+            "max_us": self.max_ns / 1000,
+        }
+
+
+# =========================================================
+# 2) Metrics registry
+#    - node latency per graph phase (whole hop, state handling included)
+#    - agent latency + errors per agent (the agent body only)
+#    - route transitions (from phase -> to phase) counted per hop
+#    Recording takes no lock: every thread writes to its own shard and
+#    exports merge the shards. The shard of a thread that has exited is
+#    folded into one retired shard (when the next thread registers, or at
+#    export), so per-call executors don't grow the shard list. Series are created on first use and never
+#    removed; label values come from the fixed phases and agent names.
+#    - reset() / dump(reset=True) -> each shard's dicts are swapped for fresh
+#      ones under one lock hold, then the old ones are folded once their owner
+#      has left any record call in flight, so no sample is dropped or doubled
+# =========================================================
+
+Labels = Tuple[Tuple[str, str], ...]
+SeriesKey = Tuple[str, Labels]
+
+# Prometheus bucket bounds (seconds) exported from the fine histogram
+EXPORT_BUCKETS_S = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+                    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _Shard:
+    __slots__ = ("hists", "counters", "thread", "busy")
+
+    def __init__(self, thread: Optional[threading.Thread] = None):
+        self.hists: Dict[SeriesKey, Histogram] = {}
+        self.counters: Dict[SeriesKey, int] = {}
+        self.thread = thread
+        self.busy = False           # owner is between reading and writing hists/counters
+
+    def fold(self, other: "_Shard") -> None:
+        """Add other's series into this shard (other may still be recording)."""
+        for key, h in list(other.hists.items()):
+            self.hists.setdefault(key, Histogram()).merge(h)
+        for key, n in list(other.counters.items()):
+            self.counters[key] = self.counters.get(key, 0) + n
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._local = threading.local()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard()      # folded shards of threads that have exited
+        self._lock = threading.Lock()
+
+    def _shard(self) -> _Shard:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                self._retire_dead()
+                self._shards.append(shard)
+            return shard
+
+    def _retire_dead(self) -> None:
+        """Fold shards of exited threads into _retired (caller holds _lock)."""
+        live = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                live.append(shard)
+            else:
+                self._retired.fold(shard)
+        self._shards = live
+
+    # ---- recording ----
+    def observe(self, name: str, ns: int, labels: Labels = ()) -> None:
+        if not self.enabled:
+            return
+        shard = self._shard()
+        shard.busy = True
+        hists = shard.hists
+        key = (name, labels)
+        h = hists.get(key)
+        if h is None:
+            h = hists[key] = Histogram()
+        h.record(ns)
+        shard.busy = False
+
+    def inc(self, name: str, labels: Labels = (), n: int = 1) -> None:
+        if not self.enabled:
+            return
+        shard = self._shard()
+        shard.busy = True
+        counters = shard.counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + n
+        shard.busy = False
+
+    @contextmanager
+    def timer(self, name: str, labels: Labels = ()) -> Iterator[None]:
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter_ns() - t0, labels)
+
+    def reset(self) -> None:
+        self._take()
+
+    def _take(self) -> Tuple[Dict[SeriesKey, Histogram], Dict[SeriesKey, int]]:
+        """Swap every shard for empty dicts and return the merged old ones."""
+        taken: List[_Shard] = []
+        with self._lock:
+            self._retire_dead()
+            total, self._retired = self._retired, _Shard()
+            for shard in self._shards:
+                old = _Shard(shard.thread)
+                old.hists, old.counters = shard.hists, shard.counters
+                shard.hists, shard.counters = {}, {}
+                taken.append(old)
+            live = list(self._shards)
+        for shard in live:
+            # a record call that read the old dicts before the swap finishes into them
+            while shard.busy and shard.thread.is_alive():
+                time.sleep(0)
+        for old in taken:
+            total.fold(old)
+        return total.hists, total.counters
+
+    # ---- across processes ----
+    def dump(self, reset: bool = False) -> Tuple[Dict[SeriesKey, tuple], Dict[SeriesKey, int]]:
+        """
+        Every series as plain picklable data, for absorb() in another process.
+        Histograms are sent as their non-empty buckets only.
+        - reset=True -> the next dump() only has what was recorded after this one
+        """
+        hists, counters = self._take() if reset else self._merged()
+        return ({key: ([(i, n) for i, n in enumerate(h.counts) if n], h.count, h.total_ns, h.max_ns)
+                 for key, h in hists.items()}, counters)
+
+    def absorb(self, dumped: Tuple[Dict[SeriesKey, tuple], Dict[SeriesKey, int]]) -> None:
+        """Add another process's dump() to this registry."""
+        hists, counters = dumped
+        shard = _Shard()
+        for key, (buckets, count, total_ns, max_ns) in hists.items():
+            h = shard.hists[key] = Histogram()
+            for i, n in buckets:
+                h.counts[i] = n
+            h.count, h.total_ns, h.max_ns = count, total_ns, max_ns
+        shard.counters = dict(counters)
+        with self._lock:
+            self._retired.fold(shard)
+
+    # ---- export ----
+    def _merged(self) -> Tuple[Dict[SeriesKey, Histogram], Dict[SeriesKey, int]]:
+        total = _Shard()
+        with self._lock:
+            self._retire_dead()
+            total.fold(self._retired)
+            for shard in self._shards:
+                total.fold(shard)
+        return total.hists, total.counters
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """{"counters": {series: value}, "histograms": {series: summary}}"""
+        hists, counters = self._merged()
+        return {
+            "counters": {_series(name, labels): value for (name, labels), value in sorted(counters.items())},
+            "histograms": {_series(name, labels): h.summary() for (name, labels), h in sorted(hists.items())},
+        }
+
+    def to_prometheus(self) -> str:
+        hists, counters = self._merged()
+        lines: List[str] = []
+        typed = set()
+        for (name, labels), value in sorted(counters.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} counter")
+                typed.add(name)
+            lines.append(f"{_series(name, labels)} {value}")
+        bounds_ns = [int(b * 1e9) for b in EXPORT_BUCKETS_S]
+        for (name, labels), h in sorted(hists.items()):
+            if name not in typed:
+                lines.append(f"# TYPE {name} histogram")
+                typed.add(name)
+            for bound, seen in zip(EXPORT_BUCKETS_S, h.cumulative(bounds_ns)):
+                lines.append(f"{_series(name + '_bucket', labels + (('le', repr(bound)),))} {seen}")
+            lines.append(f"{_series(name + '_bucket', labels + (('le', '+Inf'),))} {h.count}")
+            lines.append(f"{_series(name + '_sum', labels)} {h.total_ns / 1e9:.9f}")
+            lines.append(f"{_series(name + '_count', labels)} {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        """Atomic write, suitable for node_exporter's textfile collector."""
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp, path)
+
+
+def _series(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+# =========================================================
+# 3) Process-wide metrics
+#    - SYNAPSE_METRICS=0 -> recording becomes a no-op
+# =========================================================
+
+_METRICS = Metrics(enabled=os.getenv("SYNAPSE_METRICS", "1").lower() not in ("0", "false", "no"))
+
+def get_metrics() -> Metrics:
+    return _METRICS
+
+def start_http_exporter(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """Serve GET /metrics in Prometheus text format from a daemon thread."""
+    metrics = get_metrics()
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.to_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="synapse-metrics", daemon=True).start()
+    return server
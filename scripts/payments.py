@@ -0,0 +1,246 @@
+from __future__ import annotations
+import csv
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+
+# =========================================================
+# 1) Duplicate-charge index
+#    A charge duplicates an earlier one when customer, amount (in cents)
+#    and merchant match and the two land within window_s of each other.
+#    Charges are bucketed by ts // window_s, so a lookup probes the
+#    same and neighbouring bucket only: O(1) per transaction.
+# =========================================================
+
+CHARGE_STATUSES = frozenset({"confirmed", "authorized", "captured", "settled"})
+REFUND_STATUSES = frozenset({"refunded", "reversed", "voided"})
+DUPLICATE_WINDOW_S = 300
+
+ChargeKey = Tuple[Optional[str], int, Optional[str]]  # customer, amount_cents, merchant
+Charge = Tuple[str, Optional[int], Optional[str]]     # tx_id, ts, order_id
+
+UNKNOWN_CENTS = -1
+
+
+def _cents(amount: Any) -> int:
+    return int(round(float(amount or 0) * 100))
+
+
+class DuplicateChargeIndex:
+    def __init__(self, window_s: int = DUPLICATE_WINDOW_S):
+        self.window_s = window_s
+        # bucket -> key -> first charge seen per order, in arrival order
+        self._buckets: Dict[int, Dict[ChargeKey, List[Charge]]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _bucket(self, ts: Optional[int]) -> int:
+        return int(ts // self.window_s) if ts is not None else 0
+
+    def observe(self, tx_id: str, customer_id: Optional[str], merchant_id: Optional[str],
+                amount: Any, ts: Optional[int] = None, order_id: Optional[str] = None) -> Optional[str]:
+        """
+        Record a charge; returns the id of the charge it duplicates, else None.
+        - amount=None -> matches only other charges of unknown amount
+        """
+        key = (customer_id, _cents(amount) if amount is not None else UNKNOWN_CENTS, merchant_id)
+        b = self._bucket(ts)
+        for probe in (b, b - 1, b + 1):
+            for first_id, first_ts, first_order in self._buckets.get(probe, {}).get(key, ()):
+                if ts is not None and first_ts is not None and abs(ts - first_ts) > self.window_s:
+                    continue
+                if order_id and first_order and order_id != first_order:
+                    continue  # same basket bought twice on purpose is two orders, not a double charge
+                return first_id
+        self._buckets.setdefault(b, {}).setdefault(key, []).append((tx_id, ts, order_id))
+        self._size += 1
+        return None
+
+    def evict_before(self, ts: int) -> None:
+        """Forget charges that can no longer match anything at or after ts."""
+        horizon = self._bucket(ts) - 1
+        for b in [b for b in self._buckets if b < horizon]:
+            self._size -= sum(len(charges) for charges in self._buckets.pop(b).values())
+
+
+def find_duplicate_charges(payment: Dict[str, Any], window_s: int = DUPLICATE_WINDOW_S,
+                           order_total: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Duplicate charges inside one order's payment record that still need a
+    refund, as [{"txn_id", "duplicate_of", "amount"}].
+    - a transaction without an amount is taken to be for payment["amount"],
+      else a non-zero order_total; with neither, "amount" is None
+    - refund/reversal transactions already on the record cancel a duplicate
+      of the same amount
+    """
+    customer_id, merchant_id = payment.get("customer_id"), payment.get("merchant_id")
+    index = DuplicateChargeIndex(window_s)
+    duplicates: List[Dict[str, Any]] = []
+    already_refunded: Dict[int, int] = {}
+    for tx in payment.get("transactions", []) or []:
+        status = (tx.get("status") or "confirmed").lower()
+        amount = tx.get("amount")
+        if amount is None:
+            amount = payment.get("amount")
+        if amount is None and order_total:
+            amount = order_total
+        if status in REFUND_STATUSES:
+            cents = _cents(amount) if amount is not None else UNKNOWN_CENTS
+            already_refunded[cents] = already_refunded.get(cents, 0) + 1
+            continue
+        if status not in CHARGE_STATUSES:
+            continue
+        original = index.observe(tx.get("id"), customer_id, merchant_id, amount, tx.get("ts"))
+        if original is not None:
+            duplicates.append({"txn_id": tx.get("id"), "duplicate_of": original,
+                               "amount": round(float(amount), 2) if amount is not None else None})
+
+    pending = []
+    for dup in duplicates:
+        cents = _cents(dup["amount"]) if dup["amount"] is not None else UNKNOWN_CENTS
+        if already_refunded.get(cents):
+            already_refunded[cents] -= 1
+        else:
+            pending.append(dup)
+    return pending
+
+
+# =========================================================
+# 2) Streaming settlement reconciliation
+#    Rows are expected in (roughly) time order, as settlement files are.
+#    The index only keeps the last couple of windows, so memory is
+#    bounded by charges per window, not by file size. Rows older than
+#    what was already evicted are still checked and counted as late.
+#    Refund rows net off duplicates the way find_duplicate_charges does:
+#    one refund of the same order, customer, merchant and amount cancels
+#    one duplicate, whichever of the two comes first in the file.
+# =========================================================
+
+class SettlementReport(BaseModel):
+    transactions: int = 0
+    charges: int = 0
+    refund_rows: int = 0
+    duplicates: int = 0
+    netted: int = 0                 # duplicates already covered by a refund row
+    refund_total: float = 0.0
+    late_rows: int = 0
+    peak_index_size: int = 0
+    elapsed_s: float = 0.0
+
+
+def reconcile_settlement(rows: Iterable[Dict[str, Any]],
+                         window_s: int = DUPLICATE_WINDOW_S,
+                         on_duplicate: Optional[Callable[[Dict[str, Any]], None]] = None) -> SettlementReport:
+    """
+    One pass over a settlement stream.
+    - on_duplicate(refund) is called per duplicate still owed a refund once
+      the pass ends, in the order found; a refund row anywhere in the file
+      may cancel one, so they are held until then (duplicates only, not
+      charges)
+    """
+    start = time.perf_counter()
+    index = DuplicateChargeIndex(window_s)
+    observe = index.observe
+    transactions = charges = refund_rows = late_rows = peak = 0
+    found: List[Optional[Dict[str, Any]]] = []            # None once a refund netted it
+    open_dups: Dict[Tuple[Any, ...], List[int]] = {}      # netting key -> indexes into found
+    spare_refunds: Dict[Tuple[Any, ...], int] = {}        # refunds seen before their duplicate
+    high_ts: Optional[int] = None
+    next_evict: Optional[int] = None
+
+    # plain locals in the loop: this runs once per settlement row
+    for row in rows:
+        transactions += 1
+        status = (row.get("status") or "confirmed").lower()
+        if status in REFUND_STATUSES:
+            refund_rows += 1
+            key = (row.get("order_id"), row.get("customer_id"), row.get("merchant_id"), _cents(row.get("amount")))
+            waiting = open_dups.get(key)
+            if waiting:
+                found[waiting.pop()] = None
+            else:
+                spare_refunds[key] = spare_refunds.get(key, 0) + 1
+            continue
+        if status not in CHARGE_STATUSES:
+            continue
+        charges += 1
+        ts = row.get("ts")
+        if ts is not None:
+            if high_ts is None or ts > high_ts:
+                high_ts = ts
+            elif ts < high_ts - 2 * window_s:
+                late_rows += 1
+        original = observe(row.get("tx_id"), row.get("customer_id"), row.get("merchant_id"),
+                           row.get("amount"), ts, row.get("order_id"))
+        if original is not None:
+            key = (row.get("order_id"), row.get("customer_id"), row.get("merchant_id"), _cents(row.get("amount")))
+            if spare_refunds.get(key):
+                spare_refunds[key] -= 1
+                found.append(None)
+            else:
+                open_dups.setdefault(key, []).append(len(found))
+                found.append({"txn_id": row.get("tx_id"), "duplicate_of": original, "order_id": row.get("order_id"),
+                              "customer_id": row.get("customer_id"), "amount": round(float(row.get("amount") or 0), 2)})
+        if high_ts is not None and (next_evict is None or high_ts >= next_evict):
+            peak = max(peak, len(index))
+            index.evict_before(high_ts)
+            next_evict = high_ts + window_s
+
+    owed = [dup for dup in found if dup is not None]
+    if on_duplicate is not None:
+        for dup in owed:
+            on_duplicate(dup)
+    return SettlementReport(
+        transactions=transactions,
+        charges=charges,
+        refund_rows=refund_rows,
+        duplicates=len(owed),
+        netted=len(found) - len(owed),
+        refund_total=sum(_cents(dup["amount"]) for dup in owed) / 100,
+        late_rows=late_rows,
+        peak_index_size=max(peak, len(index)),
+        elapsed_s=time.perf_counter() - start,
+    )
+
+
+def read_settlement_csv(path: str) -> Iterator[Dict[str, Any]]:
+    """Rows of a settlement CSV (tx_id, order_id, customer_id, merchant_id, amount, ts, status)."""
+    with open(path, newline="") as f:
+        for row in csv.DictReader(f):
+            row["amount"] = float(row.get("amount") or 0)
+            row["ts"] = int(row["ts"]) if row.get("ts") else None
+            yield row
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Reconcile a settlement file for double charges.")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--csv", help="settlement CSV")
+    src.add_argument("--dataset", help="stream the transactions of a synthetic dataset")
+    parser.add_argument("--window-s", type=int, default=DUPLICATE_WINDOW_S)
+    parser.add_argument("--refunds-out", help="write one refund per line (NDJSON)")
+    args = parser.parse_args()
+
+    if args.csv:
+        rows = read_settlement_csv(args.csv)
+    else:
+        from dataset.synthetic import SyntheticDataset
+        rows = SyntheticDataset(args.dataset).iter_transactions()
+
+    sink = open(args.refunds_out, "w") if args.refunds_out else None
+    try:
+        report = reconcile_settlement(
+            rows, window_s=args.window_s,
+            on_duplicate=(lambda r: sink.write(json.dumps(r) + "\n")) if sink else None,
+        )
+    finally:
+        if sink:
+            sink.close()
+    print(report.model_dump_json(indent=2))
@@ -0,0 +1,312 @@
+from __future__ import annotations
+import contextvars
+import cProfile
+import itertools
+import os
+import signal
+import threading
+import time
+import tracemalloc
+from collections import deque
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+
+# =========================================================
+# 1) Per-order trace
+#    Splits each hop into segments:
+#      state_in   -> validating / wrapping the incoming state
+#      agent:<n>  -> validate (input model) and body (the agent itself)
+#      merge      -> _merge_envelope
+#      node       -> the rest of the node (kwargs building, fan-out)
+#      state_out  -> dumping the node's output
+#      langgraph  -> time between one node's exit and the next's entry
+#    Segments are kept as folded stacks ("a;b;c" -> ns), the input format
+#    of flamegraph.pl and speedscope.
+#    A trace is keyed per run (<order_id>-<seq>, kept in order_details under
+#    TRACE_KEY), so two runs of the same order id never share one.
+# =========================================================
+
+MODES = ("segments", "cprofile", "tracemalloc")
+TRACE_KEY = "_trace"
+
+_CURRENT: contextvars.ContextVar[Optional["OrderTrace"]] = contextvars.ContextVar("synapse_trace", default=None)
+
+def current_trace() -> Optional["OrderTrace"]:
+    return _CURRENT.get()
+
+
+class OrderTrace:
+    __slots__ = ("order_id", "seq", "key", "mode", "started_ns", "last_exit_ns", "phase", "inner_ns",
+                 "stacks", "profile", "holds_tracemalloc", "_lock")
+
+    def __init__(self, order_id: str, seq: int, mode: str):
+        self.order_id = order_id
+        self.seq = seq
+        self.key = f"{order_id}-{seq}"
+        self.mode = mode
+        self.started_ns = time.perf_counter_ns()
+        self.last_exit_ns = 0
+        self.phase = "start"
+        self.inner_ns = 0
+        self.stacks: Dict[str, int] = {}
+        self.profile: Optional[cProfile.Profile] = None
+        self.holds_tracemalloc = False
+        self._lock = threading.Lock()       # parallel checks report from pool threads
+
+    def add(self, path: Tuple[str, ...], ns: int) -> None:
+        key = ";".join(path)
+        with self._lock:
+            self.stacks[key] = self.stacks.get(key, 0) + max(0, ns)
+
+    def inner(self, segment: str, ns: int) -> None:
+        """Time spent in an instrumented call inside the current node."""
+        self.add((self.phase, segment), ns)
+        with self._lock:
+            self.inner_ns += ns
+
+    def agent(self, name: str, t0: int, t1: int, t2: int) -> None:
+        if t1:
+            self.add((self.phase, f"agent:{name}", "validate"), t1 - t0)
+            self.add((self.phase, f"agent:{name}", "body"), t2 - t1)
+        else:
+            self.add((self.phase, f"agent:{name}", "tool_invoke"), t2 - t0)
+        with self._lock:
+            self.inner_ns += t2 - t0
+
+    # ---- node wrappers (called from langgraph_flow._wrap_node) ----
+    def _before(self, phase: str, t0: int) -> contextvars.Token:
+        if self.last_exit_ns:
+            self.add(("langgraph",), t0 - self.last_exit_ns)
+        self.phase = phase
+        self.inner_ns = 0
+        if self.profile is not None:
+            try:
+                self.profile.enable()
+            except ValueError:                # another profiler is active (e.g. a concurrent sample)
+                self.profile = None
+        return _CURRENT.set(self)
+
+    def _after(self, phase: str, token: contextvars.Token, t0: int, t1: int, t2: int, t3: int) -> None:
+        if self.profile is not None:
+            self.profile.disable()
+        _CURRENT.reset(token)
+        self.add((phase, "state_in"), t1 - t0)
+        self.add((phase, "node"), (t2 - t1) - self.inner_ns)
+        self.add((phase, "state_out"), t3 - t2)
+        self.last_exit_ns = time.perf_counter_ns()
+
+    def run_node(self, phase: str, state: Any, enter: Callable, fn: Callable, exit_: Callable,
+                 t0: int, terminal: bool) -> Dict[str, Any]:
+        token = self._before(phase, t0)
+        t1 = t2 = t3 = t0
+        try:
+            st = enter(state)
+            st.order_details[TRACE_KEY] = self.key
+            t1 = time.perf_counter_ns()
+            st = fn(st)
+            t2 = time.perf_counter_ns()
+            out = exit_(st, t0)
+            t3 = time.perf_counter_ns()
+        except BaseException:
+            self._after(phase, token, t0, t1, t2, t3)
+            get_profiler().abort(self)
+            raise
+        self._after(phase, token, t0, t1, t2, t3)
+        if terminal:
+            get_profiler().finish(self)
+        return out
+
+    async def arun_node(self, phase: str, state: Any, enter: Callable, fn: Callable, exit_: Callable,
+                        t0: int, terminal: bool) -> Dict[str, Any]:
+        token = self._before(phase, t0)
+        t1 = t2 = t3 = t0
+        try:
+            st = enter(state)
+            st.order_details[TRACE_KEY] = self.key
+            t1 = time.perf_counter_ns()
+            st = await fn(st)
+            t2 = time.perf_counter_ns()
+            out = await exit_(st, t0)
+            t3 = time.perf_counter_ns()
+        except BaseException:
+            self._after(phase, token, t0, t1, t2, t3)
+            get_profiler().abort(self)
+            raise
+        self._after(phase, token, t0, t1, t2, t3)
+        if terminal:
+            get_profiler().finish(self)
+        return out
+
+    def folded(self, unit_ns: int = 1000) -> str:
+        """Folded stacks in microseconds, rooted at synapse;<order_id>."""
+        root = f"synapse;{self.order_id}"
+        return "".join(f"{root};{path} {ns // unit_ns}\n" for path, ns in sorted(self.stacks.items()) if ns >= unit_ns)
+
+
+# =========================================================
+# 2) Profiler
+#    Off by default. When on, every Nth order (counted at the graph entry)
+#    gets an OrderTrace; the rest pay one counter increment per order.
+#    - SYNAPSE_PROFILE       -> mode to start with: segments | cprofile | tracemalloc
+#    - SYNAPSE_PROFILE_EVERY -> sample 1 order in N (default 100)
+#    - SYNAPSE_PROFILE_DIR   -> where traces are written (default ./profiles)
+#    - SYNAPSE_PROFILE_STALE_S -> a trace untouched this long (default 300)
+#      is dropped when the next one starts, e.g. a run the graph aborted
+#      between nodes (GraphRecursionError)
+#    Per sampled order it writes <order_id>-<seq>.folded, plus .pstats
+#    (cprofile) or .tracemalloc.txt (tracemalloc), after the terminal node
+#    or when the order parks. An order whose node raises is dropped.
+#    cProfile and tracemalloc are process-wide: a sample that overlaps
+#    another one in cprofile mode keeps its segments but loses its
+#    profile, and tracemalloc snapshots include concurrent orders.
+#    tracemalloc runs while any sampled order holds it, and stops with the
+#    last one (never when something else had started it).
+# =========================================================
+
+class Profiler:
+    def __init__(self, mode: Optional[str] = None, every: int = 100, out_dir: str = "profiles",
+                 stale_s: float = 300.0):
+        self.enabled = False
+        self.mode = "segments"
+        self.every = every
+        self.out_dir = out_dir
+        self.stale_ns = int(stale_s * 1e9)
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=64)
+        self._seen = itertools.count()
+        self._active: Dict[str, OrderTrace] = {}
+        self._tracemalloc_holders = 0
+        self._lock = threading.Lock()
+        if mode:
+            self.configure(mode=mode)
+
+    def configure(self, mode: Optional[str] = None, every: Optional[int] = None,
+                  out_dir: Optional[str] = None, enabled: bool = True) -> None:
+        """Change sampling at runtime; takes effect from the next order."""
+        if mode is not None:
+            if mode not in MODES:
+                raise ValueError(f"Unknown profiling mode: {mode} (expected one of {MODES})")
+            self.mode = mode
+        if every is not None:
+            self.every = max(1, every)
+        if out_dir is not None:
+            self.out_dir = out_dir
+        self.enabled = enabled
+        with self._lock:
+            active = list(self._active.values())
+            if not enabled:
+                self._active.clear()
+        if not enabled or self.mode != "tracemalloc":
+            for trace in active:
+                self._stop_tracemalloc(trace)
+
+    def disable(self) -> None:
+        self.configure(enabled=False)
+
+    def toggle(self) -> bool:
+        self.configure(enabled=not self.enabled)
+        return self.enabled
+
+    def trace_for(self, order: Dict[str, Any]) -> Optional[OrderTrace]:
+        """The run's trace, starting one at the graph entry if it's sampled."""
+        if order.get("_phase"):
+            key = order.get(TRACE_KEY)
+            return self._active.get(key) if key else None
+        seq = next(self._seen)
+        if seq % self.every:
+            return None
+        self._evict_stale()
+        trace = OrderTrace(str(order.get("order_id") or "order"), seq, self.mode)
+        if self.mode == "cprofile":
+            trace.profile = cProfile.Profile()
+        elif self.mode == "tracemalloc":
+            self._hold_tracemalloc(trace)
+        with self._lock:
+            self._active[trace.key] = trace
+        return trace
+
+    def _evict_stale(self) -> None:
+        """Abort traces whose run stopped between nodes and never reached finish/abort."""
+        now = time.perf_counter_ns()
+        with self._lock:
+            stale = [t for t in self._active.values() if now - (t.last_exit_ns or t.started_ns) > self.stale_ns]
+        for trace in stale:
+            self.abort(trace)
+
+    def _hold_tracemalloc(self, trace: OrderTrace) -> None:
+        with self._lock:
+            if not self._tracemalloc_holders:
+                if tracemalloc.is_tracing():
+                    return                    # started by someone else: theirs to stop
+                tracemalloc.start()
+            self._tracemalloc_holders += 1
+            trace.holds_tracemalloc = True
+
+    def _stop_tracemalloc(self, trace: OrderTrace) -> None:
+        """Drop the trace's hold; the last holder stops tracemalloc."""
+        with self._lock:
+            if not trace.holds_tracemalloc:
+                return
+            trace.holds_tracemalloc = False
+            self._tracemalloc_holders -= 1
+            if not self._tracemalloc_holders and tracemalloc.is_tracing():
+                tracemalloc.stop()
+
+    def _release(self, trace: OrderTrace) -> bool:
+        """Take the trace out of _active; False if it already was."""
+        with self._lock:
+            if self._active.get(trace.key) is trace:
+                del self._active[trace.key]
+                return True
+        return False
+
+    def abort(self, trace: OrderTrace) -> None:
+        """A node raised: drop the trace without writing it."""
+        if self._release(trace):
+            self._stop_tracemalloc(trace)
+            self.recent.append({"order_id": trace.order_id, "seq": trace.seq, "mode": trace.mode,
+                                "total_us": (time.perf_counter_ns() - trace.started_ns) / 1000,
+                                "files": [], "aborted": True})
+
+    def park(self, order: Dict[str, Any]) -> None:
+        """The order parked (see langgraph_flow.AWAITS): write what was traced so far."""
+        key = order.get(TRACE_KEY)
+        trace = self._active.get(key) if key else None
+        if trace is not None:
+            self.finish(trace)
+
+    def finish(self, trace: OrderTrace) -> None:
+        if not self._release(trace):
+            return
+        total_ns = time.perf_counter_ns() - trace.started_ns
+        os.makedirs(self.out_dir, exist_ok=True)
+        base = os.path.join(self.out_dir, trace.key)
+        with open(base + ".folded", "w") as f:
+            f.write(trace.folded())
+        files = [base + ".folded"]
+        if trace.profile is not None:
+            trace.profile.dump_stats(base + ".pstats")
+            files.append(base + ".pstats")
+        if trace.mode == "tracemalloc" and tracemalloc.is_tracing():
+            top = tracemalloc.take_snapshot().statistics("lineno")[:30]
+            with open(base + ".tracemalloc.txt", "w") as f:
+                f.write("\n".join(str(stat) for stat in top) + "\n")
+            files.append(base + ".tracemalloc.txt")
+        self._stop_tracemalloc(trace)
+        self.recent.append({"order_id": trace.order_id, "seq": trace.seq, "mode": trace.mode,
+                            "total_us": total_ns / 1000, "files": files,
+                            "segments_us": {path: ns / 1000 for path, ns in sorted(trace.stacks.items())}})
+
+
+_PROFILER = Profiler(
+    mode=os.getenv("SYNAPSE_PROFILE") or None,
+    every=int(os.getenv("SYNAPSE_PROFILE_EVERY", "100")),
+    out_dir=os.getenv("SYNAPSE_PROFILE_DIR", "profiles"),
+    stale_s=float(os.getenv("SYNAPSE_PROFILE_STALE_S", "300")),
+)
+
+def get_profiler() -> Profiler:
+    return _PROFILER
+
+def install_signal_toggle(signum: Optional[int] = None) -> None:
+    """`kill -USR2 <pid>` switches sampling on/off in a running worker (main thread only)."""
+    signal.signal(signum if signum is not None else signal.SIGUSR2, lambda *_: get_profiler().toggle())
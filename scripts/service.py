@@ -0,0 +1,536 @@
+from __future__ import annotations
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs
+
+from scripts.metrics import get_metrics
+from scripts.streaming import Event, astream_order, sse
+
+
+# =========================================================
+# 1) Jobs
+#    One job per submitted order (or incident on a checkpointed order).
+#    Its events are kept for late subscribers, and its final order is
+#    kept until KEEP_JOBS newer jobs have finished.
+# =========================================================
+
+KEEP_EVENTS = 256
+
+
+class Job:
+    __slots__ = ("order_id", "state", "status", "events", "result", "subscribers",
+                 "done", "submitted", "started", "finished")
+
+    def __init__(self, order_id: str, state: Dict[str, Any]):
+        self.order_id = order_id
+        self.state: Optional[Dict[str, Any]] = state
+        self.status = "queued"          # queued -> running -> done | parked | failed
+        self.events: List[Event] = []
+        self.result: Optional[Dict[str, Any]] = None
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.done = asyncio.Event()
+        self.submitted = time.perf_counter_ns()
+        self.started = 0
+        self.finished = 0
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def summary(self) -> Dict[str, Any]:
+        out = {"order_id": self.order_id, "status": self.status, "events": len(self.events)}
+        if self.finished:
+            out["queue_ms"] = (self.started - self.submitted) / 1e6
+            out["run_ms"] = (self.finished - self.started) / 1e6
+        if self.result is not None:
+            out["order_details"] = self.result
+        if self.events and self.events[-1]["type"] == "error":
+            out["error"] = self.events[-1]["error"]
+        return out
+
+
+class QueueFull(Exception):
+    pass
+
+class Conflict(Exception):
+    pass
+
+
+# =========================================================
+# 2) Order service
+#    - submit() admits a job onto a bounded queue and raises QueueFull
+#      when it is full (-> HTTP 429); nothing waits for room
+#    - `workers` tasks take jobs off the queue and run them through the
+#      async-agent graph, publishing every event to the job's
+#      subscribers and to firehose subscribers (the dashboard)
+#    - a subscriber queue that fills up loses events (counted in
+#      synapse_service_events_dropped_total) rather than slowing the graph
+# =========================================================
+
+class OrderService:
+    def __init__(self, workers: int = 32, queue_size: int = 1024, keep_jobs: int = 10_000,
+                 subscriber_buffer: int = 1024, app=None):
+        self.workers = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.keep_jobs = keep_jobs
+        self.subscriber_buffer = subscriber_buffer
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.firehose: Set[asyncio.Queue] = set()
+        self.in_flight = 0
+        self.started = time.time()
+        self._app = app
+        self._tasks: List[asyncio.Task] = []
+        self._metrics = get_metrics()
+
+    def start(self) -> None:
+        if self._app is None:
+            from scripts.async_flow import _shared_async_app
+            self._app = _shared_async_app()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"synapse-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    # ---- admission ----
+    def submit(self, state: Dict[str, Any]) -> Job:
+        order_id = str((state.get("order_details") or {}).get("order_id") or "")
+        if not order_id:
+            raise ValueError("order_details.order_id is required")
+        current = self.jobs.get(order_id)
+        if current is not None and current.active:
+            raise Conflict(f"Order {order_id} is already {current.status}")
+        job = Job(order_id, state)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self._metrics.inc("synapse_service_rejected_total")
+            raise QueueFull(f"{self.queue.qsize()} orders queued") from None
+        self.jobs[order_id] = job
+        self.jobs.move_to_end(order_id)
+        self._metrics.inc("synapse_service_admitted_total")
+        return job
+
+    def submit_incident(self, order_id: str, updates: Dict[str, Any]) -> Optional[Job]:
+        """Resume a checkpointed order with `updates` merged in; None when nothing is stored."""
+        from scripts.langgraph_flow import resume_state
+
+        current = self.jobs.get(order_id)
+        if current is not None and current.active:
+            raise Conflict(f"Order {order_id} is already {current.status}")
+        state = resume_state(order_id, updates)
+        return self.submit(state) if state is not None else None
+
+    # ---- subscriptions ----
+    def subscribe(self, order_id: Optional[str] = None) -> Tuple[asyncio.Queue, List[Event]]:
+        """(live queue, events already published); order_id=None -> every order."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.subscriber_buffer)
+        if order_id is None:
+            self.firehose.add(queue)
+            return queue, []
+        job = self.jobs.get(order_id)
+        if job is None:
+            raise KeyError(order_id)
+        if job.active:
+            job.subscribers.add(queue)
+        else:
+            queue.put_nowait(None)
+        return queue, list(job.events)
+
+    def unsubscribe(self, queue: asyncio.Queue, order_id: Optional[str] = None) -> None:
+        self.firehose.discard(queue)
+        job = self.jobs.get(order_id) if order_id else None
+        if job is not None:
+            job.subscribers.discard(queue)
+
+    def _publish(self, job: Job, event: Optional[Event]) -> None:
+        """event=None closes the job's subscriptions."""
+        if event is not None and len(job.events) < KEEP_EVENTS:
+            job.events.append(event)
+        targets = list(job.subscribers) + (list(self.firehose) if event is not None else [])
+        for queue in targets:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self._metrics.inc("synapse_service_events_dropped_total")
+
+    # ---- workers ----
+    async def _worker(self) -> None:
+        while True:
+            job: Job = await self.queue.get()
+            job.status = "running"
+            job.started = time.perf_counter_ns()
+            self.in_flight += 1
+            try:
+                async for event in astream_order(job.state, app=self._app, include_order=True):
+                    if event["type"] == "end":
+                        job.result = event.pop("order_details")
+                        job.status = "parked" if event["parked"] else "done"
+                    elif event["type"] == "error":
+                        job.status = "failed"
+                    self._publish(job, event)
+            except Exception as e:           # astream_order reports node errors itself; this is a bug guard
+                job.status = "failed"
+                self._publish(job, {"type": "error", "order_id": job.order_id, "seq": len(job.events) + 1,
+                                    "error": f"{type(e).__name__}: {e}"})
+            finally:
+                job.state = None
+                job.finished = time.perf_counter_ns()
+                self.in_flight -= 1
+                self._publish(job, None)
+                job.subscribers.clear()
+                job.done.set()
+                self.queue.task_done()
+                self._metrics.inc("synapse_service_orders_total", (("status", job.status),))
+                self._metrics.observe("synapse_service_queue_wait_seconds", job.started - job.submitted)
+                self._metrics.observe("synapse_service_order_seconds", job.finished - job.submitted)
+                self._evict()
+
+    def _evict(self) -> None:
+        while len(self.jobs) > self.keep_jobs:
+            order_id, job = next(iter(self.jobs.items()))
+            if job.active:
+                break
+            del self.jobs[order_id]
+
+    # ---- introspection ----
+    def health(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "uptime_s": round(time.time() - self.started, 1),
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "jobs": len(self.jobs),
+            "subscribers": len(self.firehose),
+        }
+
+    def prometheus(self) -> str:
+        gauges = (("synapse_service_in_flight", self.in_flight), ("synapse_service_queued", self.queue.qsize()),
+                  ("synapse_service_queue_capacity", self.queue.maxsize))
+        extra = "".join(f"# TYPE {name} gauge\n{name} {value}\n" for name, value in gauges)
+        return self._metrics.to_prometheus() + extra
+
+
+# =========================================================
+# 3) HTTP / WebSocket front end (stdlib asyncio, HTTP/1.1 keep-alive)
+#    POST /orders                 -> 202 {order_id, status, events, ws}; 429 when
+#                                    the queue is full, 409 if the order is in flight
+#                                    ?wait=1 -> 200 with the final order instead
+#    POST /incidents              -> {"order_id", "updates"}: resume a checkpointed
+#                                    order (needs SYNAPSE_CHECKPOINT_DB)
+#    GET  /orders/<id>            -> job status (+ final order when finished)
+#    GET  /orders/<id>/events     -> Server-Sent Events for one order
+#    GET  /ws[?order_id=<id>]     -> WebSocket: JSON events for one order, or all;
+#                                    clients may send {"order": {...}} to submit
+#    GET  /healthz, GET /metrics  -> JSON health, Prometheus text
+#    Bodies need Content-Length (no chunked uploads); WebSocket messages
+#    must be single unfragmented frames.
+# =========================================================
+
+MAX_BODY = 1 << 20
+_WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC11B85"
+_REASONS = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+            409: "Conflict", 411: "Length Required", 413: "Payload Too Large", 429: "Too Many Requests",
+            500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+def _order_state(body: Any) -> Dict[str, Any]:
+    """Accepts a full state ({"order_details": ...}) or bare order_details."""
+    if not isinstance(body, dict):
+        raise ValueError("expected a JSON object")
+    order = body.get("order_details") if "order_details" in body else body
+    if not isinstance(order, dict):
+        raise ValueError("order_details must be an object")
+    return {"messages": [], "order_details": order, "audit_log": list(body.get("audit_log") or [])}
+
+def _route_label(method: str, path: str) -> str:
+    parts = path.strip("/").split("/")
+    if parts[0] == "orders" and len(parts) > 1:
+        return f"{method} /orders/{{id}}" + ("/events" if len(parts) > 2 else "")
+    return f"{method} /{parts[0]}"
+
+
+class Response(Exception):
+    """Raised by handlers to answer with an error status."""
+    def __init__(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        super().__init__(status)
+        self.status = status
+        self.payload = payload
+        self.headers = headers or {}
+
+
+class HttpServer:
+    def __init__(self, service: OrderService):
+        self.service = service
+        self._metrics = get_metrics()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self._connection, host, port, limit=MAX_BODY, backlog=1024)
+
+    # ---- connection loop ----
+    async def _connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                try:
+                    method, target, version = line.decode("latin-1").split()
+                except ValueError:
+                    await self._send(writer, 400, {"error": "bad request line"}, keep_alive=False)
+                    return
+                headers: Dict[str, str] = {}
+                while True:
+                    h = await reader.readline()
+                    if h in (b"\r\n", b"\n", b""):
+                        break
+                    k, _, v = h.decode("latin-1").partition(":")
+                    headers[k.strip().lower()] = v.strip()
+                path, _, query = target.partition("?")
+                keep_alive = version == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+
+                if headers.get("upgrade", "").lower() == "websocket" and path == "/ws":
+                    await self._websocket(reader, writer, headers, parse_qs(query))
+                    return
+                if method == "GET" and path.startswith("/orders/") and path.endswith("/events"):
+                    await self._sse(writer, path[len("/orders/"):-len("/events")])
+                    return
+
+                status, payload, extra = 500, {"error": "internal"}, {}
+                try:
+                    if headers.get("transfer-encoding"):
+                        raise Response(411, {"error": "send a Content-Length body"})
+                    length = int(headers.get("content-length") or 0)
+                    if length > MAX_BODY:
+                        raise Response(413, {"error": f"body over {MAX_BODY} bytes"})
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = await self._dispatch(method, path, parse_qs(query), body)
+                except Response as r:
+                    status, payload, extra = r.status, r.payload, r.headers
+                except Exception as e:
+                    payload = {"error": f"{type(e).__name__}: {e}"}
+                self._metrics.inc("synapse_http_requests_total",
+                                  (("route", _route_label(method, path)), ("code", str(status))))
+                await self._send(writer, status, payload, keep_alive, extra)
+                if not keep_alive or status == 413:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _send(self, writer: asyncio.StreamWriter, status: int, payload: Any, keep_alive: bool = True,
+                    headers: Optional[Dict[str, str]] = None) -> None:
+        if isinstance(payload, str):
+            body, ctype = payload.encode(), "text/plain; version=0.0.4"
+        else:
+            body, ctype = json.dumps(payload, separators=(",", ":"), default=str).encode(), "application/json"
+        head = [f"HTTP/1.1 {status} {_REASONS.get(status, '')}", f"Content-Type: {ctype}",
+                f"Content-Length: {len(body)}", "Connection: " + ("keep-alive" if keep_alive else "close")]
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+        await writer.drain()
+
+    # ---- plain requests ----
+    async def _dispatch(self, method: str, path: str, query: Dict[str, List[str]], body: bytes) -> Tuple[int, Any]:
+        service = self.service
+        if path == "/healthz":
+            return 200, service.health()
+        if path == "/metrics":
+            return 200, service.prometheus()
+        if path == "/orders" or path == "/incidents":
+            if method != "POST":
+                raise Response(405, {"error": "use POST"})
+            try:
+                data = json.loads(body or b"null")
+                if path == "/orders":
+                    job = service.submit(_order_state(data))
+                else:
+                    if not isinstance(data, dict) or not data.get("order_id"):
+                        raise ValueError("expected {\"order_id\": ..., \"updates\": {...}}")
+                    job = service.submit_incident(str(data["order_id"]), data.get("updates") or {})
+                    if job is None:
+                        raise Response(404, {"error": f"no checkpoint for order {data['order_id']}"})
+            except QueueFull as e:
+                raise Response(429, {"error": "queue full", "detail": str(e)}, {"Retry-After": "1"})
+            except Conflict as e:
+                raise Response(409, {"error": str(e)})
+            except ValueError as e:      # json.JSONDecodeError included; no checkpointer configured
+                raise Response(400, {"error": str(e)})
+            if query.get("wait", ["0"])[0] not in ("0", "false", ""):
+                await job.done.wait()
+                return 200, job.summary()
+            return 202, {"order_id": job.order_id, "status": job.status,
+                         "events": f"/orders/{job.order_id}/events", "ws": f"/ws?order_id={job.order_id}"}
+        if path.startswith("/orders/"):
+            if method != "GET":
+                raise Response(405, {"error": "use GET"})
+            job = service.jobs.get(path[len("/orders/"):])
+            if job is None:
+                raise Response(404, {"error": "unknown order"})
+            return 200, job.summary()
+        raise Response(404, {"error": "not found"})
+
+    # ---- Server-Sent Events ----
+    async def _sse(self, writer: asyncio.StreamWriter, order_id: str) -> None:
+        try:
+            queue, backlog = self.service.subscribe(order_id)
+        except KeyError:
+            await self._send(writer, 404, {"error": "unknown order"}, keep_alive=False)
+            return
+        self._metrics.inc("synapse_http_requests_total", (("route", "GET /orders/{id}/events"), ("code", "200")))
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                     b"Connection: close\r\n\r\n")
+        try:
+            for event in backlog:
+                writer.write(sse(event).encode())
+            await writer.drain()
+            seen = backlog[-1]["seq"] if backlog else 0
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                if event["seq"] > seen:
+                    writer.write(sse(event).encode())
+                    await writer.drain()
+        finally:
+            self.service.unsubscribe(queue, order_id)
+
+    # ---- WebSocket (RFC 6455, text frames) ----
+    async def _websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                         headers: Dict[str, str], query: Dict[str, List[str]]) -> None:
+        key = headers.get("sec-websocket-key")
+        if not key:
+            await self._send(writer, 400, {"error": "missing Sec-WebSocket-Key"}, keep_alive=False)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + _WS_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await writer.drain()
+        self._metrics.inc("synapse_http_requests_total", (("route", "GET /ws"), ("code", "101")))
+
+        order_id = (query.get("order_id") or [None])[0]
+        try:
+            queue, backlog = self.service.subscribe(order_id)
+        except KeyError:
+            await _ws_send(writer, {"type": "error", "error": f"unknown order {order_id}"})
+            await _ws_close(writer)
+            return
+        for event in backlog:
+            await _ws_send(writer, event)
+
+        async def pump() -> None:
+            while True:
+                event = await queue.get()
+                if event is None:          # the subscribed order finished
+                    await _ws_close(writer)
+                    return
+                await _ws_send(writer, event)
+
+        pumping = asyncio.create_task(pump())
+        try:
+            while not pumping.done():
+                frame = await _ws_recv(reader, writer)
+                if frame is None:
+                    break
+                await self._ws_command(writer, frame)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            pumping.cancel()
+            self.service.unsubscribe(queue, order_id)
+
+    async def _ws_command(self, writer: asyncio.StreamWriter, text: str) -> None:
+        try:
+            msg = json.loads(text)
+            job = self.service.submit(_order_state(msg.get("order") if isinstance(msg, dict) else None))
+            await _ws_send(writer, {"type": "accepted", "order_id": job.order_id})
+        except QueueFull as e:
+            await _ws_send(writer, {"type": "rejected", "status": 429, "error": str(e)})
+        except (Conflict, ValueError) as e:
+            await _ws_send(writer, {"type": "rejected", "status": 409 if isinstance(e, Conflict) else 400,
+                                    "error": str(e)})
+
+
+async def _ws_send(writer: asyncio.StreamWriter, payload: Any, opcode: int = 0x1) -> None:
+    data = payload if isinstance(payload, bytes) else json.dumps(payload, separators=(",", ":"), default=str).encode()
+    n = len(data)
+    if n < 126:
+        head = struct.pack("!BB", 0x80 | opcode, n)
+    elif n < 1 << 16:
+        head = struct.pack("!BBH", 0x80 | opcode, 126, n)
+    else:
+        head = struct.pack("!BBQ", 0x80 | opcode, 127, n)
+    writer.write(head + data)
+    await writer.drain()
+
+async def _ws_close(writer: asyncio.StreamWriter) -> None:
+    await _ws_send(writer, struct.pack("!H", 1000), opcode=0x8)
+
+async def _ws_recv(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> Optional[str]:
+    """Next text message; answers pings; None once the client closes."""
+    while True:
+        b0, b1 = await reader.readexactly(2)
+        opcode, n = b0 & 0x0F, b1 & 0x7F
+        if n == 126:
+            (n,) = struct.unpack("!H", await reader.readexactly(2))
+        elif n == 127:
+            (n,) = struct.unpack("!Q", await reader.readexactly(8))
+        if n > MAX_BODY:
+            return None
+        mask = await reader.readexactly(4) if b1 & 0x80 else b"\0\0\0\0"
+        data = bytes(b ^ mask[i & 3] for i, b in enumerate(await reader.readexactly(n)))
+        if opcode == 0x8:
+            return None
+        if opcode == 0x9:
+            await _ws_send(writer, data, opcode=0xA)
+        elif opcode == 0x1:
+            return data.decode()
+
+
+# =========================================================
+# 4) Entry point
+#    - SYNAPSE_SERVICE_WORKERS -> graph runs in flight (default 32)
+#    - SYNAPSE_SERVICE_QUEUE   -> admitted-but-waiting orders before 429 (default 1024)
+# =========================================================
+
+async def run_service(host: str = "127.0.0.1", port: int = 8080, workers: Optional[int] = None,
+                      queue_size: Optional[int] = None) -> None:
+    service = OrderService(
+        workers=workers or int(os.getenv("SYNAPSE_SERVICE_WORKERS", "32")),
+        queue_size=queue_size or int(os.getenv("SYNAPSE_SERVICE_QUEUE", "1024")),
+    )
+    service.start()
+    server = await HttpServer(service).serve(host, port)
+    print(f"synapse service on http://{host}:{port} "
+          f"(workers={service.workers}, queue={service.queue.maxsize})", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Serve the order graph over HTTP / WebSocket.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--queue", type=int, help="queue size before 429s")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run_service(args.host, args.port, args.workers, args.queue))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,310 @@
+from __future__ import annotations
+import multiprocessing as mp
+import os
+import time
+import zlib
+from multiprocessing.connection import Connection, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from scripts.batch_runner import BatchReport, OrderResult, _as_input, _order_id, preassign_couriers
+from scripts.core_datastructures import AgentState
+from scripts.metrics import get_metrics
+
+
+# =========================================================
+# 1) Sharding
+#    An order always lands on the same worker: crc32(order_id) % shards.
+#    (Python's hash() is salted per process, so it cannot be used.)
+#    Orders without an id are spread round-robin.
+# =========================================================
+
+def shard_of(order_id: Optional[str], shards: int) -> int:
+    return zlib.crc32(str(order_id).encode()) % shards
+
+
+# =========================================================
+# 2) Worker process
+#    Started once and kept for every batch, so each worker holds its own
+#    warm compiled graph, merchant store and TTL caches.
+#    - forkserver (the default where available, else spawn) -> the child
+#      imports everything afresh and compiles its own graph; a data source
+#      the parent installed with set_data_source() must be re-created by
+#      `initializer`, which runs in each worker first (the runner refuses
+#      to start without one)
+#    - fork (opt-in) -> the child inherits the parent's compiled graph and
+#      data source. The parent is usually multi-threaded by then, so the
+#      runner first pauses the audit sync thread and shuts down the
+#      parallel-checks pool; threads of the caller's own are not touched
+#    - audit records go to <audit dir>/shard-NN: the store is single-writer
+#    - checkpoints share the parent's SQLite file (WAL handles several
+#      writers; an order only ever runs on its own shard)
+#    Wire format: the parent sends (batch, [state, ...]) chunks; the worker
+#    answers (batch, [(ok, error, order_details | None), ...]) in the same
+#    order, as plain tuples: no pydantic models cross the pipe, and the
+#    final order is only sent back when the caller keeps orders.
+#    After each run the parent sends "metrics"; the worker answers with
+#    Metrics.dump(reset=True) (non-empty buckets only), which the parent
+#    absorbs, so node / agent / route series cover every shard.
+# =========================================================
+
+def _shard_main(shard: int, conn: Connection, config: Dict[str, Any]) -> None:
+    from scripts.audit_store import AuditStore, get_audit_store, set_audit_store
+    from scripts.checkpoints import Checkpointer, get_checkpointer, set_checkpointer
+    from scripts.langgraph_flow import get_app
+
+    t0 = time.perf_counter()
+    metrics = get_metrics()
+    metrics.reset()             # a forked child starts with the parent's counters
+    if config["initializer"] is not None:
+        config["initializer"]()
+    if config["audit_dir"]:
+        set_audit_store(AuditStore(config["audit_dir"], sync_interval_s=config["audit_sync_s"]))
+    if config["checkpoint_db"] and getattr(get_checkpointer(), "path", None) != config["checkpoint_db"]:
+        set_checkpointer(Checkpointer(config["checkpoint_db"]))
+    app = get_app()
+    conn.send(("ready", os.getpid(), (time.perf_counter() - t0) * 1e3))
+
+    concurrency, keep_orders = config["concurrency"], config["keep_orders"]
+    try:
+        while True:
+            msg = conn.recv()
+            if msg is None:
+                break
+            if msg == "metrics":
+                conn.send(("metrics", metrics.dump(reset=True)))
+                continue
+            batch, states = msg
+            outputs = app.batch(states, config={"max_concurrency": concurrency}, return_exceptions=True)
+            rows = []
+            for out in outputs:
+                if isinstance(out, Exception):
+                    rows.append((False, f"{type(out).__name__}: {out}", None))
+                else:
+                    rows.append((True, None, out.get("order_details", {}) if keep_orders else None))
+            conn.send((batch, rows))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        store = get_audit_store()
+        if store is not None:
+            store.close()
+        conn.close()
+
+
+class _Shard:
+    __slots__ = ("index", "process", "conn", "pid", "warm_ms")
+
+    def __init__(self, index: int, process, conn: Connection):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.pid: Optional[int] = None
+        self.warm_ms = 0.0
+
+
+# =========================================================
+# 3) Sharded runner
+#    Each shard gets its orders in chunks of chunk_size with up to
+#    `pipeline` chunks outstanding, so a worker never waits on the parent
+#    between chunks. Inside a worker, chunks run through app.batch like
+#    batch_runner.run_orders.
+#    - SYNAPSE_SHARDS -> default worker count (default: CPU count)
+# =========================================================
+
+class ShardedRunner:
+    def __init__(self, workers: Optional[int] = None, concurrency: int = 8, chunk_size: int = 64,
+                 pipeline: int = 2, keep_orders: bool = True, start_method: Optional[str] = None,
+                 initializer: Optional[Callable[[], None]] = None):
+        """
+        - concurrency -> orders in flight inside each worker (max_concurrency)
+        - keep_orders=False -> results carry only ok/error, not the final order
+        - start_method -> "forkserver" / "spawn" / "fork"; None -> forkserver
+          where available, else spawn
+        - initializer -> picklable callable run first in every worker, e.g.
+          to call set_data_source(); required for spawn / forkserver when
+          the parent replaced the data source
+        """
+        self.workers = max(1, workers or int(os.getenv("SYNAPSE_SHARDS", "0")) or os.cpu_count() or 1)
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = max(1, chunk_size)
+        self.pipeline = max(1, pipeline)
+        self.keep_orders = keep_orders
+        self.start_method = start_method
+        self.initializer = initializer
+        self.shards: List[_Shard] = []
+
+    def _context(self):
+        from scripts.data_sources import is_default_source
+
+        method = self.start_method
+        if method is None:
+            method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+        if method != "fork" and self.initializer is None and not is_default_source():
+            raise ValueError(f"{method} workers would not see the data source installed with set_data_source(); "
+                             "pass initializer= to re-create it in each worker, or use fork")
+        return mp.get_context(method)
+
+    def start(self) -> "ShardedRunner":
+        from scripts.audit_store import get_audit_store
+        from scripts.checkpoints import get_checkpointer
+
+        if self.shards:
+            return self
+        ctx = self._context()
+        store, checkpointer = get_audit_store(), get_checkpointer()
+        if ctx.get_start_method() == "fork":
+            from scripts.langgraph_flow import get_app, shutdown_check_pool
+            get_app()           # compile once here; every child inherits it
+            # no background thread of ours may hold a lock while the children fork
+            shutdown_check_pool()
+            if store is not None:
+                store.pause()
+        for i in range(self.workers):
+            config = {
+                "concurrency": self.concurrency,
+                "keep_orders": self.keep_orders,
+                "initializer": self.initializer,
+                "audit_dir": os.path.join(store.path, f"shard-{i:02d}") if store is not None else None,
+                "audit_sync_s": store.sync_interval_s if store is not None else 0.2,
+                "checkpoint_db": checkpointer.path if checkpointer is not None else None,
+            }
+            parent, child = ctx.Pipe()
+            process = ctx.Process(target=_shard_main, args=(i, child, config), name=f"synapse-shard-{i}", daemon=True)
+            process.start()
+            child.close()
+            self.shards.append(_Shard(i, process, parent))
+        for shard in self.shards:
+            try:
+                _, shard.pid, shard.warm_ms = shard.conn.recv()
+            except EOFError:
+                shard.process.join(timeout=10)
+                code = shard.process.exitcode
+                self.close()
+                raise RuntimeError(f"shard {shard.index} worker failed to start (exit code {code})") from None
+        return self
+
+    def close(self) -> None:
+        for shard in self.shards:
+            try:
+                shard.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for shard in self.shards:
+            shard.process.join(timeout=10)
+            if shard.process.is_alive():
+                shard.process.terminate()
+            shard.conn.close()
+        self.shards = []
+
+    def __enter__(self) -> "ShardedRunner":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    # ---- running ----
+    def run(self, states: Iterable[Union[AgentState, Dict[str, Any]]], dispatch_window: int = 0) -> BatchReport:
+        """
+        Same contract as batch_runner.run_orders(): results in input order,
+        a failing order (or a dead worker) is reported, never raised.
+        - dispatch_window -> courier pre-assignment runs here, in the parent,
+          over the whole batch before it is sharded
+        """
+        self.start()
+        inputs = [_as_input(s) for s in states]
+        if dispatch_window > 0:
+            preassign_couriers(inputs, dispatch_window)
+
+        # per shard: chunks of input indices, sent in order
+        queues: List[List[List[int]]] = [[] for _ in self.shards]
+        n = len(self.shards)
+        for idx, inp in enumerate(inputs):
+            order_id = _order_id(inp)
+            q = queues[shard_of(order_id, n) if order_id is not None else idx % n]
+            if not q or len(q[-1]) >= self.chunk_size:
+                q.append([])
+            q[-1].append(idx)
+
+        rows: List[Optional[Tuple[bool, Optional[str], Optional[Dict[str, Any]]]]] = [None] * len(inputs)
+        outstanding: Dict[Tuple[int, int], List[int]] = {}
+        sent = [0] * n
+        by_conn = {shard.conn: shard for shard in self.shards}
+
+        def send(shard: _Shard) -> None:
+            i = shard.index
+            while sent[i] < len(queues[i]) and sum(1 for s, _ in outstanding if s == i) < self.pipeline:
+                chunk = queues[i][sent[i]]
+                outstanding[(i, sent[i])] = chunk
+                shard.conn.send((sent[i], [inputs[k] for k in chunk]))
+                sent[i] += 1
+
+        def fail(shard: _Shard, error: str) -> None:
+            i = shard.index
+            for key in [key for key in outstanding if key[0] == i]:
+                for k in outstanding.pop(key):
+                    rows[k] = (False, error, None)
+            for chunk in queues[i][sent[i]:]:
+                for k in chunk:
+                    rows[k] = (False, error, None)
+            sent[i] = len(queues[i])
+            by_conn.pop(shard.conn, None)
+
+        start = time.perf_counter()
+        for shard in self.shards:
+            try:
+                send(shard)
+            except (BrokenPipeError, OSError):
+                fail(shard, f"shard {shard.index} worker is gone")
+        while outstanding:
+            for conn in wait(list(by_conn)):
+                shard = by_conn[conn]
+                try:
+                    batch, out = conn.recv()
+                except (EOFError, OSError):
+                    fail(shard, f"shard {shard.index} worker exited (code {shard.process.exitcode})")
+                    continue
+                for k, row in zip(outstanding.pop((shard.index, batch)), out):
+                    rows[k] = row
+                try:
+                    send(shard)
+                except (BrokenPipeError, OSError):
+                    fail(shard, f"shard {shard.index} worker is gone")
+        elapsed = time.perf_counter() - start
+        self._collect_metrics(list(by_conn))
+        if len(by_conn) < len(self.shards):
+            self.close()        # a worker died: the next run starts a full set again
+
+        results: List[OrderResult] = []
+        for inp, (ok, error, order) in zip(inputs, rows):
+            results.append(OrderResult.model_construct(order_id=_order_id(inp), ok=ok, error=error,
+                                                       order_details=order or {}))
+        succeeded = sum(1 for r in results if r.ok)
+        metrics = get_metrics()
+        metrics.inc("synapse_orders_total", (("outcome", "ok"),), succeeded)
+        metrics.inc("synapse_orders_total", (("outcome", "failed"),), len(results) - succeeded)
+        return BatchReport(
+            results=results,
+            total=len(results),
+            succeeded=succeeded,
+            failed=len(results) - succeeded,
+            elapsed_s=elapsed,
+            orders_per_sec=(len(results) / elapsed) if elapsed > 0 else 0.0,
+        )
+
+
+    def _collect_metrics(self, conns: List[Connection]) -> None:
+        metrics = get_metrics()
+        for conn in conns:
+            try:
+                conn.send("metrics")
+                _, dumped = conn.recv()
+            except (EOFError, OSError):
+                continue
+            metrics.absorb(dumped)
+
+
+def run_sharded(states: Iterable[Union[AgentState, Dict[str, Any]]], workers: Optional[int] = None,
+                concurrency: int = 8, dispatch_window: int = 0, **kwargs) -> BatchReport:
+    """One-shot ShardedRunner: start the workers, run the batch, stop them."""
+    with ShardedRunner(workers=workers, concurrency=concurrency, **kwargs) as runner:
+        return runner.run(states, dispatch_window=dispatch_window)
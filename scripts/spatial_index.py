@@ -0,0 +1,291 @@
+from __future__ import annotations
+import heapq
+import math
+import os
+import threading
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from scripts.geo import EARTH_RADIUS_KM, KM_PER_DEG_LAT, haversine_km
+
+
+class _Courier:
+    __slots__ = ("id", "lat", "lng", "cell", "status", "vehicle_type", "vol_cap_l", "weight_cap_kg", "insulated")
+
+    def __init__(self, courier_id: str):
+        self.id = courier_id
+        self.cell: Optional[Tuple[int, int]] = None
+
+
+# =========================================================
+# Uniform-grid spatial index over courier positions.
+#   - cells are cell_deg x cell_deg buckets of courier ids
+#   - k-nearest search scans rings of cells outward from the query
+#     and stops once no unscanned cell can beat the k-th best hit
+#   - position/status updates move one id between two buckets: O(1)
+#   - claim() is a check-and-set on status, so two dispatches racing for
+#     the same nearest courier can't both take it
+#   - SYNAPSE_COURIER_RADIUS_KM -> default search cap (default 50 km): a
+#     query far from the fleet stops there instead of scoring every courier
+# =========================================================
+
+MAX_RADIUS_KM = float(os.getenv("SYNAPSE_COURIER_RADIUS_KM", "50"))
+
+class CourierSpatialIndex:
+    def __init__(self, cell_deg: float = 0.01):
+        self.cell_deg = cell_deg
+        self._cells: Dict[Tuple[int, int], set] = {}
+        self._couriers: Dict[str, _Courier] = {}
+        self._bounds: Optional[List[int]] = None  # min_x, min_y, max_x, max_y of occupied cells
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._couriers)
+
+    def __contains__(self, courier_id: str) -> bool:
+        return courier_id in self._couriers
+
+    def _cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (int(math.floor(lat / self.cell_deg)), int(math.floor(lng / self.cell_deg)))
+
+    def _place(self, c: _Courier, lat: float, lng: float) -> None:
+        cell = self._cell(lat, lng)
+        c.lat, c.lng = lat, lng
+        if cell == c.cell:
+            return
+        if c.cell is not None:
+            bucket = self._cells.get(c.cell)
+            if bucket is not None:
+                bucket.discard(c.id)
+                if not bucket:
+                    del self._cells[c.cell]
+        self._cells.setdefault(cell, set()).add(c.id)
+        c.cell = cell
+        if self._bounds is None:
+            self._bounds = [cell[0], cell[1], cell[0], cell[1]]
+        else:
+            b = self._bounds
+            b[0], b[1] = min(b[0], cell[0]), min(b[1], cell[1])
+            b[2], b[3] = max(b[2], cell[0]), max(b[3], cell[1])
+
+    # ---- writes ----
+    def upsert(self, courier_id: str, record: Dict[str, Any]) -> None:
+        """Insert or refresh a courier from a MOCK_DATABASE-shaped record."""
+        loc = record.get("location")
+        if not loc:
+            return
+        vehicle = record.get("vehicle_capacity", {}) or {}
+        with self._lock:
+            c = self._couriers.get(courier_id)
+            if c is None:
+                c = self._couriers[courier_id] = _Courier(courier_id)
+            c.status = record.get("status")
+            c.vehicle_type = vehicle.get("type")
+            c.vol_cap_l = float(vehicle.get("vol_cap_l", 0) or 0)
+            c.weight_cap_kg = float(vehicle.get("weight_cap_kg", 0) or 0)
+            c.insulated = bool((record.get("special_equipment", {}) or {}).get("insulated_container"))
+            self._place(c, float(loc[0]), float(loc[1]))
+
+    def update_position(self, courier_id: str, lat: float, lng: float) -> bool:
+        """Telemetry tick; returns False for couriers the index does not know."""
+        with self._lock:
+            c = self._couriers.get(courier_id)
+            if c is None:
+                return False
+            self._place(c, float(lat), float(lng))
+            return True
+
+    def update_status(self, courier_id: str, status: str) -> bool:
+        with self._lock:
+            c = self._couriers.get(courier_id)
+            if c is None:
+                return False
+            c.status = status
+            return True
+
+    def claim(self, courier_id: str, status: str = "busy", expect: Iterable[str] = ("available",)) -> bool:
+        """Set status only while the courier is in one of expect; False if someone got there first."""
+        with self._lock:
+            c = self._couriers.get(courier_id)
+            if c is None or c.status not in expect:
+                return False
+            c.status = status
+            return True
+
+    def remove(self, courier_id: str) -> None:
+        with self._lock:
+            c = self._couriers.pop(courier_id, None)
+            if c is not None and c.cell is not None:
+                bucket = self._cells.get(c.cell)
+                if bucket is not None:
+                    bucket.discard(courier_id)
+                    if not bucket:
+                        del self._cells[c.cell]
+
+    # ---- reads ----
+    def position(self, courier_id: Optional[str]) -> Optional[Tuple[float, float]]:
+        c = self._couriers.get(courier_id) if courier_id else None
+        return (c.lat, c.lng) if c is not None else None
+
+    def describe(self, courier_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Indexed attributes of one courier (position, status, vehicle limits)."""
+        c = self._couriers.get(courier_id) if courier_id else None
+        if c is None:
+            return None
+        return {"lat": c.lat, "lng": c.lng, "status": c.status, "vehicle_type": c.vehicle_type,
+                "vol_cap_l": c.vol_cap_l, "weight_cap_kg": c.weight_cap_kg, "insulated": c.insulated}
+
+    def nearest(self, lat: float, lng: float, k: int = 1,
+                statuses: Optional[Iterable[str]] = ("available",),
+                vehicle_types: Optional[Iterable[str]] = None,
+                min_vol_l: float = 0.0,
+                min_weight_kg: float = 0.0,
+                require_insulated: bool = False,
+                exclude: Iterable[str] = (),
+                candidates: Optional[Iterable[str]] = None,
+                max_radius_km: Optional[float] = MAX_RADIUS_KM) -> List[Tuple[str, float]]:
+        """
+        k nearest couriers to (lat, lng) passing every filter, as
+        [(courier_id, distance_km)] sorted by distance.
+        - statuses=None -> any status
+        - candidates -> only consider these ids (e.g. an explicit pool)
+        - max_radius_km=None -> no cap (may score the whole fleet)
+        """
+        statuses = set(statuses) if statuses is not None else None
+        vehicle_types = set(vehicle_types) if vehicle_types is not None else None
+        exclude = set(exclude)
+        allowed = set(candidates) if candidates is not None else None
+
+        def ok(c: _Courier) -> bool:
+            return ((statuses is None or c.status in statuses)
+                    and (vehicle_types is None or c.vehicle_type in vehicle_types)
+                    and c.vol_cap_l >= min_vol_l
+                    and c.weight_cap_kg >= min_weight_kg
+                    and (not require_insulated or c.insulated)
+                    and c.id not in exclude
+                    and (allowed is None or c.id in allowed))
+
+        with self._lock:
+            if allowed is not None and len(allowed) <= 64:
+                # small explicit pool: scoring it directly beats a ring search
+                hits = [
+                    (haversine_km(lat, lng, c.lat, c.lng), c.id)
+                    for c in (self._couriers.get(cid) for cid in allowed)
+                    if c is not None and ok(c)
+                ]
+                hits.sort()
+                if max_radius_km is not None:
+                    hits = [h for h in hits if h[0] <= max_radius_km]
+                return [(cid, d) for d, cid in hits[:k]]
+
+            if self._bounds is None or k <= 0:
+                return []
+            cx, cy = self._cell(lat, lng)
+            b = self._bounds
+            max_ring = max(abs(cx - b[0]), abs(cx - b[2]), abs(cy - b[1]), abs(cy - b[3]))
+            limit = max_radius_km if max_radius_km is not None else math.inf
+
+            best: List[Tuple[float, str]] = []  # max-heap of (-dist, id)
+            for r, cells in self._rings_outward(cx, cy, max_ring):
+                floor_km = self._ring_floor_km(lat, r)
+                if floor_km > limit or (len(best) == k and -best[0][0] <= floor_km):
+                    break
+                for cell in cells:
+                    bucket = self._cells.get(cell)
+                    if not bucket:
+                        continue
+                    for cid in bucket:
+                        c = self._couriers[cid]
+                        if not ok(c):
+                            continue
+                        d = haversine_km(lat, lng, c.lat, c.lng)
+                        if d > limit:
+                            continue
+                        if len(best) < k:
+                            heapq.heappush(best, (-d, cid))
+                        elif d < -best[0][0]:
+                            heapq.heapreplace(best, (-d, cid))
+            return [(cid, -nd) for nd, cid in sorted(best, reverse=True)]
+
+    def _ring_floor_km(self, lat: float, r: int) -> float:
+        """
+        Lower bound on the distance from a query at `lat` to any courier in
+        ring r or beyond: at least r-1 whole cells away on one axis.
+        - latitude axis -> exact, a degree of latitude is KM_PER_DEG_LAT
+        - longitude axis -> a point that is not r-1 cells away in latitude
+          lies within |lat| + (r-1) cells of the equator, so the cosine is
+          taken there (per ring, not once for the query)
+        """
+        if r <= 1:
+            return 0.0
+        gap_deg = (r - 1) * self.cell_deg
+        lat_km = gap_deg * KM_PER_DEG_LAT
+        cos_max = math.cos(math.radians(min(90.0, abs(lat) + gap_deg)))
+        # haversine across gap_deg of longitude, both ends at the highest latitude
+        lng_km = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, cos_max * math.sin(math.radians(min(180.0, gap_deg)) / 2)))
+        return min(lat_km, lng_km)
+
+    def _rings_outward(self, cx: int, cy: int, max_ring: int):
+        """(r, cells) from the query cell outward, one ring at a time."""
+        for r in range(max_ring + 1):
+            if (2 * r + 1) ** 2 > 4 * len(self._cells):
+                # rings now cost more than the occupied cells left: group those by ring once
+                rest: Dict[int, List[Tuple[int, int]]] = {}
+                for cell in self._cells:
+                    d = max(abs(cell[0] - cx), abs(cell[1] - cy))
+                    if d >= r:
+                        rest.setdefault(d, []).append(cell)
+                for d in sorted(rest):
+                    yield d, rest[d]
+                return
+            yield r, self._ring(cx, cy, r)
+
+    @staticmethod
+    def _ring(cx: int, cy: int, r: int):
+        if r == 0:
+            yield (cx, cy)
+            return
+        for dy in range(-r, r + 1):
+            yield (cx - r, cy + dy)
+            yield (cx + r, cy + dy)
+        for dx in range(-r + 1, r):
+            yield (cx + dx, cy - r)
+            yield (cx + dx, cy + r)
+
+    # ---- construction ----
+    @classmethod
+    def from_records(cls, records: Iterable[Tuple[str, Dict[str, Any]]], cell_deg: float = 0.01) -> "CourierSpatialIndex":
+        index = cls(cell_deg)
+        for courier_id, record in records:
+            index.upsert(courier_id, record)
+        return index
+
+
+# =========================================================
+# Process-wide index over the active data source's fleet.
+# Rebuilt lazily whenever set_data_source() swaps the backend.
+# =========================================================
+
+_INDEX: Optional[CourierSpatialIndex] = None
+_INDEX_SOURCE = None
+_INDEX_LOCK = threading.Lock()
+
+def get_courier_index() -> CourierSpatialIndex:
+    from scripts.data_sources import get_data_source
+
+    global _INDEX, _INDEX_SOURCE
+    source = get_data_source()
+    if _INDEX is None or _INDEX_SOURCE is not source:
+        with _INDEX_LOCK:
+            if _INDEX is None or _INDEX_SOURCE is not source:
+                _INDEX = CourierSpatialIndex.from_records(source.iter_couriers())
+                _INDEX_SOURCE = source
+    return _INDEX
+
+def set_courier_index(index: Optional[CourierSpatialIndex]) -> None:
+    """Install a prebuilt index for the current source (None forces a rebuild)."""
+    from scripts.data_sources import get_data_source
+
+    global _INDEX, _INDEX_SOURCE
+    with _INDEX_LOCK:
+        _INDEX = index
+        _INDEX_SOURCE = get_data_source() if index is not None else None
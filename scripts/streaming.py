@@ -0,0 +1,174 @@
+from __future__ import annotations
+import json
+import time
+from typing import Any, AsyncIterator, Dict, IO, Iterable, Iterator, List, Optional, Union
+
+from scripts.audit_trail import TRAIL_KEY
+from scripts.core_datastructures import AgentState
+from scripts.langgraph_flow import CompiledRouter, get_app, is_parked, routes_of
+
+
+# =========================================================
+# 1) Per-envelope events
+#    Built from LangGraph's "updates" stream: after each node, the
+#    audit_log entries it appended (one per merged envelope) say what
+#    changed, so an event carries only that envelope:
+#      {"type": "envelope", "order_id", "seq", "phase", "agent", "ok",
+#       "reason", "signals", "metrics", "updates": {key: merged value}}
+#    and the run closes with
+#      {"type": "end", "order_id", "seq", "phase", "parked", "audit"}
+#    (plus "order_details", by reference, when include_order=True)
+#    or, when a node raised, {"type": "error", "order_id", "seq", "error"}.
+#    Update values are shallow copies, so a consumer can hold an event
+#    while later nodes keep merging into the same keys.
+# =========================================================
+
+Event = Dict[str, Any]
+
+
+def _hops(order: Dict[str, Any]) -> int:
+    trail = order.get(TRAIL_KEY)
+    return trail["hops"] if trail else 0
+
+def _snapshot(value: Any) -> Any:
+    if isinstance(value, dict):
+        return dict(value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class _OrderStream:
+    """Turns one order's node outputs into events."""
+    __slots__ = ("order_id", "seq", "hops", "order", "routes")
+
+    def __init__(self, state: Dict[str, Any], routes: CompiledRouter):
+        order = state.get("order_details") or {}
+        self.routes = routes
+        self.order_id = order.get("order_id")
+        self.seq = 0
+        self.hops = _hops(order)
+        self.order = order
+
+    def node(self, chunk: Dict[str, Any]) -> List[Event]:
+        events: List[Event] = []
+        for phase, out in chunk.items():
+            if not out:
+                continue
+            order = out.get("order_details") or {}
+            log = out.get("audit_log") or []
+            hops = _hops(order)
+            new = min(max(0, hops - self.hops), len(log))
+            self.hops, self.order = hops, order
+            for entry in log[len(log) - new:]:
+                self.seq += 1
+                events.append({
+                    "type": "envelope",
+                    "order_id": self.order_id,
+                    "seq": self.seq,
+                    "phase": phase,
+                    "agent": entry.get("agent"),
+                    "ok": entry.get("ok", True),
+                    "reason": entry.get("reason"),
+                    "signals": entry.get("signals") or {},
+                    "metrics": entry.get("metrics") or {},
+                    "updates": {k: _snapshot(order[k]) for k in entry.get("updates_keys") or () if k in order},
+                })
+        return events
+
+    def end(self, include_order: bool = False) -> Event:
+        self.seq += 1
+        event = {"type": "end", "order_id": self.order_id, "seq": self.seq, "phase": self.order.get("_phase"),
+                 "parked": is_parked({"order_details": self.order}, self.routes), "audit": self.order.get("audit")}
+        if include_order:
+            event["order_details"] = self.order
+        return event
+
+    def error(self, exc: BaseException) -> Event:
+        self.seq += 1
+        return {"type": "error", "order_id": self.order_id, "seq": self.seq,
+                "error": f"{type(exc).__name__}: {exc}"}
+
+
+def _as_input(state: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+    return state.model_dump() if isinstance(state, AgentState) else state
+
+
+def stream_order(state: Union[AgentState, Dict[str, Any]], app=None, include_order: bool = False) -> Iterator[Event]:
+    """Run one order, yielding each envelope as its node finishes."""
+    app = app or get_app()
+    state = _as_input(state)
+    stream = _OrderStream(state, routes_of(app))
+    try:
+        for chunk in app.stream(state, stream_mode="updates"):
+            yield from stream.node(chunk)
+    except Exception as e:
+        yield stream.error(e)
+        return
+    yield stream.end(include_order)
+
+async def astream_order(state: Union[AgentState, Dict[str, Any]], app=None,
+                        include_order: bool = False) -> AsyncIterator[Event]:
+    """
+    Async counterpart of stream_order().
+    - app=None -> the async-agent graph (scripts.async_flow)
+    """
+    if app is None:
+        from scripts.async_flow import _shared_async_app
+        app = _shared_async_app()
+    state = _as_input(state)
+    stream = _OrderStream(state, routes_of(app))
+    try:
+        async for chunk in app.astream(state, stream_mode="updates"):
+            for event in stream.node(chunk):
+                yield event
+    except Exception as e:
+        yield stream.error(e)
+        return
+    yield stream.end(include_order)
+
+
+# =========================================================
+# 2) Wire formats
+#    Each event is encoded once, on its own; nothing re-serializes the
+#    order state.
+#    - NDJSON -> one compact JSON object per line
+#    - SSE    -> "id: <seq>" / "event: <type>" / "data: <json>" blocks
+# =========================================================
+
+def _json(event: Event) -> str:
+    return json.dumps(event, separators=(",", ":"), default=str)
+
+def ndjson(event: Event) -> str:
+    return _json(event) + "\n"
+
+def sse(event: Event) -> str:
+    return f"id: {event.get('order_id')}:{event['seq']}\nevent: {event['type']}\ndata: {_json(event)}\n\n"
+
+FORMATS = {"ndjson": ndjson, "sse": sse}
+
+
+def write_events(events: Iterable[Event], fp: IO[str], fmt: str = "ndjson", flush: bool = True) -> int:
+    """Encode and write events as they arrive; returns how many were written."""
+    encode = FORMATS[fmt]
+    n = 0
+    for event in events:
+        fp.write(encode(event))
+        if flush:
+            fp.flush()
+        n += 1
+    return n
+
+
+if __name__ == "__main__":
+    import argparse
+    import sys
+
+    from scripts.langgraph_flow import demo_order_state
+
+    parser = argparse.ArgumentParser(description="Stream the demo order's envelopes to stdout.")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="ndjson")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    count = write_events(stream_order(demo_order_state()), sys.stdout, args.format)
+    print(f"# {count} events in {(time.perf_counter() - t0) * 1e3:.1f} ms", file=sys.stderr)
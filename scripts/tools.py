@@ -1,17 +1,26 @@
 from langchain_core.tools import tool
+import secrets
 import time
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from pydantic import ValidationError
 
 # replace the relative imports with absolute, sibling imports
 from scripts.core_datastructures import (
     AgentReturnEnvelope, ContainerAgentInput, PaymentAgentInput, PromotionGuardInput, ReputationAgentInput,
     CourierBreakdownInput, CapacityAgentInput, SplitDeliveryInput,
-    WeatherAgentInput, MerchantStatusInput, DeliveryDispatchInput,
+    WeatherAgentInput, MerchantStatusInput, DeliveryDispatchInput, DispatchWindowInput,
     RerouteInput, CustomerChangeInput, PolicyGuardInput, NotifyAgentInput,
     AuditAgentInput, MerchantHealth, PolicyStatus, ActionType, NotificationEvent
 )
-from dataset.mock_data import MOCK_DATABASE, ORDER_ITEMS_DATA
+from scripts.data_sources import get_data_source
+from scripts.spatial_index import get_courier_index
+from scripts.payments import find_duplicate_charges
+from scripts.capacity import load_one, pack, utilisation, vehicle_limits
+from scripts.geo import WEATHER_SLOWDOWN, distance_km, eta_min, latlng
+from scripts.ttl_cache import cached_weather
+from scripts.merchant_store import MerchantState, get_merchant_store
+from scripts.batch_dispatch import assign_window
+from scripts.audit_store import get_audit_store
 
 
 # Helper function to validate inputs and handle errors
@@ -32,38 +41,66 @@ def _safe_call(func, inputs):
 @tool(args_schema=PaymentAgentInput)
 def payment_agent(**kwargs) -> dict:
     """Detects double charges, resolves holds, switches payment method, computes refunds/credits."""
-    start_time = time.time()
-    inputs = PaymentAgentInput(**kwargs)
-    if len(inputs.payment.get("transactions", [])) > 1:
+    return _payment_agent(PaymentAgentInput(**kwargs))
+
+def _payment_agent(inputs: PaymentAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    duplicates = find_duplicate_charges(inputs.payment, order_total=inputs.order_total)
+    unpriced = [d["txn_id"] for d in duplicates if d["amount"] is None]
+    if unpriced:
         return AgentReturnEnvelope(
             ok=True,
-            reason="Detected and resolved double charge.",
+            reason=f"Double charge detected but {len(unpriced)} duplicate(s) carry no amount; refund needs review.",
             updates={
                 "payment": {
                     "double_charge": True,
-                    "refunds": [{"txn_id": "TX_REFUND_1", "amount": inputs.order_total, "to": inputs.user_prefs.get("payment_priority")}],
+                    "unpriced_duplicates": unpriced,
+                    "status": "NEEDS_REVIEW"
+                }
+            },
+            signals={"payment_fixed": False},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+        ).model_dump()
+    if duplicates:
+        to = inputs.user_prefs.get("payment_priority")
+        refunds = [{"txn_id": f"RF_{d['txn_id']}", "refund_of": d["txn_id"], "duplicate_of": d["duplicate_of"], "amount": d["amount"], "to": to}
+                   for d in duplicates]
+        refund_total = round(sum(d["amount"] for d in duplicates), 2)
+        return AgentReturnEnvelope(
+            ok=True,
+            reason=f"Detected and resolved double charge ({len(duplicates)} duplicate transaction(s)).",
+            updates={
+                "payment": {
+                    "double_charge": True,
+                    "refunds": refunds,
                     "status": "REFUNDED"
                 },
-                "credits": {"wallet_delta": inputs.order_total}
+                "credits": {"wallet_delta": refund_total}
             },
             signals={"payment_fixed": True, "needs_user_action": False},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="No double charge detected.",
         updates={"payment": {"double_charge": False, "status": "OK"}},
         signals={"payment_fixed": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 2) ReputationAgent
 @tool(args_schema=ReputationAgentInput)
 def reputation_agent(**kwargs) -> dict:
     """Scores courier risk and decides if reassignment is safer."""
-    start_time = time.time()
-    inputs = ReputationAgentInput(**kwargs)
-    score = MOCK_DATABASE["couriers"].get(inputs.courier_candidate_id, {}).get("reputation_score", 0)
+    return _reputation_agent(ReputationAgentInput(**kwargs))
+
+def _reputation_agent(inputs: ReputationAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    courier = get_data_source().get_courier(inputs.courier_candidate_id)
+    return _reputation_decide(inputs, courier, start_time)
+
+def _reputation_decide(inputs: ReputationAgentInput, courier: Dict[str, Any], start_time: float) -> dict:
+    score = courier.get("reputation_score", 0)
     
     if score < 0.5:
         return AgentReturnEnvelope(
@@ -71,97 +108,154 @@ def reputation_agent(**kwargs) -> dict:
             reason="Courier flagged due to low reputation score.",
             updates={"risk": {"courier_id": inputs.courier_candidate_id, "score": score, "label": "HIGH", "recommend_reassign": True}},
             signals={"reassign_courier": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="Courier has an acceptable reputation score.",
         updates={"risk": {"courier_id": inputs.courier_candidate_id, "score": score, "label": "LOW", "recommend_reassign": False}},
         signals={"reassign_courier": False},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 3) CourierBreakdownAgent
 @tool(args_schema=CourierBreakdownInput)
 def courier_breakdown_agent(**kwargs) -> dict:
     """Detects breakdowns/immobility (driver SOS, long idle)."""
-    start_time = time.time()
-    inputs = CourierBreakdownInput(**kwargs)
+    return _courier_breakdown_agent(CourierBreakdownInput(**kwargs))
+
+def _courier_breakdown_agent(inputs: CourierBreakdownInput) -> dict:
+    start_time = time.perf_counter_ns()
+    # Telemetry that carries a position keeps the courier index live
+    if "lat" in inputs.telemetry and "lng" in inputs.telemetry:
+        get_courier_index().update_position(inputs.courier_id, inputs.telemetry["lat"], inputs.telemetry["lng"])
     if inputs.telemetry.get("sos_flag") or inputs.telemetry.get("speed") == 0 and inputs.route.get("progress") < 1.0:
+        # the order goes to a backup courier, so this one no longer holds it
+        _release_courier(inputs.courier_id)
         return AgentReturnEnvelope(
             ok=True,
             reason="SOS signal and zero speed detected.",
             updates={"breakdown": {"detected": True, "reason": "vehicle_breakdown", "since_sec": 120}},
             signals={"need_backup_courier": True, "pause_eta_updates": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="Courier is en route without issues.",
         updates={"breakdown": {"detected": False}},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 4) CapacityAgent
 @tool(args_schema=CapacityAgentInput)
 def capacity_agent(**kwargs) -> dict:
     """Checks if a courier’s vehicle can carry the full order; computes overflow."""
-    start_time = time.time()
-    inputs = CapacityAgentInput(**kwargs)
-    order_items = ORDER_ITEMS_DATA.get(inputs.order_id, {}).get("items", [])
-    courier_vehicle = MOCK_DATABASE["couriers"].get(inputs.courier_id, {}).get("vehicle_capacity", {})
-    
-    total_vol = sum(item["vol_l"] for item in order_items)
-    
-    if total_vol > courier_vehicle.get("vol_cap_l", 0) or any(item.get("is_bulky") for item in order_items):
+    return _capacity_agent(CapacityAgentInput(**kwargs))
+
+def _capacity_agent(inputs: CapacityAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    source = get_data_source()
+    order_items = source.get_order_items(inputs.order_id)
+    courier = source.get_courier(inputs.courier_id)
+    return _capacity_decide(inputs, order_items, courier, start_time)
+
+def _capacity_decide(inputs: CapacityAgentInput, order_items: List[Dict[str, Any]],
+                     courier: Dict[str, Any], start_time: float) -> dict:
+    limits = vehicle_limits(courier.get("vehicle_capacity"))
+    if limits is None:
+        return AgentReturnEnvelope(
+            ok=False,
+            reason="Courier vehicle capacity is unknown.",
+            updates={"capacity": {"fits": False, "fit_ratio": None, "overflow_items": []}},
+            signals={},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+        ).model_dump()
+
+    fit_ratio = utilisation(order_items, limits)
+    if fit_ratio > 1.0:
+        _, overflow = load_one(order_items, limits)
         return AgentReturnEnvelope(
             ok=True,
             reason="Order contains items that exceed vehicle capacity.",
-            updates={"capacity": {"fits": False, "fit_ratio": total_vol / courier_vehicle.get("vol_cap_l"), "overflow_items": [i['sku'] for i in order_items if i.get('is_bulky')]}},
+            updates={"capacity": {"fits": False, "fit_ratio": round(fit_ratio, 3), "overflow_items": list(overflow), "overflow_units": overflow}},
             signals={"propose_split_delivery": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="All items fit within vehicle capacity.",
-        updates={"capacity": {"fits": True, "fit_ratio": 1.0, "overflow_items": []}},
+        updates={"capacity": {"fits": True, "fit_ratio": round(fit_ratio, 3), "overflow_items": []}},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 5) SplitDeliveryAgent
 @tool(args_schema=SplitDeliveryInput)
 def split_delivery_agent(**kwargs) -> dict:
     """Negotiates partial-now / later delivery, computes ETAs & fees/waivers."""
-    start_time = time.time()
-    inputs = SplitDeliveryInput(**kwargs)
+    return _split_delivery_agent(SplitDeliveryInput(**kwargs))
+
+def _split_delivery_agent(inputs: SplitDeliveryInput) -> dict:
+    start_time = time.perf_counter_ns()
+    source = get_data_source()
+    order_items = source.get_order_items(inputs.order_id)
+    courier = source.get_courier(inputs.courier_id) if inputs.courier_id else {}
+    return _split_decide(inputs, order_items, courier, start_time)
+
+def _split_loads(inputs: SplitDeliveryInput, order_items: List[Dict[str, Any]],
+                 courier: Dict[str, Any]) -> Tuple[Dict[str, int], Dict[str, int], Dict[str, Any]]:
+    """(now sku -> qty, later sku -> qty, packing plan for the later vehicles)."""
+    limits = vehicle_limits(courier.get("vehicle_capacity"))
+    if limits is not None:
+        now, later = load_one(order_items, limits)
+    else:
+        # No vehicle to pack against: trust the capacity check's overflow list
+        overflow = set(inputs.overflow_items)
+        now = {i["sku"]: i.get("qty", 1) for i in order_items if i["sku"] not in overflow}
+        later = {i["sku"]: i.get("qty", 1) for i in order_items if i["sku"] in overflow}
+    if not later:
+        return now, later, {}
+    # Later leg goes out on the largest vehicle in the pool (else the same vehicle type)
+    pool_limits = [l for l in (vehicle_limits(c.get("vehicle_capacity")) for c in inputs.courier_pool) if l]
+    later_limits = max(pool_limits, default=limits, key=lambda l: (l[0], l[1]))
+    if later_limits is None:
+        return now, later, {}
+    later_items = [dict(i, qty=later[i["sku"]]) for i in order_items if i["sku"] in later]
+    plan = pack(later_items, later_limits)
+    return now, later, {"later_vehicles": plan.vehicles_needed, "later_loads": plan.loads, "unpackable": plan.unpackable}
+
+def _split_decide(inputs: SplitDeliveryInput, order_items: List[Dict[str, Any]],
+                  courier: Dict[str, Any], start_time: float) -> dict:
     if inputs.customer_response.lower() == "agree":
-        now_items = [item for item in ORDER_ITEMS_DATA.get(inputs.order_id, {}).get("items", []) if not item.get("is_bulky")]
-        later_items = [item for item in ORDER_ITEMS_DATA.get(inputs.order_id, {}).get("items", []) if item.get("is_bulky")]
-        
+        now, later, plan = _split_loads(inputs, order_items, courier)
         return AgentReturnEnvelope(
             ok=True,
             reason="Customer agreed to split delivery.",
-            updates={"split_plan": {"accepted": True, "now_items": [i['sku'] for i in now_items], "later_items": [i['sku'] for i in later_items], "later_eta_min": 120, "fee": 0.0, "waiver_applied": True}},
+            updates={"split_plan": {"accepted": True, "now_items": list(now), "later_items": list(later), "now_units": now, "later_units": later, **plan, "later_eta_min": 120, "fee": 0.0, "waiver_applied": True}},
             signals={"spawn_second_dispatch": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="Customer declined split delivery.",
         updates={"split_plan": {"accepted": False}},
         signals={"find_new_courier": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 6) WeatherAgent
 @tool(args_schema=WeatherAgentInput)
 def weather_agent(**kwargs) -> dict:
     """Pulls weather alerts and adjusts route cost/ETA."""
-    start_time = time.time()
-    inputs = WeatherAgentInput(**kwargs)
-    weather_info = MOCK_DATABASE["weather_service"].get(inputs.destination_city, {})
+    return _weather_agent(WeatherAgentInput(**kwargs))
+
+def _weather_agent(inputs: WeatherAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
+    weather_info = cached_weather(inputs.destination_city)
+    return _weather_decide(inputs, weather_info, start_time)
+
+def _weather_decide(inputs: WeatherAgentInput, weather_info: Dict[str, Any], start_time: float) -> dict:
     
     if weather_info.get("reroute_required"):
         return AgentReturnEnvelope(
@@ -169,83 +263,197 @@ def weather_agent(**kwargs) -> dict:
             reason=f"Weather alert detected in {inputs.destination_city}.",
             updates={"weather": {"alert": "RAIN_HEAVY", "severity": "HIGH", "eta_penalty_min": 7, "advice": "avoid_underpass"}},
             signals={"require_reroute": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     return AgentReturnEnvelope(
         ok=True,
         reason="Weather is clear. No reroute required.",
         updates={"weather": {"alert": "NONE"}},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 7) MerchantStatusAgent
 @tool(args_schema=MerchantStatusInput)
 def merchant_status_agent(**kwargs) -> dict:
     """Checks merchant health and item stock."""
-    start_time = time.time()
-    inputs = MerchantStatusInput(**kwargs)
-    merchant_data = MOCK_DATABASE["merchants"].get(inputs.merchant_id, {})
+    return _merchant_status_agent(MerchantStatusInput(**kwargs))
+
+def _merchant_status_agent(inputs: MerchantStatusInput) -> dict:
+    start_time = time.perf_counter_ns()
+    state = get_merchant_store().get(inputs.merchant_id)
+    return _merchant_decide(inputs, state, start_time)
 
-    if merchant_data.get("health") == "HEALTHY":
+def _merchant_decide(inputs: MerchantStatusInput, state: Optional[MerchantState], start_time: float) -> dict:
+    if state is None:
         return AgentReturnEnvelope(
-            ok=True,
-            reason="Merchant is healthy and stock is confirmed.",
-            updates={"merchant": {"health": MerchantHealth.healthy, "prep_eta_min": 14, "oos_items": []}},
-            signals={"needs_alt_sourcing": False},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            ok=False,
+            reason=f"Merchant {inputs.merchant_id} is unknown.",
+            updates={"merchant": {"health": None, "prep_eta_min": 0, "oos_items": []}},
+            signals={"needs_alt_sourcing": True},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
-    else:
+
+    if state.health == MerchantHealth.healthy.value:
+        oos = state.out_of_stock(i.get("sku") for i in inputs.items)
         return AgentReturnEnvelope(
             ok=True,
-            reason="Merchant is temporarily offline.",
-            updates={"merchant": {"health": MerchantHealth.offline, "prep_eta_min": 0, "oos_items": []}},
-            signals={"needs_alt_sourcing": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            reason=(f"Merchant is healthy but {len(oos)} item(s) are out of stock." if oos
+                    else "Merchant is healthy and stock is confirmed."),
+            updates={"merchant": {"health": MerchantHealth.healthy, "prep_eta_min": state.prep_eta_min, "oos_items": oos}},
+            signals={"needs_alt_sourcing": bool(oos)},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
 
+    health = MerchantHealth.soft_blackout if state.health == MerchantHealth.soft_blackout.value else MerchantHealth.offline
+    return AgentReturnEnvelope(
+        ok=True,
+        reason=("Merchant is in a soft blackout." if health == MerchantHealth.soft_blackout
+                else "Merchant is temporarily offline."),
+        updates={"merchant": {"health": health, "prep_eta_min": 0, "oos_items": []}},
+        signals={"needs_alt_sourcing": True},
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+    ).model_dump()
+
 # 8) DeliveryDispatchAgent
 @tool(args_schema=DeliveryDispatchInput)
 def delivery_dispatch_agent(**kwargs) -> dict:
     """Assigns a courier and initial route/ETA."""
-    start_time = time.time()
-    inputs = DeliveryDispatchInput(**kwargs)
-    courier_id = "courier_B" # Simulate assigning a low-rep courier
-    courier_data = MOCK_DATABASE["couriers"][courier_id]
-    
+    return _delivery_dispatch_agent(DeliveryDispatchInput(**kwargs))
+
+def _delivery_dispatch_agent(inputs: DeliveryDispatchInput) -> dict:
+    start_time = time.perf_counter_ns()
+    pick = _dispatch_pick(inputs)
+    courier_data = get_data_source().get_courier(pick[0]) if pick else {}
+    return _dispatch_decide(inputs, pick, courier_data, start_time)
+
+def _dispatch_pick(inputs: DeliveryDispatchInput) -> Optional[Tuple[str, float]]:
+    """Nearest available courier to the pickup that satisfies the order's needs, marked busy."""
+    index = get_courier_index()
+    pickup = inputs.pickup_location
+    if inputs.assigned_courier_id:
+        hits = index.nearest(pickup.lat, pickup.lng, k=1, statuses=None, candidates=[inputs.assigned_courier_id],
+                             max_radius_km=None)
+        if hits:
+            index.update_status(hits[0][0], "busy")
+            return hits[0]
+    pick = _claim_nearest(
+        pickup.lat, pickup.lng,
+        min_vol_l=inputs.required_vol_l, min_weight_kg=inputs.required_weight_kg,
+        require_insulated=inputs.needs_insulated, exclude=inputs.exclude_couriers,
+    )
+    if pick is None and (inputs.required_vol_l or inputs.required_weight_kg):
+        # Nobody nearby carries it whole: take the nearest and let capacity/split handle overflow
+        pick = _claim_nearest(pickup.lat, pickup.lng,
+                              require_insulated=inputs.needs_insulated, exclude=inputs.exclude_couriers)
+    return pick
+
+def _claim_nearest(lat: float, lng: float, **filters) -> Optional[Tuple[str, float]]:
+    """Nearest available courier, marked busy; searches again if another order claims it first."""
+    index = get_courier_index()
+    while True:
+        hits = index.nearest(lat, lng, k=1, **filters)
+        if not hits or index.claim(hits[0][0]):
+            return hits[0] if hits else None
+
+def _release_courier(courier_id: Optional[str]) -> None:
+    """Back to available, unless it has since broken down."""
+    if courier_id:
+        get_courier_index().claim(courier_id, "available", expect=("busy",))
+
+def _dispatch_decide(inputs: DeliveryDispatchInput, pick: Optional[Tuple[str, float]],
+                     courier_data: Dict[str, Any], start_time: float) -> dict:
+    if pick is None:
+        return AgentReturnEnvelope(
+            ok=False,
+            reason="No available courier matches the order near the pickup.",
+            updates={},
+            signals={"on_route": False},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+        ).model_dump()
+    courier_id, pickup_km = pick
+    vehicle_type = (courier_data.get("vehicle_capacity") or {}).get("type")
+    # courier can't leave the merchant before the order is ready
+    trip_km = distance_km(inputs.pickup_location, inputs.drop_location)
+    route_eta = max(eta_min(pickup_km, vehicle_type), inputs.readiness_eta_min) + eta_min(trip_km, vehicle_type)
     return AgentReturnEnvelope(
         ok=True,
         reason=f"Courier {courier_id} assigned and route calculated.",
         updates={
-            "courier": {"id": courier_id, "vehicle": courier_data.get("vehicle_capacity"), "rating": courier_data.get("reputation_score")},
-            "route": {"polyline": "ENCODED_POLYLINE_STRING", "eta_min": 22}
+            "courier": {"id": courier_id, "vehicle": courier_data.get("vehicle_capacity"), "rating": courier_data.get("reputation_score"), "pickup_distance_km": round(pickup_km, 3)},
+            "route": {"polyline": "ENCODED_POLYLINE_STRING", "eta_min": int(round(route_eta)), "distance_km": round(trip_km, 3)}
         },
         signals={"on_route": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+    ).model_dump()
+
+# 8b) BatchDispatchAgent
+@tool(args_schema=DispatchWindowInput)
+def batch_dispatch_agent(**kwargs) -> dict:
+    """Assigns a window of pending orders to distinct couriers in one global pass."""
+    return _batch_dispatch_agent(DispatchWindowInput(**kwargs))
+
+def _batch_dispatch_agent(inputs: DispatchWindowInput) -> dict:
+    start_time = time.perf_counter_ns()
+    index = get_courier_index()
+    # an order whose courier was taken since the window was solved is left unassigned
+    picks = [p if p and index.claim(p[0]) else None
+             for p in assign_window(inputs.orders, inputs.courier_pool, method=inputs.method)]
+    couriers = get_data_source().bulk_get_couriers([p[0] for p in picks if p])
+    assignments = [
+        _dispatch_decide(order, pick, couriers.get(pick[0], {}) if pick else {}, start_time)
+        for order, pick in zip(inputs.orders, picks)
+    ]
+    assigned = sum(1 for a in assignments if a["ok"])
+    return AgentReturnEnvelope(
+        ok=assigned == len(assignments),
+        reason=f"Assigned {assigned}/{len(assignments)} orders in one pass.",
+        updates={"assignments": assignments},
+        signals={},
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6, "assigned": assigned}
     ).model_dump()
 
 # 9) RerouteAgent
 @tool(args_schema=RerouteInput)
 def reroute_agent(**kwargs) -> dict:
     """Picks a better courier or route when a delay/risk arises."""
-    start_time = time.time()
-    inputs = RerouteInput(**kwargs)
+    return _reroute_agent(RerouteInput(**kwargs))
+
+def _reroute_agent(inputs: RerouteInput) -> dict:
+    start_time = time.perf_counter_ns()
+    index = get_courier_index()
+    origin = inputs.courier_position or index.position(inputs.current_courier)
     if inputs.reason == "risk":
-        new_courier_id = "courier_C" # Simulate reassigning to a high-rep courier
+        backup = _backup_courier(inputs, origin)
+        if backup is None:
+            return AgentReturnEnvelope(
+                ok=False,
+                reason="No backup courier available for reassignment.",
+                updates={},
+                signals={},
+                metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+            ).model_dump()
+        new_courier_id, handoff_km = backup
+        _release_courier(inputs.current_courier)
+        vehicle_type = (index.describe(new_courier_id) or {}).get("vehicle_type")
+        # backup drives to the stuck courier, takes over, then finishes the drop
+        eta = eta_min(handoff_km, vehicle_type) + _remaining_eta(origin, inputs.drop_location, vehicle_type)
         return AgentReturnEnvelope(
             ok=True,
             reason=f"Rerouting due to courier risk. Reassigning to {new_courier_id}.",
-            updates={"reroute": {"action": ActionType.reassign, "new_courier_id": new_courier_id, "eta_min": 19}},
+            updates={"reroute": {"action": ActionType.reassign, "new_courier_id": new_courier_id, "eta_min": int(round(eta))}},
             signals={"reroute_done": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     elif inputs.reason == "weather":
+        vehicle_type = (index.describe(inputs.current_courier) or {}).get("vehicle_type")
+        eta = _remaining_eta(origin, inputs.drop_location, vehicle_type, WEATHER_SLOWDOWN)
         return AgentReturnEnvelope(
             ok=True,
             reason=f"Rerouting to avoid bad weather.",
-            updates={"reroute": {"action": ActionType.route_replan, "new_courier_id": inputs.current_courier, "eta_min": 25}},
+            updates={"reroute": {"action": ActionType.route_replan, "new_courier_id": inputs.current_courier, "eta_min": int(round(eta))}},
             signals={"reroute_done": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     
     return AgentReturnEnvelope(
@@ -253,37 +461,52 @@ def reroute_agent(**kwargs) -> dict:
         reason="Reroute reason not recognized.",
         updates={},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
+def _backup_courier(inputs: RerouteInput, origin) -> Optional[Tuple[str, float]]:
+    """Nearest available courier to the current one (marked busy), restricted to candidate_pool when given."""
+    if origin is None:
+        return None
+    lat, lng = latlng(origin)
+    pool = [c["id"] for c in (inputs.candidate_pool or []) if c.get("id")] or None
+    return _claim_nearest(lat, lng, exclude=[inputs.current_courier], candidates=pool)
+
+def _remaining_eta(origin, drop_location, vehicle_type: Optional[str], slowdown: float = 1.0) -> float:
+    if origin is None or not drop_location:
+        return 0.0
+    return eta_min(distance_km(origin, drop_location), vehicle_type, slowdown)
+
 # 10) CustomerChangeAgent
-@tool
-def customer_change_agent(inputs: CustomerChangeInput) -> AgentReturnEnvelope:
+@tool(args_schema=CustomerChangeInput)
+def customer_change_agent(**kwargs) -> dict:
     """Applies user-initiated changes mid-route, like address or payment modes."""
-    start_time = time.time()
+    return _customer_change_agent(CustomerChangeInput(**kwargs))
+
+def _customer_change_agent(inputs: CustomerChangeInput) -> dict:
+    start_time = time.perf_counter_ns()
 
     if inputs.request.get("type") == "address_change":
         new_address = inputs.request.get("new_address", {})
-        # Simulate a quick feasibility check based on distance
-        current_courier_loc = inputs.courier_position
-        new_dist_km = ((new_address.get('lat', 0) - current_courier_loc.get('lat', 0))**2 + (new_address.get('lon', 0) - current_courier_loc.get('lon', 0))**2)**0.5 * 100
+        # Feasibility: how far the new drop is from where the courier is now
+        new_dist_km = distance_km(inputs.courier_position, new_address)
 
         if new_dist_km < 10:
             return AgentReturnEnvelope(
                 ok=True,
                 reason="Address change is feasible. Rerouting now.",
-                updates={"customer_change": {"type": "address", "feasible": True, "new_eta_min": inputs.eta_min + int(new_dist_km * 2), "fee": 0.0}},
+                updates={"customer_change": {"type": "address", "feasible": True, "new_eta_min": inputs.eta_min + int(round(eta_min(new_dist_km, inputs.vehicle_type))), "fee": 0.0}},
                 signals={"require_reroute": True},
-                metrics={"latency_ms": (time.time() - start_time) * 1000}
-            )
+                metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+            ).model_dump()
         else:
             return AgentReturnEnvelope(
                 ok=False,
                 reason="Address change is too far and not feasible.",
                 updates={"customer_change": {"type": "address", "feasible": False}},
                 signals={},
-                metrics={"latency_ms": (time.time() - start_time) * 1000}
-            )
+                metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+            ).model_dump()
 
     if inputs.request.get("type") == "payment":
         return AgentReturnEnvelope(
@@ -291,30 +514,32 @@ def customer_change_agent(inputs: CustomerChangeInput) -> AgentReturnEnvelope:
             reason="Payment method change is feasible.",
             updates={"customer_change": {"type": "payment", "feasible": True, "eta_min": 0, "fee": 0.0}},
             signals={"notify_user": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
-        )
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+        ).model_dump()
 
     return AgentReturnEnvelope(
         ok=False,
         reason="Change request is not recognized or feasible.",
         updates={},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
-    )
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+    ).model_dump()
 
 # 11) PolicyGuard
 @tool(args_schema=PolicyGuardInput)
 def policy_guard(**kwargs) -> dict:
     """Validates final plan against SLA and compliance."""
-    start_time = time.time()
-    inputs = PolicyGuardInput(**kwargs)
+    return _policy_guard(PolicyGuardInput(**kwargs))
+
+def _policy_guard(inputs: PolicyGuardInput) -> dict:
+    start_time = time.perf_counter_ns()
     if inputs.eta_min > inputs.sla_eta_min:
         return AgentReturnEnvelope(
             ok=True,
             reason="Order ETA exceeds SLA. Applying credit.",
             updates={"policy": {"status": PolicyStatus.warn, "violations": ["SLA_VIOLATION"], "fallback": "CREDIT_WAIVER"}},
             signals={"proceed": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         ).model_dump()
     
     return AgentReturnEnvelope(
@@ -322,15 +547,17 @@ def policy_guard(**kwargs) -> dict:
         reason="Plan is compliant with all policies.",
         updates={"policy": {"status": PolicyStatus.ok, "violations": [], "fallback": None}},
         signals={"proceed": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 12) NotifyAgent
 @tool(args_schema=NotifyAgentInput)
 def notify_agent(**kwargs) -> dict:
     """Composes and sends notifications to users, merchants, or couriers."""
-    start_time = time.time()
-    inputs = NotifyAgentInput(**kwargs)
+    return _notify_agent(NotifyAgentInput(**kwargs))
+
+def _notify_agent(inputs: NotifyAgentInput) -> dict:
+    start_time = time.perf_counter_ns()
     message_map = {
         NotificationEvent.refund: "Refund of ${payload[amount]} has been processed to your wallet.",
         NotificationEvent.split_confirmed: "Your order will be delivered in two parts. Essentials coming soon, bulky item later.",
@@ -340,36 +567,61 @@ def notify_agent(**kwargs) -> dict:
     
     message_template = message_map.get(inputs.event, "Update on your order.")
     final_message = message_template.format(payload=inputs.payload)
+    # notify closes the order's run, so its courier is free for the next dispatch
+    _release_courier(inputs.courier_id)
     
     return AgentReturnEnvelope(
         ok=True,
         reason=f"Notification sent for event: {inputs.event.value}.",
         updates={"notify": {"sent_to": inputs.target, "channels": ["push", "sms"], "message": final_message}},
         signals={"notified": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
 
 # 13) AuditAgent
 @tool(args_schema=AuditAgentInput)
 def audit_agent(**kwargs) -> dict:
     """Persists all thoughts, decisions, and metrics, and a compact reasoning summary."""
-    start_time = time.time()
-    inputs = AuditAgentInput(**kwargs)
-    summary = " → ".join(inputs.thoughts)
+    return _audit_agent(AuditAgentInput(**kwargs))
+
+def _audit_agent(inputs: AuditAgentInput) -> dict:
+    """
+    Appends the trace to the audit store (scripts.audit_store); the state
+    keeps only the reference. The full thoughts / events / final order
+    are read back with get_audit_store().get_trace(trace_id).
+    """
+    start_time = time.perf_counter_ns()
+    now = time.time()
+    trace_id = f"TRC-{int(now)}-{secrets.token_hex(6)}"
+    store = get_audit_store()
+    if store is None:
+        return AgentReturnEnvelope(
+            ok=True,
+            reason="Audit persistence disabled; trace not saved.",
+            updates={"audit": {"saved": False, "trace_id": trace_id, "entries": len(inputs.thoughts)}},
+            signals={"trace_complete": True},
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
+        ).model_dump()
+    segment, offset = store.append(str(inputs.state_diff.get("order_id") or trace_id), trace_id,
+                                   inputs.thoughts, inputs.events, inputs.state_diff, ts=now)
     return AgentReturnEnvelope(
         ok=True,
         reason="Audit log successfully saved.",
-        updates={"audit": {"saved": True, "trace_id": f"TRC-{int(time.time())}", "summary": summary}},
+        updates={"audit": {"saved": True, "trace_id": trace_id, "segment": segment, "offset": offset,
+                           "entries": len(inputs.thoughts)}},
         signals={"trace_complete": True},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     ).model_dump()
    
     
 @tool
 def container_agent(inputs: ContainerAgentInput) -> AgentReturnEnvelope:
     """Checks if a courier's vehicle is equipped with specialized containers."""
-    start_time = time.time()
-    courier_data = MOCK_DATABASE["couriers"].get(inputs.courier_id, {})
+    start_time = time.perf_counter_ns()
+    courier_data = get_data_source().get_courier(inputs.courier_id)
+    return _container_decide(inputs, courier_data, start_time)
+
+def _container_decide(inputs: ContainerAgentInput, courier_data: Dict[str, Any], start_time: float) -> AgentReturnEnvelope:
 
     if inputs.item_type == "perishable" and not courier_data.get("special_equipment", {}).get("insulated_container"):
         return AgentReturnEnvelope(
@@ -377,20 +629,20 @@ def container_agent(inputs: ContainerAgentInput) -> AgentReturnEnvelope:
             reason="Courier lacks the insulated container for perishable items.",
             updates={"equipment": {"has_container": False, "required": True}},
             signals={"needs_new_courier": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         )
     return AgentReturnEnvelope(
         ok=True,
         reason="Courier is properly equipped for this delivery.",
         updates={"equipment": {"has_container": True, "required": True}},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     )
     
 @tool
 def promotion_guard(inputs: PromotionGuardInput) -> AgentReturnEnvelope:
     """Validates if a proposed reroute or change violates an active promotion."""
-    start_time = time.time()
+    start_time = time.perf_counter_ns()
 
     if inputs.promotion_code == "PERISHABLE_PROMO" and inputs.proposed_action != "stay_on_route":
         return AgentReturnEnvelope(
@@ -398,13 +650,13 @@ def promotion_guard(inputs: PromotionGuardInput) -> AgentReturnEnvelope:
             reason=f"Proposed action '{inputs.proposed_action}' violates promotion {inputs.promotion_code}.",
             updates={"policy": {"status": "WARN", "violations": ["PROMOTION_VIOLATION"]}},
             signals={"cancel_reroute_to_avoid_penalty": True},
-            metrics={"latency_ms": (time.time() - start_time) * 1000}
+            metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
         )
     return AgentReturnEnvelope(
         ok=True,
         reason="Proposed action does not violate any active promotions.",
         updates={"policy": {"status": "OK", "violations": []}},
         signals={},
-        metrics={"latency_ms": (time.time() - start_time) * 1000}
+        metrics={"latency_ms": (time.perf_counter_ns() - start_time) / 1e6}
     )
 
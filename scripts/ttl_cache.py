@@ -0,0 +1,174 @@
+from __future__ import annotations
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+
+# =========================================================
+# 1) TTL + LRU cache with single-flight loads
+#    - entries expire ttl_s after they were loaded
+#    - at most max_entries keys; least recently used go first
+#    - concurrent misses for one key share a single load, whether the
+#      callers are threads (get) or coroutines (aget), or a mix
+#    - every in-flight load has a generation; invalidate() bumps it, and a
+#      load whose generation moved is handed to its callers but not cached
+#      (it may predate the change that caused the invalidation)
+# =========================================================
+
+class TTLCache:
+    def __init__(self, ttl_s: float = 60.0, max_entries: int = 1024,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl_s = ttl_s
+        self.max_entries = max_entries
+        self._clock = clock
+        self._data: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._inflight: Dict[Hashable, Future] = {}
+        self._gen: Dict[Hashable, int] = {}           # in-flight key -> invalidations since its load began
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stale": 0, "coalesced": 0, "loads": 0, "evictions": 0,
+                       "discarded": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def _begin(self, key: Hashable) -> Tuple[bool, Any, Optional[Future], bool]:
+        """(hit, value, future, is_leader) for one lookup; caller holds no lock."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                if entry[1] > self._clock():
+                    self._stats["hits"] += 1
+                    self._data.move_to_end(key)
+                    return True, entry[0], None, False
+                self._stats["stale"] += 1
+                del self._data[key]
+            else:
+                self._stats["misses"] += 1
+            fut = self._inflight.get(key)
+            if fut is not None:
+                self._stats["coalesced"] += 1
+                return False, None, fut, False
+            fut = self._inflight[key] = Future()
+            self._gen[key] = 0
+            self._stats["loads"] += 1
+            return False, None, fut, True
+
+    def _finish(self, key: Hashable, fut: Future, value: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+            if self._gen.pop(key, 0):
+                self._stats["discarded"] += 1
+            elif error is None:
+                self._data[key] = (value, self._clock() + self.ttl_s)
+                self._data.move_to_end(key)
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+                    self._stats["evictions"] += 1
+        if error is None:
+            fut.set_result(value)
+        else:
+            fut.set_exception(error)
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        hit, value, fut, leader = self._begin(key)
+        if hit:
+            return value
+        if not leader:
+            return fut.result()
+        try:
+            value = loader()
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+            raise
+        self._finish(key, fut, value)
+        return value
+
+    async def aget(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        hit, value, fut, leader = self._begin(key)
+        if hit:
+            return value
+        if not leader:
+            return await asyncio.wrap_future(fut)
+        try:
+            value = await loader()
+        except BaseException as e:
+            self._finish(key, fut, error=e)
+            raise
+        self._finish(key, fut, value)
+        return value
+
+    def peek(self, key: Hashable) -> Any:
+        """Live cached value or None, without loading or touching stats/LRU order."""
+        with self._lock:
+            entry = self._data.get(key)
+            return entry[0] if entry is not None and entry[1] > self._clock() else None
+
+    def invalidate(self, key: Optional[Hashable] = None) -> None:
+        """
+        Drop one key, or everything when key is None. Loads in flight for
+        those keys still answer their callers but are not cached.
+        """
+        with self._lock:
+            if key is None:
+                self._data.clear()
+                for k in self._gen:
+                    self._gen[k] += 1
+            else:
+                self._data.pop(key, None)
+                if key in self._gen:
+                    self._gen[key] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, size=len(self._data))
+
+
+# =========================================================
+# 2) Process-wide weather cache
+#    Keyed by city, or (city, geo-cell) when a position is known.
+#    Reset whenever set_data_source() swaps the backend.
+#    - SYNAPSE_WEATHER_TTL_S     -> entry lifetime (default 300)
+#    - SYNAPSE_WEATHER_CACHE_MAX -> max cached keys (default 4096)
+# =========================================================
+
+WEATHER_CELL_DEG = 0.1
+
+_WEATHER: Optional[TTLCache] = None
+_WEATHER_SOURCE = None
+_WEATHER_LOCK = threading.Lock()
+
+def weather_key(city: Optional[str], lat: Optional[float] = None, lng: Optional[float] = None) -> Hashable:
+    if lat is None or lng is None:
+        return city
+    return (city, int(lat // WEATHER_CELL_DEG), int(lng // WEATHER_CELL_DEG))
+
+def get_weather_cache() -> TTLCache:
+    from scripts.data_sources import get_data_source
+
+    global _WEATHER, _WEATHER_SOURCE
+    source = get_data_source()
+    if _WEATHER is None or _WEATHER_SOURCE is not source:
+        with _WEATHER_LOCK:
+            if _WEATHER is None or _WEATHER_SOURCE is not source:
+                _WEATHER = TTLCache(
+                    ttl_s=float(os.getenv("SYNAPSE_WEATHER_TTL_S", "300")),
+                    max_entries=int(os.getenv("SYNAPSE_WEATHER_CACHE_MAX", "4096")),
+                )
+                _WEATHER_SOURCE = source
+    return _WEATHER
+
+def cached_weather(city: Optional[str], lat: Optional[float] = None, lng: Optional[float] = None) -> Dict[str, Any]:
+    from scripts.data_sources import get_data_source
+
+    source = get_data_source()
+    return get_weather_cache().get(weather_key(city, lat, lng), lambda: source.get_weather(city))
+
+async def acached_weather(city: Optional[str], lat: Optional[float] = None, lng: Optional[float] = None) -> Dict[str, Any]:
+    from scripts.data_sources import get_data_source
+
+    source = get_data_source()
+    return await get_weather_cache().aget(weather_key(city, lat, lng), lambda: source.aget_weather(city))
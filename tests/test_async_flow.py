@@ -0,0 +1,50 @@
+import asyncio
+import unittest
+
+from scripts.async_flow import arun_orders
+from scripts.batch_runner import run_orders
+from scripts.langgraph_flow import demo_order_state
+from scripts.metrics import get_metrics
+
+OK = 'synapse_orders_total{outcome="ok"}'
+FAILED = 'synapse_orders_total{outcome="failed"}'
+
+
+def _states(n, broken=0):
+    states = []
+    for i in range(n):
+        st = demo_order_state().model_dump()
+        st["order_details"]["order_id"] = f"A{i}"
+        if i < broken:
+            st["order_details"]["items"] = "broken"
+        states.append(st)
+    return states
+
+
+def _outcomes():
+    counters = get_metrics().snapshot()["counters"]
+    return counters.get(OK, 0), counters.get(FAILED, 0)
+
+
+class ArunOrdersTest(unittest.TestCase):
+    def test_counts_outcomes_like_run_orders(self):
+        ok0, failed0 = _outcomes()
+        report = asyncio.run(arun_orders(_states(5, broken=2)))
+        self.assertEqual((report.succeeded, report.failed), (3, 2))
+        ok1, failed1 = _outcomes()
+        self.assertEqual((ok1 - ok0, failed1 - failed0), (3, 2))
+
+        run_orders(_states(5, broken=2))
+        ok2, failed2 = _outcomes()
+        self.assertEqual((ok2 - ok1, failed2 - failed1), (3, 2))
+
+    def test_results_match_the_sync_runner(self):
+        sync = run_orders(_states(3))
+        async_ = asyncio.run(arun_orders(_states(3)))
+        self.assertEqual([r.order_id for r in async_.results], [r.order_id for r in sync.results])
+        for a, s in zip(async_.results, sync.results):
+            self.assertEqual(a.order_details["_phase"], s.order_details["_phase"])
+
+
+if __name__ == "__main__":
+    unittest.main()
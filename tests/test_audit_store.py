@@ -0,0 +1,67 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from scripts.async_flow import arun_orders
+from scripts.audit_store import AuditStore, get_audit_store, set_audit_store
+from scripts.langgraph_flow import demo_order_state
+
+
+class AuditStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_records_survive_reopen(self):
+        store = AuditStore(self.tmp.name)
+        store.append("O1", "T1", ["thought"], ["event"], {"order_id": "O1"})
+        store.append("O1", "T2", ["again"], [], {"order_id": "O1", "n": 2})
+        store.close()
+        reopened = AuditStore(self.tmp.name, readonly=True)
+        self.assertEqual(reopened.get("O1").trace_id, "T2")
+        self.assertEqual(reopened.get_trace("T1").thoughts, ["thought"])
+        self.assertEqual(len(list(reopened.scan())), 2)
+        reopened.close()
+
+    def test_pause_stops_sync_thread_until_next_append(self):
+        store = AuditStore(self.tmp.name)
+        store.append("O1", "T1", [], [], {})
+        store.pause()
+        self.assertNotIn("synapse-audit-sync", [t.name for t in threading.enumerate()])
+        store.append("O2", "T2", [], [], {})
+        self.assertIn("synapse-audit-sync", [t.name for t in threading.enumerate()])
+        store.close()
+
+    def test_env_store_is_opt_in(self):
+        previous = get_audit_store()
+        set_audit_store(None)
+        try:
+            with mock.patch.dict(os.environ, {"SYNAPSE_AUDIT": "1"}):
+                os.environ.pop("SYNAPSE_AUDIT_DIR", None)
+                self.assertIsNone(get_audit_store())
+            with mock.patch.dict(os.environ, {"SYNAPSE_AUDIT": "1", "SYNAPSE_AUDIT_DIR": self.tmp.name}):
+                self.assertEqual(get_audit_store().path, self.tmp.name)
+        finally:
+            set_audit_store(previous)
+
+    def test_async_runs_persist_through_the_store(self):
+        previous = get_audit_store()
+        store = AuditStore(self.tmp.name)
+        set_audit_store(store)
+        try:
+            state = demo_order_state().model_dump()
+            state["order_details"]["order_id"] = "AUD-1"
+            report = asyncio.run(arun_orders([state]))
+            self.assertEqual(report.succeeded, 1)
+            audit = report.results[0].order_details["audit"]
+            self.assertTrue(audit["saved"])
+            self.assertEqual(store.get_trace(audit["trace_id"]).order_id, "AUD-1")
+        finally:
+            set_audit_store(previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import copy
+import unittest
+
+from dataset.mock_data import MOCK_DATABASE
+from scripts.batch_runner import run_orders
+from scripts.data_sources import InMemoryDataSource, set_data_source
+from scripts.langgraph_flow import demo_order_state
+
+
+def _states(n, broken=()):
+    states = []
+    for i in range(n):
+        st = demo_order_state().model_dump()
+        st["order_details"]["order_id"] = f"B{i}"
+        if i in broken:
+            st["order_details"]["items"] = "broken"
+        states.append(st)
+    return states
+
+
+class RunOrdersTest(unittest.TestCase):
+    def test_failures_are_reported_per_order(self):
+        report = run_orders(_states(6, broken={1, 4}), concurrency=3)
+        self.assertEqual((report.total, report.succeeded, report.failed), (6, 4, 2))
+        self.assertEqual([r.order_id for r in report.results], [f"B{i}" for i in range(6)])
+        for i, r in enumerate(report.results):
+            if i in (1, 4):
+                self.assertFalse(r.ok)
+                self.assertTrue(r.error)
+            else:
+                self.assertTrue(r.ok)
+                self.assertEqual(r.order_details["_phase"], "audit")
+        self.assertGreater(report.orders_per_sec, 0)
+
+    def test_dispatch_window_gives_each_order_its_own_courier(self):
+        db = copy.deepcopy(MOCK_DATABASE)
+        db["couriers"] = {
+            f"W{i}": {"reputation_score": 0.9, "status": "available", "location": (40.73 + i * 0.002, -73.99),
+                      "vehicle_capacity": {"type": "car", "vol_cap_l": 250, "weight_cap_kg": 100},
+                      "special_equipment": {"insulated_container": True}}
+            for i in range(3)
+        }
+        previous = set_data_source(InMemoryDataSource.from_mock(db=db))
+        self.addCleanup(set_data_source, previous)
+        report = run_orders(_states(3), dispatch_window=3)
+        self.assertEqual(report.succeeded, 3)
+        couriers = [r.order_details["courier"]["id"] for r in report.results]
+        self.assertEqual(sorted(couriers), ["W0", "W1", "W2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import math
+import random
+import unittest
+import warnings
+
+from scripts.capacity import load_one, pack
+
+VAN = (100.0, 50.0, math.inf)
+
+
+def _within(load, items, limits):
+    size = {i["sku"]: i for i in items}
+    vol = sum(size[s]["vol_l"] * q for s, q in load.items())
+    weight = sum(size[s]["weight_kg"] * q for s, q in load.items())
+    return vol <= limits[0] + 1e-9 and weight <= limits[1] + 1e-9 and sum(load.values()) <= limits[2]
+
+
+class PackTest(unittest.TestCase):
+    def test_zero_size_units_share_a_vehicle(self):
+        items = [{"sku": "a", "vol_l": 0, "weight_kg": 0, "qty": 3}, {"sku": "b", "vol_l": 10, "weight_kg": 1}]
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            plan = pack(items, VAN, exact_max_units=0)
+        self.assertEqual(plan.vehicles_needed, 1)
+        self.assertEqual(plan.lower_bound, 1)
+        self.assertEqual(plan.loads, [{"a": 3, "b": 1}])
+
+    def test_plans_respect_limits_and_bounds(self):
+        rng = random.Random(11)
+        for _ in range(200):
+            items = [{"sku": f"s{k}", "vol_l": rng.choice([0, 5, 20, 45, 70]),
+                      "weight_kg": rng.choice([0, 1, 10, 30]), "qty": rng.randint(1, 6)}
+                     for k in range(rng.randint(1, 6))]
+            limits = (100.0, 50.0, rng.choice([math.inf, 8.0]))
+            plan = pack(items, limits)
+            self.assertGreaterEqual(plan.vehicles_needed, plan.lower_bound)
+            self.assertEqual(len(plan.loads), plan.vehicles_needed)
+            for load in plan.loads:
+                self.assertTrue(_within(load, items, limits))
+            carried = {}
+            for load in plan.loads:
+                for sku, q in load.items():
+                    carried[sku] = carried.get(sku, 0) + q
+            for i in items:
+                self.assertEqual(carried.get(i["sku"], 0) + plan.unpackable.get(i["sku"], 0), i["qty"])
+
+    def test_exact_search_beats_first_fit(self):
+        # first fit: 50+40 | 30+30+25 | 25; the optimum is 50+25+25 | 40+30+30
+        items = [{"sku": s, "vol_l": v, "weight_kg": 1}
+                 for s, v in (("a", 50), ("b", 40), ("c", 30), ("d", 30), ("e", 25), ("f", 25))]
+        plan = pack(items, VAN)
+        self.assertEqual(plan.vehicles_needed, 2)
+        self.assertTrue(plan.exact)
+
+    def test_oversized_units_are_unpackable(self):
+        plan = pack([{"sku": "big", "vol_l": 500, "weight_kg": 1, "qty": 2}], VAN)
+        self.assertEqual(plan.unpackable, {"big": 2})
+        self.assertEqual(plan.vehicles_needed, 0)
+
+
+class LoadOneTest(unittest.TestCase):
+    def test_fills_one_vehicle_and_reports_overflow(self):
+        items = [{"sku": "a", "vol_l": 60, "weight_kg": 1}, {"sku": "b", "vol_l": 50, "weight_kg": 1},
+                 {"sku": "c", "vol_l": 40, "weight_kg": 1}]
+        loaded, overflow = load_one(items, VAN)
+        self.assertEqual(loaded, {"a": 1, "c": 1})
+        self.assertEqual(overflow, {"b": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import asyncio
+import os
+import tempfile
+import threading
+import unittest
+
+from scripts.async_flow import build_async_graph
+from scripts.checkpoints import CKPT_KEY, Checkpointer
+from scripts.langgraph_flow import build_graph, demo_order_state, is_parked, resume_order
+from scripts.spatial_index import set_courier_index
+
+
+def _state(order_id):
+    state = demo_order_state().model_dump()
+    state["order_details"]["order_id"] = order_id
+    return state
+
+
+class _ThreadRecordingCheckpointer(Checkpointer):
+    def __init__(self, path):
+        super().__init__(path)
+        self.threads = set()
+
+    def save(self, order, audit_log, done=False):
+        self.threads.add(threading.get_ident())
+        super().save(order, audit_log, done=done)
+
+
+class CheckpointRoundTripTest(unittest.TestCase):
+    def setUp(self):
+        set_courier_index(None)     # parked orders keep their courier busy
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.checkpointer = Checkpointer(os.path.join(self.tmp.name, "ck.db"), compact_every=3)
+        self.addCleanup(self.checkpointer.close)
+        self.app = build_graph(checkpointer=self.checkpointer, awaits={"reroute": "reroute_ack"})
+
+    def test_load_rebuilds_parked_state_from_snapshot_and_deltas(self):
+        out = self.app.invoke(_state("CK-1"))
+        self.assertTrue(is_parked(out, app=self.app))
+        self.assertGreater(self.checkpointer.stats()["deltas"], 0)
+
+        loaded = self.checkpointer.load("CK-1")
+        strip = lambda order: {k: v for k, v in order.items() if k != CKPT_KEY}
+        self.assertEqual(strip(loaded["order_details"]), strip(out["order_details"]))
+        self.assertEqual(loaded["audit_log"], out["audit_log"])
+        self.assertEqual([p["order_id"] for p in self.checkpointer.pending()], ["CK-1"])
+
+    def test_resume_finishes_and_clears_the_checkpoint(self):
+        self.app.invoke(_state("CK-2"))
+        final = resume_order("CK-2", {"reroute_ack": True}, self.checkpointer, self.app)
+        self.assertEqual(final["order_details"]["_phase"], "audit")
+        self.assertFalse(is_parked(final, app=self.app))
+        self.assertIsNone(self.checkpointer.load("CK-2"))
+
+    def test_async_graph_saves_off_the_event_loop(self):
+        checkpointer = _ThreadRecordingCheckpointer(os.path.join(self.tmp.name, "async.db"))
+        app = build_async_graph(checkpointer=checkpointer)
+
+        async def run():
+            out = await app.ainvoke(_state("CK-3"))
+            return out, threading.get_ident()
+
+        out, loop_thread = asyncio.run(run())
+        self.assertEqual(out["order_details"]["_phase"], "audit")
+        self.assertTrue(checkpointer.threads)
+        self.assertNotIn(loop_thread, checkpointer.threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
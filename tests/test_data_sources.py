@@ -0,0 +1,49 @@
+import gc
+import threading
+import unittest
+import warnings
+
+from scripts.data_sources import InMemoryDataSource, SqliteDataSource
+
+
+class SqliteDataSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.mock = InMemoryDataSource.from_mock()
+
+    def test_lookups_match_the_in_memory_source(self):
+        db = SqliteDataSource.from_source(self.mock)
+        self.addCleanup(db.close)
+        courier_ids = list(self.mock.couriers)
+        for cid in courier_ids:
+            self.assertEqual(db.get_courier(cid)["status"], self.mock.get_courier(cid)["status"])
+            self.assertEqual(tuple(db.get_courier(cid)["location"]), tuple(self.mock.get_courier(cid)["location"]))
+        self.assertEqual(db.bulk_get_couriers(courier_ids + ["nobody"])["nobody"], {})
+        self.assertEqual(sorted(cid for cid, _ in db.iter_couriers()), sorted(courier_ids))
+        self.assertEqual(db.courier_ids_with_status("available"), self.mock.courier_ids_with_status("available"))
+
+    def test_short_lived_threads_leave_no_connections_behind(self):
+        gc.collect()                # earlier tests' garbage must not be reported here
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always", ResourceWarning)
+            db = SqliteDataSource.from_source(self.mock, pool_size=2)
+            courier_id = next(iter(self.mock.couriers))
+            for _ in range(5):
+                threads = [threading.Thread(target=db.get_courier, args=(courier_id,)) for _ in range(8)]
+                for t in threads:
+                    t.start()
+                for t in threads:
+                    t.join()
+            db.close()
+            del db
+            gc.collect()
+        self.assertEqual([w for w in caught if issubclass(w.category, ResourceWarning)], [])
+
+    def test_closed_source_refuses_lookups(self):
+        db = SqliteDataSource.from_source(self.mock)
+        db.close()
+        with self.assertRaises(RuntimeError):
+            db.get_courier("C1")
+
+
+if __name__ == "__main__":
+    unittest.main()
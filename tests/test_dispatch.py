@@ -0,0 +1,47 @@
+import unittest
+
+from scripts.data_sources import InMemoryDataSource, set_data_source
+from scripts.tools import delivery_dispatch_agent, notify_agent, reroute_agent
+
+PICKUP = {"lat": 40.73, "lng": -73.99, "city": "New York"}
+DROP = {"lat": 40.76, "lng": -73.98, "city": "New York"}
+
+
+def _courier(lat, lng):
+    return {"status": "available", "location": (lat, lng), "reputation_score": 0.9,
+            "vehicle_capacity": {"type": "car", "vol_cap_l": 200, "weight_cap_kg": 100}}
+
+
+def _dispatch():
+    return delivery_dispatch_agent.invoke({"pickup_location": PICKUP, "drop_location": DROP,
+                                           "readiness_eta_min": 5, "priority_flag": False})
+
+
+class DispatchClaimTest(unittest.TestCase):
+    def setUp(self):
+        previous = set_data_source(InMemoryDataSource(couriers={
+            "near": _courier(40.731, -73.99), "next": _courier(40.735, -73.99), "far": _courier(40.75, -73.99),
+        }))
+        self.addCleanup(set_data_source, previous)
+
+    def test_nearby_orders_get_different_couriers(self):
+        first, second = _dispatch(), _dispatch()
+        self.assertEqual(first["updates"]["courier"]["id"], "near")
+        self.assertEqual(second["updates"]["courier"]["id"], "next")
+
+    def test_notify_releases_the_courier(self):
+        courier_id = _dispatch()["updates"]["courier"]["id"]
+        notify_agent.invoke({"event": "DELIVERED", "payload": {}, "target": ["user"], "courier_id": courier_id})
+        self.assertEqual(_dispatch()["updates"]["courier"]["id"], courier_id)
+
+    def test_reroute_hands_the_order_to_a_backup(self):
+        courier_id = _dispatch()["updates"]["courier"]["id"]
+        env = reroute_agent.invoke({"reason": "risk", "current_courier": courier_id, "drop_location": DROP})
+        self.assertEqual(env["updates"]["reroute"]["new_courier_id"], "next")
+        # the original courier is free again, the backup is not
+        self.assertEqual(_dispatch()["updates"]["courier"]["id"], "near")
+        self.assertEqual(_dispatch()["updates"]["courier"]["id"], "far")
+
+
+if __name__ == "__main__":
+    unittest.main()
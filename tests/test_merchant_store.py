@@ -0,0 +1,77 @@
+import threading
+import unittest
+
+from scripts.merchant_store import MerchantEvent, MerchantStateStore
+from scripts.ttl_cache import TTLCache
+
+
+class _SlowSource:
+    """get_merchant blocks until released, so events can land mid-load."""
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.health = "OK"
+
+    def get_merchant(self, merchant_id):
+        record = {"health": self.health, "prep_eta_min": 5, "oos_items": []}
+        self.started.set()
+        self.release.wait(5)
+        return record
+
+
+def _load_while(store, source, event):
+    out = {}
+    reader = threading.Thread(target=lambda: out.setdefault("state", store.get("M1")))
+    reader.start()
+    source.started.wait(5)
+    source.health = "DEGRADED"
+    store.apply(event)
+    source.release.set()
+    reader.join(5)
+    return out["state"]
+
+
+class InFlightInvalidationTest(unittest.TestCase):
+    def test_invalidate_during_load_is_not_lost(self):
+        source = _SlowSource()
+        store = MerchantStateStore(source, ttl_s=300)
+        _load_while(store, source, MerchantEvent(type="invalidate", merchant_id="M1"))
+        self.assertEqual(store.get("M1").health, "DEGRADED")
+
+    def test_health_event_during_load_is_not_lost(self):
+        source = _SlowSource()
+        store = MerchantStateStore(source, ttl_s=300)
+        _load_while(store, source, MerchantEvent(type="health", merchant_id="M1", health="DEGRADED"))
+        self.assertEqual(store.get("M1").health, "DEGRADED")
+
+    def test_sold_out_after_load_patches_cache(self):
+        source = _SlowSource()
+        source.release.set()
+        store = MerchantStateStore(source, ttl_s=300)
+        store.get("M1")
+        self.assertTrue(store.apply(MerchantEvent(type="sold_out", merchant_id="M1", skus=["MILK"])))
+        self.assertEqual(store.check("M1", ["MILK", "BREAD"])[1], ["MILK"])
+
+    def test_unknown_event_type_is_rejected_cached_or_not(self):
+        source = _SlowSource()
+        source.release.set()
+        store = MerchantStateStore(source, ttl_s=300)
+        with self.assertRaises(ValueError):
+            store.apply(MerchantEvent(type="paused", merchant_id="M1"))
+        store.get("M1")
+        with self.assertRaises(ValueError):
+            store.apply(MerchantEvent(type="paused", merchant_id="M1"))
+        self.assertEqual(store.get("M1").health, "OK")
+
+    def test_cache_discards_load_invalidated_mid_flight(self):
+        cache = TTLCache(ttl_s=300)
+        cache.get("k", lambda: (cache.invalidate("k"), "old")[1])
+        self.assertIsNone(cache.peek("k"))
+        self.assertEqual(cache.stats()["discarded"], 1)
+        self.assertEqual(cache.get("k", lambda: "new"), "new")
+        self.assertEqual(cache.peek("k"), "new")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+import threading
+import unittest
+
+from scripts.metrics import Metrics
+
+
+class ShardRetirementTest(unittest.TestCase):
+    def test_exited_threads_keep_their_series(self):
+        metrics = Metrics()
+
+        def work():
+            metrics.inc("hits")
+            metrics.observe("lat", 1000)
+
+        for _ in range(10):
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        snap = metrics.snapshot()
+        self.assertEqual(snap["counters"]["hits"], 80)
+        self.assertEqual(snap["histograms"]["lat"]["count"], 80)
+
+    def test_reset_clears_retired(self):
+        metrics = Metrics()
+        t = threading.Thread(target=lambda: metrics.inc("hits"))
+        t.start()
+        t.join()
+        metrics.snapshot()
+        metrics.reset()
+        self.assertEqual(metrics.snapshot()["counters"], {})
+
+
+class DumpResetTest(unittest.TestCase):
+    def test_polling_while_recording_loses_nothing(self):
+        metrics, parent = Metrics(), Metrics()
+        per_thread, writers = 20_000, 4
+        start = threading.Barrier(writers + 1)
+
+        def work():
+            start.wait()
+            for i in range(per_thread):
+                metrics.inc("hits")
+                metrics.observe("lat", i)
+
+        threads = [threading.Thread(target=work) for _ in range(writers)]
+        for t in threads:
+            t.start()
+        start.wait()
+        while any(t.is_alive() for t in threads):
+            parent.absorb(metrics.dump(reset=True))
+        for t in threads:
+            t.join()
+        parent.absorb(metrics.dump(reset=True))
+
+        snap = parent.snapshot()
+        self.assertEqual(snap["counters"]["hits"], per_thread * writers)
+        self.assertEqual(snap["histograms"]["lat"]["count"], per_thread * writers)
+        self.assertEqual(metrics.snapshot()["counters"], {})
+
+    def test_reset_while_recording_keeps_later_samples(self):
+        metrics = Metrics()
+        recorded = threading.Event()
+        go_on = threading.Event()
+
+        def work():
+            metrics.inc("hits")
+            recorded.set()
+            go_on.wait()
+            metrics.inc("hits", n=2)
+
+        t = threading.Thread(target=work)
+        t.start()
+        recorded.wait()
+        metrics.reset()
+        go_on.set()
+        t.join()
+        self.assertEqual(metrics.snapshot()["counters"]["hits"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
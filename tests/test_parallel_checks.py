@@ -0,0 +1,37 @@
+import asyncio
+import unittest
+
+from scripts.async_flow import build_async_graph
+from scripts.benchmarks import SCENARIOS, scenario_state
+from scripts.langgraph_flow import build_graph
+
+# the checks node always runs breakdown, the sequential graph skips it after a weather reroute
+PER_RUN = ("audit", "_audit", "breakdown", "signals")
+
+
+def _decisions(order):
+    return {k: v for k, v in order.items() if k not in PER_RUN}
+
+
+class ParallelChecksTest(unittest.TestCase):
+    def test_same_decisions_as_the_sequential_graph(self):
+        sequential, parallel = build_graph(), build_graph(parallel_checks=True)
+        for name in SCENARIOS:
+            with self.subTest(scenario=name):
+                seq = sequential.invoke(scenario_state(name))["order_details"]
+                par = parallel.invoke(scenario_state(name))["order_details"]
+                self.assertEqual(_decisions(par), _decisions(seq))
+                self.assertLessEqual(seq["signals"].items(), par["signals"].items())
+
+    def test_async_graph_matches_sync(self):
+        sync_app, async_app = build_graph(parallel_checks=True), build_async_graph(parallel_checks=True)
+        for name in ("demo", "breakdown", "clear_weather"):
+            with self.subTest(scenario=name):
+                out = sync_app.invoke(scenario_state(name))["order_details"]
+                aout = asyncio.run(async_app.ainvoke(scenario_state(name)))["order_details"]
+                self.assertEqual(_decisions(aout), _decisions(out))
+                self.assertEqual(aout["breakdown"], out["breakdown"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import unittest
+
+from scripts.checkpoints import Checkpointer
+from scripts.langgraph_flow import build_graph, demo_order_state, is_parked, parallel_router, routes_of
+from scripts.spatial_index import set_courier_index
+from scripts.streaming import stream_order
+
+
+class ParallelParkingTest(unittest.TestCase):
+    def setUp(self):
+        set_courier_index(None)     # parked orders keep their courier busy
+        path = os.path.join(tempfile.mkdtemp(), "ck.db")
+        self.app = build_graph(parallel_checks=True, checkpointer=Checkpointer(path),
+                               awaits={"reroute": "reroute_ack"})
+        self.state = demo_order_state().model_dump()
+        self.state["order_details"]["order_id"] = "PARK-1"
+
+    def test_graph_records_its_router(self):
+        self.assertIs(routes_of(self.app), parallel_router)
+
+    def test_parked_after_checks(self):
+        out = self.app.invoke(self.state)
+        self.assertEqual(out["order_details"]["_phase"], "checks")
+        self.assertTrue(is_parked(out, app=self.app))
+        self.assertTrue(is_parked(out))
+
+    def test_stream_end_reports_parked(self):
+        end = list(stream_order(self.state, app=self.app))[-1]
+        self.assertEqual(end["type"], "end")
+        self.assertTrue(end["parked"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from scripts.payments import DuplicateChargeIndex, find_duplicate_charges, reconcile_settlement
+from scripts.tools import payment_agent
+
+
+class DuplicateChargeIndexTest(unittest.TestCase):
+    def test_second_order_with_same_key_is_still_tracked(self):
+        index = DuplicateChargeIndex(window_s=300)
+        seen = [index.observe(tx, "C1", "M1", 12.5, ts, order)
+                for tx, ts, order in [("a", 0, "A"), ("b1", 10, "B"), ("b2", 20, "B")]]
+        self.assertEqual(seen, [None, None, "b1"])
+
+    def test_settlement_counts_double_charge_on_second_order(self):
+        rows = [{"tx_id": tx, "order_id": order, "customer_id": "C1", "merchant_id": "M1", "amount": 12.5, "ts": ts}
+                for tx, ts, order in [("a", 0, "A"), ("b1", 10, "B"), ("b2", 20, "B")]]
+        report = reconcile_settlement(rows)
+        self.assertEqual(report.duplicates, 1)
+        self.assertEqual(report.refund_total, 12.5)
+
+    def test_settlement_nets_refunds_like_find_duplicate_charges(self):
+        ledger = [("a", 12.5, 0, "confirmed"), ("b", 12.5, 10, "confirmed"), ("c", 12.5, 20, "confirmed"),
+                  ("r", 12.5, 400, "refunded"), ("d", 7.0, 30, "confirmed"), ("e", 7.0, 40, "captured")]
+        for rows in (ledger, ledger[3:4] + ledger[:3] + ledger[4:]):   # refund after, then before
+            payment = {"customer_id": "C1", "merchant_id": "M1",
+                       "transactions": [{"id": tx, "amount": amt, "ts": ts, "status": st} for tx, amt, ts, st in rows]}
+            expected = find_duplicate_charges(payment)
+            refunds = []
+            report = reconcile_settlement(
+                [{"tx_id": tx, "order_id": "A", "customer_id": "C1", "merchant_id": "M1", "amount": amt, "ts": ts,
+                  "status": st} for tx, amt, ts, st in rows],
+                on_duplicate=refunds.append)
+            self.assertEqual(report.duplicates, len(expected))
+            self.assertEqual(report.netted, 1)
+            self.assertEqual(report.refund_total, sum(d["amount"] for d in expected))
+            self.assertEqual(sorted(r["amount"] for r in refunds), sorted(d["amount"] for d in expected))
+
+    def test_eviction_keeps_size_in_step(self):
+        index = DuplicateChargeIndex(window_s=10)
+        for i, order in enumerate(["A", "B", "C"]):
+            index.observe(f"t{i}", "C1", "M1", 5, i, order)
+        self.assertEqual(len(index), 3)
+        index.evict_before(100)
+        self.assertEqual(len(index), 0)
+
+
+class MissingAmountTest(unittest.TestCase):
+    PAYMENT = {"transactions": [{"id": "x"}, {"id": "y"}]}
+
+    def test_falls_back_to_order_total(self):
+        self.assertEqual(find_duplicate_charges(self.PAYMENT, order_total=249.0),
+                         [{"txn_id": "y", "duplicate_of": "x", "amount": 249.0}])
+
+    def test_agent_refunds_order_total(self):
+        out = payment_agent.invoke({"payment": self.PAYMENT, "order_total": 249.0, "user_prefs": {}})
+        self.assertEqual(out["updates"]["payment"]["status"], "REFUNDED")
+        self.assertEqual(out["updates"]["credits"]["wallet_delta"], 249.0)
+
+    def test_agent_does_not_claim_refund_without_amount(self):
+        out = payment_agent.invoke({"payment": self.PAYMENT, "order_total": 0.0, "user_prefs": {}})
+        payment = out["updates"]["payment"]
+        self.assertEqual(payment["status"], "NEEDS_REVIEW")
+        self.assertEqual(payment["unpriced_duplicates"], ["y"])
+        self.assertNotIn("credits", out["updates"])
+        self.assertFalse(out["signals"]["payment_fixed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+import os
+import tempfile
+import tracemalloc
+import unittest
+
+from scripts.batch_runner import run_orders
+from scripts.langgraph_flow import demo_order_state
+from scripts.profiling import Profiler, get_profiler
+
+
+class TraceLifecycleTest(unittest.TestCase):
+    def tearDown(self):
+        get_profiler().disable()
+
+    def test_failing_orders_release_their_traces(self):
+        profiler = get_profiler()
+        profiler.configure(mode="tracemalloc", every=1, out_dir=tempfile.mkdtemp())
+        states = []
+        for i in range(3):
+            st = demo_order_state().model_dump()
+            st["order_details"].update(order_id=f"E{i}", items="broken")
+            states.append(st)
+        self.assertEqual(run_orders(states).failed, 3)
+        self.assertFalse(tracemalloc.is_tracing())
+        self.assertTrue(all(r.get("aborted") for r in list(profiler.recent)[-3:]))
+
+    def test_runs_of_the_same_order_id_get_their_own_trace(self):
+        profiler = get_profiler()
+        profiler.configure(mode="segments", every=1, out_dir=tempfile.mkdtemp())
+        states = [demo_order_state().model_dump() for _ in range(4)]
+        self.assertEqual(run_orders(states, concurrency=4).succeeded, 4)
+        done = list(profiler.recent)[-4:]
+        self.assertEqual(len({r["seq"] for r in done}), 4)
+        for r in done:
+            self.assertFalse(r.get("aborted"))
+            self.assertTrue(os.path.exists(r["files"][0]))
+            # each trace saw exactly one run through the terminal node
+            self.assertEqual(sum(1 for path in r["segments_us"] if path == "audit;state_out"), 1)
+
+    def test_tracemalloc_stops_with_the_last_trace(self):
+        profiler = Profiler(mode="tracemalloc", every=1, out_dir=tempfile.mkdtemp())
+        profiler.configure(enabled=True)
+        first = profiler.trace_for({"order_id": "X"})
+        second = profiler.trace_for({"order_id": "X"})
+        profiler.finish(first)
+        self.assertTrue(tracemalloc.is_tracing())
+        profiler.finish(second)
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_stale_traces_are_evicted(self):
+        profiler = Profiler(mode="tracemalloc", every=1, out_dir=tempfile.mkdtemp(), stale_s=0)
+        profiler.trace_for({"order_id": "lost"})
+        profiler.trace_for({"order_id": "next"})
+        self.assertEqual([(r["order_id"], r.get("aborted")) for r in profiler.recent], [("lost", True)])
+        profiler.disable()
+        self.assertFalse(tracemalloc.is_tracing())
+
+    def test_reconfigure_stops_tracemalloc(self):
+        profiler = Profiler(mode="tracemalloc", every=1, out_dir=tempfile.mkdtemp())
+        profiler.trace_for({"order_id": "X"})
+        self.assertTrue(tracemalloc.is_tracing())
+        profiler.configure(mode="segments")
+        self.assertFalse(tracemalloc.is_tracing())
+
+
+if __name__ == "__main__":
+    unittest.main()
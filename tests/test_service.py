@@ -0,0 +1,63 @@
+import asyncio
+import json
+import unittest
+
+from scripts.langgraph_flow import demo_order_state
+from scripts.service import HttpServer, OrderService
+
+
+async def _post(port, path, payload):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    try:
+        body = json.dumps(payload).encode()
+        writer.write(f"POST {path} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
+        status = int((await reader.readline()).split()[1])
+        headers = {}
+        while (line := await reader.readline()) not in (b"\r\n", b""):
+            k, _, v = line.decode().partition(":")
+            headers[k.strip().lower()] = v.strip()
+        return status, headers, json.loads(await reader.readexactly(int(headers["content-length"])))
+    finally:
+        writer.close()
+
+
+def _order(order_id):
+    return dict(demo_order_state().model_dump()["order_details"], order_id=order_id)
+
+
+class AdmissionTest(unittest.TestCase):
+    def test_accepts_rejects_duplicates_and_sheds_when_full(self):
+        async def scenario():
+            service = OrderService(workers=1, queue_size=1)
+            server = await HttpServer(service).serve(port=0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                # no workers yet: the first order sits in the one-slot queue
+                status, _, body = await _post(port, "/orders", _order("Q1"))
+                self.assertEqual((status, body["status"]), (202, "queued"))
+                status, _, body = await _post(port, "/orders", _order("Q1"))
+                self.assertEqual(status, 409)
+                status, headers, body = await _post(port, "/orders", _order("Q2"))
+                self.assertEqual((status, body["error"]), (429, "queue full"))
+                self.assertEqual(headers["retry-after"], "1")
+                status, _, _ = await _post(port, "/orders", {"items": []})
+                self.assertEqual(status, 400)
+
+                service.start()
+                await service.jobs["Q1"].done.wait()
+                # a finished order may be submitted again, and ?wait=1 answers with the result
+                status, _, body = await _post(port, "/orders?wait=1", _order("Q1"))
+                self.assertEqual((status, body["status"]), (200, "done"))
+                self.assertEqual(body["order_details"]["_phase"], "audit")
+            finally:
+                server.close()
+                await server.wait_closed()
+                await service.stop()
+
+        asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
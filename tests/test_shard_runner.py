@@ -0,0 +1,80 @@
+import tempfile
+import threading
+import unittest
+
+from scripts.audit_store import AuditStore, get_audit_store, set_audit_store
+from scripts.batch_runner import run_orders
+from scripts.data_sources import InMemoryDataSource, get_data_source, set_data_source
+from scripts.langgraph_flow import demo_order_state
+from scripts.metrics import get_metrics
+from scripts.shard_runner import ShardedRunner, shard_of
+
+
+def _states(n):
+    states = []
+    for i in range(n):
+        st = demo_order_state().model_dump()
+        st["order_details"]["order_id"] = f"S{i}"
+        states.append(st)
+    return states
+
+
+def _mock_source():
+    set_data_source(InMemoryDataSource.from_mock())
+
+
+class ShardedRunnerTest(unittest.TestCase):
+    def test_shard_is_stable(self):
+        self.assertEqual(shard_of("order_1", 4), shard_of("order_1", 4))
+
+    def test_worker_metrics_reach_parent(self):
+        key = 'synapse_node_latency_seconds{phase="audit"}'
+        before = get_metrics().snapshot()["histograms"].get(key, {}).get("count", 0)
+        with ShardedRunner(workers=2, start_method="fork") as runner:
+            report = runner.run(_states(12))
+        self.assertEqual(report.succeeded, 12)
+        self.assertEqual(get_metrics().snapshot()["histograms"][key]["count"] - before, 12)
+
+    def test_default_start_method_runs_fresh_workers(self):
+        key = 'synapse_node_latency_seconds{phase="audit"}'
+        before = get_metrics().snapshot()["histograms"].get(key, {}).get("count", 0)
+        with ShardedRunner(workers=2) as runner:
+            report = runner.run(_states(6))
+        self.assertEqual(report.succeeded, 6)
+        self.assertEqual(get_metrics().snapshot()["histograms"][key]["count"] - before, 6)
+
+    def test_fork_pauses_audit_sync_and_resumes_it(self):
+        previous = get_audit_store()
+        with tempfile.TemporaryDirectory() as tmp:
+            store = AuditStore(tmp)
+            set_audit_store(store)
+            try:
+                run_orders(_states(2))
+                with ShardedRunner(workers=1, start_method="fork") as runner:
+                    self.assertNotIn("synapse-audit-sync", [t.name for t in threading.enumerate()])
+                    self.assertEqual(runner.run(_states(2)).succeeded, 2)
+                run_orders(_states(1))
+                self.assertIn("synapse-audit-sync", [t.name for t in threading.enumerate()])
+            finally:
+                set_audit_store(previous)
+
+    def test_spawn_refuses_replaced_source_without_initializer(self):
+        previous = set_data_source(InMemoryDataSource.from_mock())
+        try:
+            with self.assertRaises(ValueError):
+                ShardedRunner(workers=1, start_method="spawn").start()
+        finally:
+            set_data_source(previous)
+
+    def test_initializer_runs_in_workers(self):
+        previous = set_data_source(InMemoryDataSource.from_mock())
+        try:
+            with ShardedRunner(workers=1, start_method="fork", initializer=_mock_source) as runner:
+                self.assertEqual(runner.run(_states(2)).succeeded, 2)
+        finally:
+            set_data_source(previous)
+        self.assertIs(get_data_source(), previous)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,34 @@
+import random
+import unittest
+
+from scripts.geo import haversine_km
+from scripts.spatial_index import CourierSpatialIndex
+
+
+def _fleet(n, lat0, lng0, spread, seed=3):
+    rng = random.Random(seed)
+    return [(f"C{i}", {"location": (lat0 + rng.uniform(-spread, spread), lng0 + rng.uniform(-spread, spread)),
+                       "status": "available"}) for i in range(n)]
+
+
+class NearestTest(unittest.TestCase):
+    def test_matches_brute_force_at_high_latitude(self):
+        records = _fleet(3000, 69.6, 18.9, 2.0)
+        index = CourierSpatialIndex.from_records(records)
+        rng = random.Random(5)
+        for _ in range(50):
+            lat, lng = 69.6 + rng.uniform(-3, 3), 18.9 + rng.uniform(-3, 3)
+            brute = sorted((haversine_km(lat, lng, *rec["location"]), cid) for cid, rec in records)[:5]
+            got = index.nearest(lat, lng, k=5, max_radius_km=None)
+            self.assertEqual([cid for cid, _ in got], [cid for _, cid in brute])
+
+    def test_far_query_is_capped_by_default(self):
+        index = CourierSpatialIndex.from_records(_fleet(2000, 40.73, -73.99, 0.1))
+        self.assertEqual(index.nearest(45.0, -73.99), [])
+        hits = index.nearest(45.0, -73.99, max_radius_km=None)
+        self.assertEqual(len(hits), 1)
+        self.assertGreater(hits[0][1], 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from dataset.synthetic import SyntheticDataset, generate_dataset
+
+
+def _generate(path, **kwargs):
+    return generate_dataset(path, n_couriers=200, n_merchants=50, n_orders=3000, n_skus=100,
+                            double_charge_rate=0.1, **kwargs)
+
+
+class SyntheticDatasetTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        _generate(self.tmp.name, chunk_orders=700)
+        self.ds = SyntheticDataset(self.tmp.name)
+
+    def test_same_seed_same_columns(self):
+        with tempfile.TemporaryDirectory() as other:
+            _generate(other, chunk_orders=700)
+            again = SyntheticDataset(other)
+            for name in ("order_created_ts", "item_sku", "tx_amount", "courier_lat"):
+                np.testing.assert_array_equal(self.ds.col(name), again.col(name))
+
+    def test_chunks_fill_every_order(self):
+        ts = self.ds.col("order_created_ts")
+        self.assertTrue(np.all(np.diff(ts) >= 0))
+        self.assertTrue(np.all(ts > 0))
+        for i in (0, 699, 700, 2999):
+            order = self.ds.order_details(self.ds.order_id(i))
+            self.assertTrue(order["items"])
+            amounts = {tx["amount"] for tx in order["payment"]["transactions"]}
+            self.assertEqual(amounts, {order["order_total"]})
+
+    def test_transactions_stream_in_timestamp_order(self):
+        rows = list(self.ds.iter_transactions(chunk=500))
+        offsets = self.ds.col("order_tx_offsets")
+        self.assertEqual(len(rows), int(offsets[-1]))
+        self.assertEqual([r["ts"] for r in rows], sorted(r["ts"] for r in rows))
+        self.assertGreater(len(rows), self.ds.n_orders)      # some orders were double charged
+
+
+if __name__ == "__main__":
+    unittest.main()